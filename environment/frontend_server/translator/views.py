@@ -202,13 +202,25 @@ def replay_persona_state(request, sim_code, step, persona_name):
   with open(memory + "/associative_memory/nodes.json") as json_file:  
     associative = json.load(json_file)
 
+  # Nodes added since the last checkpoint of nodes.json are appended to
+  # nodes_log.jsonl by the backend; a torn last line is skipped.
+  if os.path.exists(memory + "/associative_memory/nodes_log.jsonl"):
+    with open(memory + "/associative_memory/nodes_log.jsonl") as log_file:
+      for line in log_file:
+        try:
+          node_details = json.loads(line)
+        except ValueError:
+          continue
+        associative[node_details["node_id"]] = node_details
+
   a_mem_event = []
   a_mem_chat = []
   a_mem_thought = []
 
-  for count in range(len(associative.keys()), 0, -1): 
-    node_id = f"node_{str(count)}"
-    node_details = associative[node_id]
+  # Archived nodes leave gaps in the node ids, so the nodes are ordered by 
+  # their node_count rather than counted. 
+  for node_details in sorted(associative.values(), 
+                             key=lambda x: x["node_count"], reverse=True): 
 
     if node_details["type"] == "event":
       a_mem_event += [node_details]
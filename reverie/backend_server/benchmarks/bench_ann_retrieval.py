@@ -0,0 +1,103 @@
+"""
+File: bench_ann_retrieval.py
+Description: Recall-versus-latency benchmark of the IVF approximate nearest
+neighbour index (persona/memory_structures/ann_index.py) against exact
+scoring in new_retrieve_batch.
+
+A synthetic associative memory is filled with clustered unit embeddings.
+Its focal points are perturbed copies of stored embeddings. For each
+n_probe setting we report the average latency of a batched retrieval and
+the recall of the returned top-k nodes, measured against exact scoring. Exact scoring is first checked against the
+original retrieval, and the index probing every list against exact scoring.
+
+Usage (from reverie/backend_server):
+  python benchmarks/bench_ann_retrieval.py [n_nodes] [dim]
+  (defaults: 50000 nodes, 1536 dimensions)
+"""
+import sys
+import datetime
+
+import numpy as np
+
+from bench_common import *
+
+
+def unit_rows(x):
+  return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+
+def build_memory(n_nodes, dim, rng):
+  a_mem, _ = empty_memory()
+
+  # Clustered data: every vector is a noisy copy of one of the centres
+  # (the noise has about half the length of a centre).
+  centres = unit_rows(rng.randn(max(1, n_nodes // 250), dim))
+  labels = rng.randint(0, centres.shape[0], n_nodes)
+  noise = 0.5 / np.sqrt(dim)
+  vectors = unit_rows(centres[labels] + noise * rng.randn(n_nodes, dim))
+
+  start = datetime.datetime(2023, 2, 13, 0, 0, 0)
+  for count in range(n_nodes):
+    created = start + datetime.timedelta(seconds=10 * count)
+    key = f"bench memory {count}"
+    a_mem.add_event(created, None, "bench", "remembers", str(count), key,
+                    {"bench"}, int(rng.randint(1, 11)),
+                    (key, vectors[count]), [])
+  return a_mem, vectors, created
+
+
+def run(persona, focal_points, n_count, n_repeat):
+  """
+  Returns (retrieved, seconds per call). Every call sees the same memory
+  (see kept_last_accessed).
+  """
+  elapsed = 0
+  for _ in range(n_repeat):
+    with kept_last_accessed(persona.a_mem):
+      retrieved, seconds = timed(retrieve.new_retrieve_batch, persona,
+                                 focal_points, n_count)
+    elapsed += seconds
+  return retrieved, elapsed / n_repeat
+
+
+if __name__ == '__main__':
+  n_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+  dim = int(sys.argv[2]) if len(sys.argv) > 2 else 1536
+  n_focal = 8
+  n_count = 30
+  retrieve.debug = False
+  # Cached relevance would hide the scoring being measured.
+  retrieve.retrieval_cache_enabled = False
+  rng = np.random.RandomState(0)
+
+  (a_mem, vectors, last_created), seconds = timed(build_memory, n_nodes, dim,
+                                                  rng)
+  print (f"built {n_nodes} nodes ({dim} dims) in {seconds:.1f}s")
+  persona = BenchPersona(a_mem, last_created + datetime.timedelta(hours=1))
+
+  rows = rng.randint(0, n_nodes, n_focal)
+  focal_points = intern_focal_points(
+    unit_rows(vectors[rows] + 0.5 / np.sqrt(dim) * rng.randn(n_focal, dim)))
+
+  exact, exact_time = run(persona, focal_points, n_count, 3)
+  print (f"exact: {1000 * exact_time:.1f} ms per retrieval of "
+         f"{n_focal} focal points")
+  check_retrieval(persona, focal_points, n_count, exact, "exact scoring")
+
+  ann_index = a_mem.enable_ann_index(min_rows=0)
+  _, seconds = timed(ann_index.update)
+  n_lists = ann_index.centroids.shape[0]
+  print (f"trained {n_lists} lists in {seconds:.1f}s")
+  ann_index.n_probe = n_lists
+  check(run(persona, focal_points, n_count, 1)[0] == exact,
+        "probing every list returns the exact nodes")
+
+  for n_probe in [1, 2, 4, 8, 16, 32, 64]:
+    if n_probe > n_lists:
+      break
+    ann_index.n_probe = n_probe
+    approx, approx_time = run(persona, focal_points, n_count, 3)
+    recall = np.mean([len(set(approx[f]) & set(exact[f])) / len(exact[f])
+                      for f in focal_points])
+    print (f"n_probe {n_probe:3d}: {1000 * approx_time:7.1f} ms "
+           f"({exact_time / approx_time:4.1f}x), recall@{n_count} {recall:.3f}")
@@ -0,0 +1,104 @@
+"""
+File: bench_common.py
+Description: Helpers shared by the benchmarks: the import paths, the stored
+simulations, an empty associative memory, a minimal persona, and the checks
+of an optimised result against the original implementation. The original
+retrieval and the memory comparison are the ones the tests use (see
+tests/memory_fixture.py).
+
+Every benchmark imports it first:
+  from bench_common import *
+"""
+import os
+import sys
+import time
+import tempfile
+import contextlib
+
+backend_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(backend_folder)
+sys.path.append(os.path.join(backend_folder, "tests"))
+
+import numpy as np
+
+from memory_fixture import make_memory, memory_state, baseline_retrieve
+from memory_fixture import FakePersona as BenchPersona
+from persona.memory_structures.embedding_store import embedding_store
+import persona.cognitive_modules.retrieve as retrieve
+
+storage_folder = os.path.join(backend_folder,
+                              "../../environment/frontend_server/storage")
+
+
+def personas_folder(sim_code):
+  return f"{storage_folder}/{sim_code}/personas"
+
+
+def empty_memory():
+  """
+  Returns an empty associative memory in a new temporary folder, and the
+  folder.
+  """
+  folder = tempfile.mkdtemp()
+  return make_memory(folder), folder
+
+
+def intern_focal_points(vectors, prefix="bench focal point"):
+  """
+  Registers <vectors> in the embedding store under new focal point strings,
+  so that retrieving them makes no embedding request, and returns the
+  strings.
+  """
+  focal_points = []
+  for count, vec in enumerate(vectors):
+    focal_pt = f"{prefix} {count}"
+    embedding_store.intern(focal_pt, vec)
+    focal_points += [focal_pt]
+  return focal_points
+
+
+@contextlib.contextmanager
+def kept_last_accessed(a_mem):
+  """
+  Restores the last_accessed of every node of <a_mem>, and the recency
+  index built from it, on leaving the block, so that runs compared with
+  each other all see the same memory.
+  """
+  accessed = a_mem.node_columns.last_accessed.copy()
+  try:
+    yield
+  finally:
+    a_mem.node_columns.last_accessed[:] = accessed
+    a_mem.recency_index.touch(a_mem.recency_index.nodes())
+
+
+def timed(func, *args, **kwargs):
+  """
+  Returns (the result of func(*args, **kwargs), seconds it took).
+  """
+  t = time.perf_counter()
+  result = func(*args, **kwargs)
+  return result, time.perf_counter() - t
+
+
+def check(condition, message):
+  """
+  Stops the benchmark if <condition> does not hold: the numbers of an
+  optimisation that changes its results are meaningless.
+  """
+  if not condition:
+    raise AssertionError(f"check failed: {message}")
+  print (f"check: {message}")
+
+
+def check_retrieval(persona, focal_points, n_count, retrieved, label):
+  """
+  Checks that <retrieved>, the nodes retrieved for <focal_points> by the
+  retrieval under test, are the nodes that the original new_retrieve
+  returns from the same memory.
+  """
+  with kept_last_accessed(persona.a_mem):
+    expected = baseline_retrieve(persona, focal_points, n_count)
+  check(all([i.node_id for i in retrieved[f]]
+            == [i.node_id for i in expected[f]] for f in focal_points),
+        f"{label}: same nodes as the original retrieval")
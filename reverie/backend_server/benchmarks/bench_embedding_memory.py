@@ -0,0 +1,98 @@
+"""
+File: bench_embedding_memory.py
+Description: Measures the memory taken by the embeddings of a stored
+simulation's personas. Each vector is held once in the shared embedding
+store (AssociativeMemory.embeddings refers to it), and once more per
+persona as a normalized row of that persona's EmbeddingMatrix.
+
+The bytes are counted from the objects themselves: a vector held as a list
+takes the list and one float object per dimension; a numpy vector takes its
+buffer, unless it is a view of a memory-mapped file (binary format), which
+takes no memory of its own.
+
+Before counting, the vectors held by each memory and its matrix rows are
+checked against the vectors in the persona's embeddings.json.
+
+Usage (from reverie/backend_server):
+  python benchmarks/bench_embedding_memory.py [sim_code]
+  (default: July1_the_ville_isabella_maria_klaus-step-3-8)
+"""
+import os
+import sys
+import json
+
+import numpy as np
+
+from bench_common import *
+from persona.memory_structures.associative_memory import AssociativeMemory
+from persona.memory_structures.embedding_matrix import normalize_embedding
+
+
+def vector_bytes(vec):
+  if isinstance(vec, list):
+    return sys.getsizeof(vec) + sum(sys.getsizeof(i) for i in vec)
+  if isinstance(vec, np.ndarray):
+    if isinstance(vec.base, np.memmap) or isinstance(vec, np.memmap):
+      return 0
+    return vec.nbytes
+  # QuantizedRow: a memory-mapped row and its scale.
+  return 0
+
+
+if __name__ == '__main__':
+  sim_code = (sys.argv[1] if len(sys.argv) > 1
+              else "July1_the_ville_isabella_maria_klaus-step-3-8")
+  folder = personas_folder(sim_code)
+  names = sorted(os.listdir(folder))
+  f_a_mems = [f"{folder}/{name}/bootstrap_memory/associative_memory"
+              for name in names]
+  a_mems = [AssociativeMemory(f_a_mem) for f_a_mem in f_a_mems]
+  for a_mem in a_mems:
+    a_mem.embedding_matrix.fill()
+
+  # A text embedded by several personas is stored once, with the vector of
+  # the first persona loaded; the others' vectors for it may differ
+  # slightly (the embedding API is not deterministic).
+  n_shared = 0
+  for name, f_a_mem, a_mem in zip(names, f_a_mems, a_mems):
+    if not os.path.exists(f"{f_a_mem}/embeddings.json"):
+      continue
+    with open(f"{f_a_mem}/embeddings.json") as f:
+      embeddings_load = json.load(f)
+    rows = {node.embedding_key: a_mem.node_to_row[node_id]
+            for node_id, node in a_mem.id_to_node.items()
+            if node_id in a_mem.node_to_row}
+    similarity = {key: float(normalize_embedding(a_mem.embeddings[key])
+                             @ normalize_embedding(vec))
+                  for key, vec in embeddings_load.items()
+                  if key in a_mem.embeddings}
+    n_shared += sum(not np.allclose(a_mem.embeddings[key], vec, atol=1e-6)
+                    for key, vec in embeddings_load.items())
+    check(sorted(a_mem.embeddings) == sorted(embeddings_load)
+          and min(similarity.values(), default=1) > 1 - 1e-5
+          and all(np.allclose(a_mem.embedding_matrix.take([row])[0],
+                              normalize_embedding(a_mem.embeddings[key]),
+                              atol=1e-6)
+                  for key, row in rows.items()),
+          f"{name}: the vectors of embeddings.json and their matrix rows")
+  print (f"{n_shared} vectors taken from another persona's embedding of the "
+         f"same text")
+
+  n_keys = sum(len(a_mem.embeddings) for a_mem in a_mems)
+  vectors = list(embedding_store.vectors.values())
+  store_bytes = sum(vector_bytes(i) for i in vectors)
+  n_rows = sum(a_mem.embedding_matrix.n_rows for a_mem in a_mems)
+  matrix_bytes = sum(a_mem.embedding_matrix.nbytes() for a_mem in a_mems)
+  allocated_bytes = sum(a_mem.embedding_matrix.rows.nbytes for a_mem in a_mems
+                        if a_mem.embedding_matrix.rows is not None)
+
+  print (f"{len(names)} personas: {n_keys} embedding keys, "
+         f"{len(vectors)} distinct vectors in the store, {n_rows} matrix rows")
+  print (f"store vectors:    {store_bytes / 2**20:7.2f} MB "
+         f"({store_bytes / max(1, len(vectors)) / 1024:.1f} KB per vector, "
+         f"{type(vectors[0]).__name__})")
+  print (f"matrix rows:      {matrix_bytes / 2**20:7.2f} MB "
+         f"({matrix_bytes / max(1, n_rows) / 1024:.1f} KB per row; "
+         f"{allocated_bytes / 2**20:.2f} MB allocated)")
+  print (f"the matrix rows add {matrix_bytes / max(1, store_bytes):.0%} "
+         f"to the store vectors")
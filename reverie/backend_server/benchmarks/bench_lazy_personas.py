@@ -0,0 +1,89 @@
+"""
+File: bench_lazy_personas.py
+Description: Compares the startup time and memory of loading every persona
+of a simulation eagerly and in the lazy loading mode
+(lazy_persona_loading in persona/persona.py), and the cost of loading and
+unloading one associative memory on demand.
+
+The personas of base_the_ville_n25 are copied to a temporary folder and each
+one is given a synthetic memory (see bench_persona_load.py). The memory
+loaded on demand is checked against the one loaded eagerly.
+
+Usage (from reverie/backend_server):
+  python benchmarks/bench_lazy_personas.py [nodes_per_persona] [dim]
+  (defaults: 500 nodes, 1536 dimensions)
+"""
+import os
+import sys
+import shutil
+import tempfile
+
+import numpy as np
+
+from bench_common import *
+from persona.persona import Persona
+import persona.persona as persona_module
+from bench_persona_load import fill_memory, load_all
+
+
+def resident_bytes():
+  # Linux only.
+  with open("/proc/self/statm") as f:
+    return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def measured_load(folder, names):
+  """
+  Returns (seconds, resident bytes added, personas) of loading <names>.
+  """
+  n_bytes = resident_bytes()
+  elapsed, personas = load_all(folder, names)
+  return elapsed, resident_bytes() - n_bytes, personas
+
+
+if __name__ == '__main__':
+  n_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+  dim = int(sys.argv[2]) if len(sys.argv) > 2 else 1536
+  rng = np.random.RandomState(0)
+
+  folder = tempfile.mkdtemp() + "/personas"
+  shutil.copytree(personas_folder("base_the_ville_n25"), folder)
+  names = sorted(os.listdir(folder))
+  for name in names:
+    persona = Persona(name, f"{folder}/{name}")
+    fill_memory(persona, n_nodes, dim, rng)
+    persona.save(f"{folder}/{name}/bootstrap_memory")
+  # The embeddings of the personas built above are dropped from the shared 
+  # store so that the loads below start from an empty process.
+  del persona
+  embedding_store.clear()
+
+  # The lazy mode is measured first so that the memory freed by the eager
+  # load does not hide its growth.
+  for lazy in [True, False]:
+    persona_module.lazy_persona_loading = lazy
+    elapsed, n_bytes, loaded = measured_load(folder, names)
+    print (f"{'lazy' if lazy else 'eager'} startup: {elapsed:.2f}s, "
+           f"+{n_bytes / 2**20:.1f} MB resident")
+    if lazy:
+      personas = loaded
+    else:
+      eager_state = memory_state(loaded[0].a_mem)
+    del loaded
+
+  # One persona's associative memory used and unloaded again after it has
+  # been idle for persona_unload_idle.
+  persona_module.lazy_persona_loading = True
+  persona = personas[0]
+  a_mem, seconds = timed(lambda: persona.a_mem)
+  print (f"loading one associative memory: {seconds:.3f}s")
+  check(memory_state(a_mem) == eager_state,
+        "the memory loaded on demand is the one loaded eagerly")
+  del a_mem
+  _, seconds = timed(persona.unload_if_idle,
+                     persona.scratch.curr_time
+                     + persona_module.persona_unload_idle)
+  print (f"unloading it: {seconds:.3f}s")
+  check(memory_state(persona.a_mem) == eager_state,
+        "the memory loaded again after unloading is the same")
+  shutil.rmtree(os.path.dirname(folder))
@@ -0,0 +1,104 @@
+"""
+File: bench_memory_archive.py
+Description: Simulates a multi-week run of one associative memory and shows
+how the in-memory working set and retrieval latency grow with and without
+archiving (persona/memory_structures/memory_archive.py).
+
+Every simulated hour adds a few events and one thought that expires after
+30 days, and then calls archive_memories(). Three settings are compared:
+no archiving, archiving of expired nodes only (memory_archive_enabled), and
+additionally archiving low-poignancy nodes that were not accessed for a
+week.
+
+Usage (from reverie/backend_server):
+  python benchmarks/bench_memory_archive.py [days] [events_per_hour] [dim]
+  (defaults: 90 days, 4 events per hour, 1536 dimensions)
+"""
+import os
+import sys
+import time
+import datetime
+
+import numpy as np
+
+from bench_common import *
+import persona.memory_structures.associative_memory as associative_memory
+
+
+def simulate(days, events_per_hour, dim, focal_points):
+  """
+  Returns a list of (day, hot nodes, matrix bytes, ms per retrieval), and
+  the memory.
+  """
+  rng = np.random.RandomState(0)
+  a_mem, folder = empty_memory()
+  # The binary format only appends new embeddings on save.
+  a_mem.embedding_format = "binary"
+  start = datetime.datetime(2023, 2, 13, 0, 0, 0)
+  persona = BenchPersona(a_mem, start)
+  rows = []
+  for hour in range(days * 24):
+    curr_time = start + datetime.timedelta(hours=hour)
+    persona.scratch.curr_time = curr_time
+    a_mem.archive_memories(curr_time)
+    for count in range(events_per_hour):
+      key = f"bench event {hour} {count}"
+      a_mem.add_event(curr_time, None, "bench", "sees", key, key,
+                      {"bench", f"hour {hour % 24}"},
+                      int(rng.randint(1, 11)),
+                      (key, rng.randn(dim).astype(np.float32)), [])
+    key = f"bench thought {hour}"
+    a_mem.add_thought(curr_time, curr_time + datetime.timedelta(days=30),
+                      "bench", "thinks", key, key, {"bench"},
+                      int(rng.randint(1, 11)),
+                      (key, rng.randn(dim).astype(np.float32)), [])
+
+    if hour % 24 == 23:
+      # Archived nodes and their embeddings are written to disk on save.
+      a_mem.save(folder)
+      if hour == days * 24 - 1:
+        with kept_last_accessed(a_mem):
+          retrieved = retrieve.new_retrieve(persona, focal_points, 30)
+        check_retrieval(persona, focal_points, 30, retrieved,
+                        f"day {days}, {len(a_mem.id_to_node)} hot nodes")
+      _, elapsed = timed(retrieve.new_retrieve, persona, focal_points, 30)
+      rows += [(hour // 24 + 1, len(a_mem.id_to_node),
+                a_mem.embedding_matrix.nbytes(), 1000 * elapsed)]
+  return rows, a_mem
+
+
+if __name__ == '__main__':
+  days = int(sys.argv[1]) if len(sys.argv) > 1 else 90
+  events_per_hour = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+  dim = int(sys.argv[3]) if len(sys.argv) > 3 else 1536
+  retrieve.debug = False
+  retrieve.retrieval_cache_enabled = False
+
+  rng = np.random.RandomState(1)
+  focal_points = intern_focal_points(rng.randn(4, dim).astype(np.float32))
+
+  settings = [("no archiving", False, None),
+              ("expired nodes", True, None),
+              ("expired + low poignancy", True, 3)]
+  results = dict()
+  for name, enabled, max_poignancy in settings:
+    associative_memory.memory_archive_enabled = enabled
+    associative_memory.archive_max_poignancy = max_poignancy
+    (results[name], a_mem), seconds = timed(simulate, days, events_per_hour,
+                                            dim, focal_points)
+    print (f"{name}: simulated {days} days in {seconds:.1f}s")
+    # Archiving moves nodes out of memory; none may be lost.
+    check(set(a_mem.id_to_node) | set(a_mem.archive.id_to_key)
+          == set(f"node_{i}" for i in range(1, a_mem.n_nodes + 1))
+          and not set(a_mem.id_to_node) & set(a_mem.archive.id_to_key),
+          f"{name}: every node is either in memory or archived")
+
+  print (f"\n{'day':>4s}" + "".join(f" | {name:>34s}" for name, _, _ in settings))
+  print (f"{'':>4s}" + " | {:>10s} {:>10s} {:>12s}".format(
+           "hot nodes", "matrix MB", "ms/retrieve") * len(settings))
+  for count in range(0, days, 10) if days > 10 else range(days):
+    line = f"{results[settings[0][0]][count][0]:4d}"
+    for name, _, _ in settings:
+      day, n_hot, n_bytes, ms = results[name][count]
+      line += f" | {n_hot:10d} {n_bytes / 2**20:10.1f} {ms:12.1f}"
+    print (line)
@@ -0,0 +1,144 @@
+"""
+File: bench_node_memory.py
+Description: Compares the memory held per associative memory node by the
+original dict-based ConceptNode and by the slotted, column-backed
+ConceptNode.
+
+For every persona of the simulation, the nodes.json file is parsed and
+turned into nodes with both representations. We measure (with tracemalloc)
+what stays allocated once the parsed json is released, after checking
+that both give the same field values.
+
+Usage (from reverie/backend_server):
+  python benchmarks/bench_node_memory.py [sim_code]
+  (default sim_code: July1_the_ville_isabella_maria_klaus-step-3-20)
+"""
+import os
+import sys
+import gc
+import json
+import datetime
+import tracemalloc
+
+from bench_common import *
+from persona.memory_structures.associative_memory import ConceptNode
+from persona.memory_structures.node_columns import NodeColumns
+
+node_fields = ["node_id", "node_count", "type_count", "type", "depth",
+               "created", "expiration", "last_accessed", "subject",
+               "predicate", "object", "description", "embedding_key",
+               "poignancy", "keywords", "filling"]
+
+
+class LegacyConceptNode:
+  """
+  The ConceptNode layout before the columnar store: every field is a
+  regular instance attribute.
+  """
+  def __init__(self,
+               node_id, node_count, type_count, node_type, depth,
+               created, expiration,
+               s, p, o,
+               description, embedding_key, poignancy, keywords, filling):
+    self.node_id = node_id
+    self.node_count = node_count
+    self.type_count = type_count
+    self.type = node_type
+    self.depth = depth
+
+    self.created = created
+    self.expiration = expiration
+    self.last_accessed = self.created
+
+    self.subject = s
+    self.predicate = p
+    self.object = o
+
+    self.description = description
+    self.embedding_key = embedding_key
+    self.poignancy = poignancy
+    self.keywords = keywords
+    self.filling = filling
+
+
+def build_nodes(nodes_file, make_node):
+  nodes_load = json.load(open(nodes_file))
+  nodes = []
+  for count in range(len(nodes_load.keys())):
+    node_id = f"node_{str(count+1)}"
+    d = nodes_load[node_id]
+    created = datetime.datetime.strptime(d["created"], '%Y-%m-%d %H:%M:%S')
+    expiration = None
+    if d["expiration"]:
+      expiration = datetime.datetime.strptime(d["expiration"],
+                                              '%Y-%m-%d %H:%M:%S')
+    nodes += [make_node(node_id, d["node_count"], d["type_count"],
+                        d["type"], d["depth"], created, expiration,
+                        d["subject"], d["predicate"], d["object"],
+                        d["description"], d["embedding_key"],
+                        d["poignancy"], set(d["keywords"]), d["filling"])]
+  return nodes
+
+
+def legacy_node_factory():
+  return LegacyConceptNode
+
+
+def compact_node_factory():
+  # The column store is shared by all the nodes of a memory.
+  columns = NodeColumns()
+  def make_node(*args):
+    return ConceptNode(*args, columns=columns)
+  return make_node
+
+
+def measure(nodes_file, node_factory):
+  """
+  Returns (number of nodes, bytes still allocated by the nodes).
+  """
+  gc.collect()
+  tracemalloc.start()
+  before = tracemalloc.get_traced_memory()[0]
+  nodes = build_nodes(nodes_file, node_factory())
+  gc.collect()
+  after = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+  return len(nodes), after - before
+
+
+if __name__ == '__main__':
+  sim_code = "July1_the_ville_isabella_maria_klaus-step-3-20"
+  if len(sys.argv) > 1:
+    sim_code = sys.argv[1]
+  folder = personas_folder(sim_code)
+
+  total = {"nodes": 0, "legacy": 0, "compact": 0}
+  for persona_name in sorted(os.listdir(folder)):
+    nodes_file = (f"{folder}/{persona_name}"
+                  + "/bootstrap_memory/associative_memory/nodes.json")
+    if not os.path.exists(nodes_file):
+      continue
+
+    legacy_nodes = build_nodes(nodes_file, legacy_node_factory())
+    compact_nodes = build_nodes(nodes_file, compact_node_factory())
+    check([[getattr(i, field) for field in node_fields] for i in legacy_nodes]
+          == [[getattr(i, field) for field in node_fields]
+              for i in compact_nodes],
+          f"{persona_name}: the same fields for all {len(legacy_nodes)} nodes")
+    del legacy_nodes, compact_nodes
+
+    n, legacy = measure(nodes_file, legacy_node_factory)
+    n, compact = measure(nodes_file, compact_node_factory)
+
+    total["nodes"] += n
+    total["legacy"] += legacy
+    total["compact"] += compact
+    if n:
+      print (f"{persona_name}: {n} nodes, "
+             f"legacy {legacy/n:.0f} B/node, compact {compact/n:.0f} B/node")
+
+  if total["nodes"]:
+    legacy = total["legacy"] / total["nodes"]
+    compact = total["compact"] / total["nodes"]
+    print (f"all: {total['nodes']} nodes, legacy {legacy:.0f} B/node, "
+           f"compact {compact:.0f} B/node ({100 * (1 - compact/legacy):.1f}% less)")
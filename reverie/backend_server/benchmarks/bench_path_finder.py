@@ -0,0 +1,132 @@
+"""
+File: bench_path_finder.py
+Description: Compares path_finder_v2 with the breadth-first search over the
+compiled collision grid (path_finder_bfs in path_finder.py) on the_ville.
+
+Random pairs of walkable tiles are searched with both. The paths must be
+identical wherever path_finder_v2 finds one; it gives up on paths longer
+than 151 steps (and on unreachable tiles), and those pairs are counted
+separately.
+
+It then compares, for random (tile, address) pairs, execute()'s search to up
+to four sampled tiles of the address with walking down the address's cached
+distance field (Maze.address_path), and one search per sampled tile with a
+single search for the nearest of them (Maze.path_to_nearest). The field
+must lead to the nearest tile of the whole address, and the single search
+to the nearest sampled tile.
+
+Usage (from reverie/backend_server):
+  python benchmarks/bench_path_finder.py [pairs]
+  (default: 200 pairs)
+"""
+import sys
+import random
+
+from bench_common import *
+from maze import Maze
+import maze as maze_module
+from path_finder import *
+from utils import collision_block_id
+
+
+if __name__ == '__main__':
+  n_pairs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+  maze, seconds = timed(Maze, "the_ville")
+  print (f"loading the_ville (including the collision grid): {seconds:.2f}s")
+  grid, seconds = timed(CollisionGrid, maze.collision_maze, collision_block_id)
+  print (f"compiling the collision grid: {1000 * seconds:.1f}ms")
+
+  rng = random.Random(0)
+  walkable = [(row, col) for row in range(grid.height)
+              for col in range(grid.width) if not grid.blocked[row][col]]
+  pairs = [(rng.choice(walkable), rng.choice(walkable)) for _ in range(n_pairs)]
+
+  v2_time = 0
+  bfs_time = 0
+  n_identical = 0
+  n_v2_gave_up = 0
+  n_unreachable = 0
+  n_different = 0
+  for start, end in pairs:
+    v2_path, seconds = timed(path_finder_v2, maze.collision_maze, start, end,
+                             collision_block_id)
+    v2_time += seconds
+    bfs_path, seconds = timed(path_finder_bfs, grid, start, end)
+    bfs_time += seconds
+
+    if v2_path == [end] and start != end:
+      if bfs_path == [end]:
+        n_unreachable += 1
+      else:
+        n_v2_gave_up += 1
+    elif v2_path == bfs_path:
+      n_identical += 1
+    else:
+      n_different += 1
+
+  print (f"{n_pairs} pairs: {n_identical} identical paths, "
+         f"{n_v2_gave_up} longer than path_finder_v2's limit, "
+         f"{n_unreachable} unreachable")
+  check(n_different == 0,
+        "path_finder_bfs finds path_finder_v2's path wherever it finds one")
+  print (f"path_finder_v2:  {1000 * v2_time / n_pairs:8.2f}ms per path")
+  print (f"path_finder_bfs: {1000 * bfs_time / n_pairs:8.2f}ms per path "
+         f"({v2_time / bfs_time:.0f}x faster)")
+
+  # Addresses: the tiles are in (x, y) form here. Every field is kept, so
+  # that the second pass only measures walking down the cached fields.
+  addresses = sorted(maze.address_tiles)
+  maze_module.address_field_cache_size = len(addresses)
+  queries = [(rng.choice(walkable)[::-1], rng.choice(addresses))
+             for _ in range(n_pairs)]
+  samples = []
+  for tile, address in queries:
+    target_tiles = list(maze.address_tiles[address])
+    samples += [(tile, rng.sample(target_tiles, min(4, len(target_tiles))))]
+
+  def sampled_paths():
+    # execute() before the distance fields: one search per sampled tile.
+    return [[path_finder(grid, tile, target_tile, collision_block_id)
+             for target_tile in target_tiles]
+            for tile, target_tiles in samples]
+
+  per_target, sample_time = timed(sampled_paths)
+  _, cold_time = timed(lambda: [maze.address_path(tile, address)
+                                for tile, address in queries])
+  field_paths, warm_time = timed(lambda: [maze.address_path(tile, address)
+                                          for tile, address in queries])
+  print (f"\n{n_pairs} (tile, address) queries over {len(addresses)} addresses")
+  print (f"up to 4 sampled targets: {1000 * sample_time / n_pairs:8.2f}ms "
+         f"per query")
+  print (f"distance field (cold):   {1000 * cold_time / n_pairs:8.2f}ms "
+         f"per query")
+  print (f"distance field (cached): {1000 * warm_time / n_pairs:8.2f}ms "
+         f"per query")
+
+  # path_finder() returns [end] for an unreachable end.
+  def length(path, tile):
+    if not path or (len(path) == 1 and path[0] != tile):
+      return None
+    return len(path)
+
+  nearest = [path_finder_multi(grid, tile[::-1],
+                               [i[::-1] for i in maze.address_tiles[address]])
+             for tile, address in queries]
+  check(all(length(field_path, tile) == length(path, tile[::-1])
+            for field_path, (_, path), (tile, _)
+            in zip(field_paths, nearest, queries)),
+        "the distance field leads to the nearest tile of the address")
+
+  nearest_paths, nearest_time = timed(
+    lambda: [maze.path_to_nearest(tile, target_tiles)[1]
+             for tile, target_tiles in samples])
+  print (f"one search per target:   {1000 * sample_time / n_pairs:8.2f}ms "
+         f"per query")
+  print (f"one multi-goal search:   {1000 * nearest_time / n_pairs:8.2f}ms "
+         f"per query")
+  check(all(length(path, tile)
+            == min([length(i, tile) for i in paths
+                    if length(i, tile) is not None], default=None)
+            for path, paths, (tile, _)
+            in zip(nearest_paths, per_target, samples)),
+        "the multi-goal search reaches the nearest sampled tile")
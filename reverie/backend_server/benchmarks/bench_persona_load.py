@@ -0,0 +1,96 @@
+"""
+File: bench_persona_load.py
+Description: Compares the time to load every persona of a simulation from
+its JSON files and from the binary snapshots (persona/persona_snapshot.py).
+
+The personas of base_the_ville_n25 are copied to a temporary folder and each
+one is given a synthetic late-simulation memory, so that the load times are
+representative of a long run. The personas loaded from the snapshots are
+checked against the ones loaded from JSON.
+
+Usage (from reverie/backend_server):
+  python benchmarks/bench_persona_load.py [nodes_per_persona] [dim]
+  (defaults: 2000 nodes, 1536 dimensions)
+"""
+import os
+import sys
+import shutil
+import datetime
+import tempfile
+
+import numpy as np
+
+from bench_common import *
+from persona.persona import Persona
+import persona.persona_snapshot as persona_snapshot
+
+
+def fill_memory(persona, n_nodes, dim, rng):
+  start = datetime.datetime(2023, 2, 13, 0, 0, 0)
+  for count in range(n_nodes):
+    created = start + datetime.timedelta(minutes=count)
+    key = f"{persona.name} memory {count}"
+    if count % 10 == 9:
+      persona.a_mem.add_thought(created,
+                                created + datetime.timedelta(days=30),
+                                persona.name, "thinks", str(count), key,
+                                {persona.name, f"topic {count % 50}"},
+                                int(rng.randint(1, 11)),
+                                (key, rng.randn(dim).astype(np.float32)), [])
+    else:
+      persona.a_mem.add_event(created, None, persona.name, "sees", str(count),
+                              key, {persona.name, f"topic {count % 50}"},
+                              int(rng.randint(1, 11)),
+                              (key, rng.randn(dim).astype(np.float32)), [])
+  persona.scratch.curr_time = created
+  persona.scratch.act_start_time = created
+
+
+def load_all(folder, names):
+  personas, seconds = timed(lambda: [Persona(name, f"{folder}/{name}")
+                                     for name in names])
+  return seconds, personas
+
+
+def persona_state(persona):
+  """
+  The memories of <persona>, for comparing two loads of it.
+  """
+  return (memory_state(persona.a_mem), persona.s_mem.tree,
+          vars(persona.scratch))
+
+
+if __name__ == '__main__':
+  n_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+  dim = int(sys.argv[2]) if len(sys.argv) > 2 else 1536
+  rng = np.random.RandomState(0)
+
+  folder = tempfile.mkdtemp() + "/personas"
+  shutil.copytree(personas_folder("base_the_ville_n25"), folder)
+  names = sorted(os.listdir(folder))
+
+  persona_snapshot.persona_snapshot_enabled = False
+  t = time.perf_counter()
+  for name in names:
+    persona = Persona(name, f"{folder}/{name}")
+    fill_memory(persona, n_nodes, dim, rng)
+    persona.save(f"{folder}/{name}/bootstrap_memory")
+  print (f"built {len(names)} personas with {n_nodes} nodes each in "
+         f"{time.perf_counter() - t:.1f}s")
+
+  json_time, personas = load_all(folder, names)
+  print (f"JSON load:     {json_time:.2f}s")
+
+  persona_snapshot.persona_snapshot_enabled = True
+  _, seconds = timed(lambda: [persona.save(f"{folder}/{persona.name}"
+                                           f"/bootstrap_memory")
+                              for persona in personas])
+  print (f"saving with snapshots: {seconds:.2f}s")
+
+  snapshot_time, snapshot_personas = load_all(folder, names)
+  print (f"snapshot load: {snapshot_time:.2f}s "
+         f"({json_time / snapshot_time:.1f}x faster)")
+  check([persona_state(i) for i in snapshot_personas]
+        == [persona_state(i) for i in personas],
+        "the snapshots load the same personas as the JSON files")
+  shutil.rmtree(os.path.dirname(folder))
@@ -0,0 +1,115 @@
+"""
+File: bench_quantized_retrieval.py
+Description: Measures how much the top-k results of new_retrieve change when
+the persona's embedding matrix is held in float16 or per-row int8 instead
+of float32, and how many bytes each option takes per embedding.
+
+The personas of a stored simulation are loaded with their real embeddings.
+The focal points of each persona are the memories of the other personas,
+so their embeddings are already in the embedding store and no embedding
+request is made.
+
+Usage (from reverie/backend_server):
+  python benchmarks/bench_quantized_retrieval.py [sim_code] [n_count]
+  (defaults: July1_the_ville_isabella_maria_klaus-step-3-8, 30)
+"""
+import os
+import sys
+import datetime
+
+import numpy as np
+
+from bench_common import *
+from persona.memory_structures.associative_memory import AssociativeMemory
+from persona.memory_structures.embedding_matrix import normalize_embedding
+
+
+def run(persona, focal_points, n_count):
+  """
+  Retrieves every focal point on its own, from the same memory (see
+  kept_last_accessed), so that the results of one focal point do not
+  change the recency of the next.
+  """
+  retrieved = dict()
+  for focal_pt in focal_points:
+    with kept_last_accessed(persona.a_mem):
+      retrieved.update(retrieve.new_retrieve_batch(persona, [focal_pt],
+                                                   n_count))
+  return retrieved
+
+
+if __name__ == '__main__':
+  sim_code = "July1_the_ville_isabella_maria_klaus-step-3-8"
+  if len(sys.argv) > 1:
+    sim_code = sys.argv[1]
+  n_count = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+  retrieve.debug = False
+  # Cached relevance would hide the differences being measured.
+  retrieve.retrieval_cache_enabled = False
+  folder = personas_folder(sim_code)
+
+  a_mems = dict()
+  for persona_name in sorted(os.listdir(folder)):
+    f_a_mem = f"{folder}/{persona_name}/bootstrap_memory/associative_memory"
+    if os.path.exists(f"{f_a_mem}/nodes.json"):
+      a_mems[persona_name] = AssociativeMemory(f_a_mem)
+
+  rng = np.random.RandomState(0)
+  results = {dtype: {"bytes": [], "overlap": [], "identical": [], "error": []}
+             for dtype in ["float32", "float16", "int8"]}
+  # Whether float32 returned the nodes of the original retrieval.
+  original_identical = []
+  for persona_name, a_mem in a_mems.items():
+    nodes = a_mem.seq_event + a_mem.seq_thought
+    if not nodes:
+      continue
+    curr_time = max(i.created for i in nodes) + datetime.timedelta(hours=1)
+    persona = BenchPersona(a_mem, curr_time)
+
+    focal_vectors = dict()
+    for name, other in a_mems.items():
+      if name != persona_name:
+        focal_vectors.update(other.embeddings)
+    focal_points = sorted(focal_vectors)
+    focal_points = [focal_points[i] for i in
+                    rng.choice(len(focal_points), min(20, len(focal_points)),
+                               replace=False)]
+    focal_matrix = np.stack([normalize_embedding(focal_vectors[f])
+                             for f in focal_points], axis=1)
+
+    full_matrix = a_mem.embedding_matrix
+    rows = np.arange(full_matrix.n_rows)
+    full_sims = full_matrix.dot(rows, focal_matrix)
+    exact = run(persona, focal_points, n_count)
+    for focal_pt in focal_points:
+      with kept_last_accessed(a_mem):
+        expected = baseline_retrieve(persona, [focal_pt], n_count)
+      original_identical += [[i.node_id for i in exact[focal_pt]]
+                             == [i.node_id for i in expected[focal_pt]]]
+
+    for dtype in ["float16", "int8"]:
+      a_mem.embedding_matrix = full_matrix.astype(dtype)
+      sims = a_mem.embedding_matrix.dot(rows, focal_matrix)
+      approx = run(persona, focal_points, n_count)
+      results[dtype]["bytes"] += [a_mem.embedding_matrix.nbytes()
+                                  / full_matrix.n_rows]
+      a_mem.embedding_matrix = full_matrix
+
+      results[dtype]["error"] += [float(np.abs(sims - full_sims).max())]
+      for f in focal_points:
+        results[dtype]["overlap"] += [len(set(approx[f]) & set(exact[f]))
+                                      / max(1, len(exact[f]))]
+        results[dtype]["identical"] += [approx[f] == exact[f]]
+    results["float32"]["bytes"] += [full_matrix.nbytes() / full_matrix.n_rows]
+
+  print (f"{sim_code}: {len(a_mems)} personas, top-{n_count}, "
+         f"{len(results['int8']['overlap'])} focal points")
+  check(all(original_identical),
+        "float32: same nodes as the original retrieval")
+  for dtype, result in results.items():
+    line = f"{dtype:8s} {np.mean(result['bytes']):6.0f} B/embedding"
+    if result["overlap"]:
+      line += (f", top-k overlap {np.mean(result['overlap']):.4f}"
+               f", identical lists {np.mean(result['identical']):.4f}"
+               f", max cosine error {max(result['error']):.1e}")
+    print (line)
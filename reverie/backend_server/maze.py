@@ -11,9 +11,16 @@ import datetime
 import pickle
 import time
 import math
+from collections import OrderedDict
 
 from global_methods import *
 from utils import *
+from path_finder import *
+
+# At most <address_field_cache_size> distance fields (see 
+# Maze.address_path) are kept; the least recently used one is dropped first.
+# A field takes 2 bytes per tile (28KB for the_ville). 
+address_field_cache_size = 128
 
 class Maze: 
   def __init__(self, maze_name): 
@@ -109,6 +116,11 @@ class Maze:
       game_object_maze += [game_object_maze_raw[i:i+tw]]
       spawning_location_maze += [spawning_location_maze_raw[i:i+tw]]
 
+    # <collision_grid> is the collision maze compiled for path finding (see 
+    # CollisionGrid in path_finder.py). 
+    self.collision_grid = CollisionGrid(self.collision_maze, 
+                                        collision_block_id)
+
     # Once we are done loading in the maze, we now set up self.tiles. This is
     # a matrix accessed by row:col where each access point is a dictionary
     # that contains all the things that are taking place in that tile. 
@@ -204,6 +216,74 @@ class Maze:
           else: 
             self.address_tiles[add] = set([(j, i)])
 
+    # <address_fields> caches the distance fields to the tiles of addresses,
+    # least recently used first (see address_path). 
+    # e.g., self.address_fields['double studio:recreation:pool table'] 
+    #       == array([14, 13, 12, ...], dtype=uint16)
+    # The fields are dropped when the collision grid changes, i.e., when 
+    # its version differs from <address_fields_version>. 
+    self.address_fields = OrderedDict()
+    self.address_fields_version = self.collision_grid.version
+
+
+  def address_path(self, tile, address): 
+    """
+    Returns the shortest path from <tile> to the nearest walkable tile of 
+    <address>. The distance field of the address is built by one 
+    breadth-first search the first time it is needed and cached, so the 
+    path is found without searching. 
+
+    INPUT
+      tile: The tile coordinate to start from in (x, y) form. 
+      address: A string address in self.address_tiles. 
+    OUTPUT
+      The list of (x, y) tiles from <tile> to the nearest tile of <address>,
+      or None if none of them can be reached. 
+    EXAMPLE OUTPUT 
+      Given (58, 12) and 'double studio:double studio:bedroom 2:bed', 
+      outputs [(58, 12), (58, 11), (58, 10), (58, 9)]
+    """
+    if self.address_fields_version != self.collision_grid.version: 
+      self.address_fields = OrderedDict()
+      self.address_fields_version = self.collision_grid.version
+
+    if address in self.address_fields: 
+      self.address_fields.move_to_end(address)
+    else: 
+      targets = [(y, x) for x, y in self.address_tiles[address]]
+      self.address_fields[address] = distance_field(self.collision_grid, 
+                                                    targets)
+      while len(self.address_fields) > address_field_cache_size: 
+        self.address_fields.popitem(last=False)
+
+    path = descend_field(self.collision_grid, self.address_fields[address], 
+                         (tile[1], tile[0]))
+    if path is None: 
+      return None
+    return [(col, row) for row, col in path]
+
+
+  def path_to_nearest(self, tile, goals): 
+    """
+    Runs one search from <tile> that stops at the first of <goals> it 
+    reaches. 
+
+    INPUT
+      tile: The tile coordinate to start from in (x, y) form. 
+      goals: A list of tile coordinates in (x, y) form. 
+    OUTPUT
+      The goal reached and the list of (x, y) tiles from <tile> to it, or 
+      (None, None) if none of <goals> can be reached. 
+    EXAMPLE OUTPUT 
+      Given (58, 12) and [(58, 9), (20, 30)], 
+      outputs ((58, 9), [(58, 12), (58, 11), (58, 10), (58, 9)])
+    """
+    goal, path = path_finder_multi(self.collision_grid, (tile[1], tile[0]), 
+                                   [(i[1], i[0]) for i in goals])
+    if goal is None: 
+      return None, None
+    return (goal[1], goal[0]), [(col, row) for row, col in path]
+
 
   def turn_coordinate_to_tile(self, px_coordinate): 
     """
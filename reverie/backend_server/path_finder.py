@@ -5,6 +5,8 @@ File: path_finder.py
 Description: Implements various path finding functions for generative agents.
 Some of the functions are defunct. 
 """
+from collections import OrderedDict
+
 import numpy as np
 
 def print_maze(maze):
@@ -161,13 +163,289 @@ def path_finder_v2(a, start, end, collision_block_char, verbose=False):
   return the_path
 
 
+class CollisionGrid: 
+  """
+  A collision maze compiled once for path finding. <blocked> is a boolean 
+  (row, col) array of the collision tiles. For the search loops, tiles are 
+  also numbered row-major (index = row * width + col), and <neighbors> lists
+  the walkable tiles next to each tile, so that a search never touches the 
+  string cells of the collision maze. <version> is increased whenever a 
+  tile is changed with set_blocked(), which invalidates the distance fields
+  cached by Maze.address_path. 
+  """
+  def __init__(self, collision_maze, collision_block_char): 
+    self.height = len(collision_maze)
+    self.width = len(collision_maze[0])
+    self.blocked = np.array([[cell == collision_block_char for cell in row]
+                             for row in collision_maze], dtype=bool)
+
+    blocked = self.blocked.ravel().tolist()
+    self.neighbors = [self._neighbors(index, blocked) 
+                      for index in range(self.width * self.height)]
+
+    self.version = 0
+
+
+  def _neighbors(self, index, blocked): 
+    # <blocked> is the flat list of the collision tiles. 
+    row, col = divmod(index, self.width)
+    curr_neighbors = []
+    if row > 0 and not blocked[index - self.width]: 
+      curr_neighbors += [index - self.width]
+    if col > 0 and not blocked[index - 1]: 
+      curr_neighbors += [index - 1]
+    if row < self.height - 1 and not blocked[index + self.width]: 
+      curr_neighbors += [index + self.width]
+    if col < self.width - 1 and not blocked[index + 1]: 
+      curr_neighbors += [index + 1]
+    return curr_neighbors
+
+
+  def set_blocked(self, tile, blocked): 
+    """
+    Marks the (row, col) <tile> as a collision tile (or not). 
+    """
+    row, col = tile
+    if self.blocked[row, col] == blocked: 
+      return
+    self.blocked[row, col] = blocked
+    flat = self.blocked.ravel()
+    index = self.index(tile)
+    for neighbor in [index - self.width, index - 1, index + self.width, 
+                     index + 1]: 
+      if 0 <= neighbor < self.width * self.height: 
+        self.neighbors[neighbor] = self._neighbors(neighbor, flat)
+    self.version += 1
+
+
+  def index(self, tile): 
+    return tile[0] * self.width + tile[1]
+
+
+  def tile(self, index): 
+    return divmod(index, self.width)
+
+
+def grid_search(grid, start, goals=()): 
+  """
+  Breadth-first search from <start> over <grid> that stops at the first of
+  <goals> it reaches. 
+
+  INPUT: 
+    grid: A <CollisionGrid>.
+    start: The (row, col) tile to search from. 
+    goals: A set of tile indices (see CollisionGrid.index). 
+  OUTPUT: 
+    dist: A list with the number of steps from <start> to every tile (-1 if
+          it is unreachable). If a goal was reached, only the tiles closer 
+          to <start> than that goal are guaranteed to be set. 
+    goal: The tile index of the goal reached, or -1. 
+  """
+  dist = [-1] * (grid.width * grid.height)
+  curr = grid.index(start)
+  dist[curr] = 0
+  if curr in goals: 
+    return dist, curr
+
+  neighbors = grid.neighbors
+  frontier = [curr]
+  steps = 0
+  while frontier: 
+    steps += 1
+    next_frontier = []
+    for curr in frontier: 
+      for index in neighbors[curr]: 
+        if dist[index] < 0: 
+          dist[index] = steps
+          if index in goals: 
+            return dist, index
+          next_frontier += [index]
+    frontier = next_frontier
+  return dist, -1
+
+
+def grid_distances(grid, start, end=None): 
+  """
+  Breadth-first search from <start> over <grid> (see grid_search). If <end>
+  is given, the search stops when it reaches the (row, col) tile <end>. 
+  """
+  goals = () if end is None else {grid.index(end)}
+  return grid_search(grid, start, goals)[0]
+
+
+def walk_down(grid, dist, curr, steps): 
+  """
+  Walks from the tile index <curr>, which is <steps> away in <dist>, down to
+  a tile at distance 0. At each step, the first neighbor one step closer is
+  taken, in the order up, left, down, right -- the same order as 
+  path_finder_v2. Returns the tile indices walked, starting with <curr>. 
+  """
+  width = grid.width
+  walked = [curr]
+  while steps > 0: 
+    row, col = divmod(curr, width)
+    steps -= 1
+    if row > 0 and dist[curr - width] == steps: 
+      curr = curr - width
+    elif col > 0 and dist[curr - 1] == steps: 
+      curr = curr - 1
+    elif row < grid.height - 1 and dist[curr + width] == steps: 
+      curr = curr + width
+    else: 
+      curr = curr + 1
+    walked += [curr]
+  return walked
+
+
+def trace_path(grid, dist, end): 
+  """
+  Walks back from <end> to the start of <dist> (see grid_distances and 
+  walk_down), so that the paths are identical to path_finder_v2's. 
+
+  INPUT: 
+    grid: A <CollisionGrid>.
+    dist: The distances returned by grid_distances. 
+    end: The (row, col) tile to walk back from. 
+  OUTPUT: 
+    The list of (row, col) tiles from the start to <end>. If <end> is not 
+    reachable, [end] (as path_finder_v2 does). 
+  """
+  curr = grid.index(end)
+  if dist[curr] < 0: 
+    return [tuple(end)]
+  the_path = walk_down(grid, dist, curr, dist[curr])
+  the_path.reverse()
+  return [grid.tile(index) for index in the_path]
+
+
+# <unreachable> marks the tiles of a distance field (see distance_field) 
+# from which none of its targets can be reached. 
+unreachable = np.iinfo(np.uint16).max
+
+
+def distance_field(grid, targets): 
+  """
+  Breadth-first search from all walkable tiles of <targets> at once. 
+
+  INPUT: 
+    grid: A <CollisionGrid>.
+    targets: A list of (row, col) tiles. 
+  OUTPUT: 
+    A flat uint16 array with the number of steps from every tile to the 
+    nearest target (<unreachable> if there is none). 
+  """
+  dist = [-1] * (grid.width * grid.height)
+  frontier = []
+  for tile in targets: 
+    index = grid.index(tile)
+    if not grid.blocked[tile[0], tile[1]] and dist[index] < 0: 
+      dist[index] = 0
+      frontier += [index]
+
+  neighbors = grid.neighbors
+  steps = 0
+  while frontier: 
+    steps += 1
+    next_frontier = []
+    for curr in frontier: 
+      for index in neighbors[curr]: 
+        if dist[index] < 0: 
+          dist[index] = steps
+          next_frontier += [index]
+    frontier = next_frontier
+
+  field = np.array(dist, dtype=np.int64)
+  field[(field < 0) | (field > unreachable)] = unreachable
+  return field.astype(np.uint16)
+
+
+def descend_field(grid, field, start): 
+  """
+  Returns the shortest path from <start> to the nearest target of <field> 
+  (see distance_field) as a list of (row, col) tiles, or None if no target
+  can be reached. No search is needed: the path walks down the field. 
+  """
+  curr = grid.index(start)
+  steps = int(field[curr])
+  if steps == unreachable: 
+    # A blocked start tile is not part of the field; the path steps off it
+    # onto its closest neighbor. 
+    steps = min([int(field[i]) for i in grid.neighbors[curr]] 
+                + [unreachable - 1]) + 1
+    if steps >= unreachable: 
+      return None
+  return [grid.tile(index) for index in walk_down(grid, field, curr, steps)]
+
+
+def path_finder_bfs(grid, start, end): 
+  """
+  Returns the shortest path from <start> to <end> on <grid> as a list of 
+  (row, col) tiles. The paths are identical to path_finder_v2's, which 
+  relabels the whole maze once per step of the path and gives up after 150
+  steps; this search has no such limit. 
+  """
+  return trace_path(grid, grid_distances(grid, start, end), end)
+
+
+def path_finder_multi(grid, start, ends): 
+  """
+  Returns the shortest path from <start> to whichever of <ends> is closest,
+  found by one search. 
+
+  INPUT: 
+    grid: A <CollisionGrid>.
+    start: The (row, col) tile to start from. 
+    ends: A list of (row, col) tiles. 
+  OUTPUT: 
+    The (row, col) end reached and the list of (row, col) tiles from 
+    <start> to it, or (None, None) if none of <ends> can be reached. 
+  """
+  dist, goal = grid_search(grid, start, set(grid.index(i) for i in ends))
+  if goal < 0: 
+    return None, None
+  end = grid.tile(goal)
+  return end, trace_path(grid, dist, end)
+
+
+# The CollisionGrids compiled by compiled_grid() for the last few collision 
+# mazes passed to path_finder() as is, keyed by id(maze). Each entry also 
+# keeps the maze itself, so that its id is not reused while it is cached. 
+compiled_grids = OrderedDict()
+compiled_grids_size = 4
+
+
+def compiled_grid(maze, collision_block_char): 
+  """
+  Returns the CollisionGrid of the collision maze <maze>, compiling it only
+  the first time <maze> is seen. The grid is not updated if <maze> is later
+  changed in place; a caller that changes its map should instead keep a 
+  CollisionGrid and change it with set_blocked(). 
+  """
+  key = (id(maze), collision_block_char)
+  if key in compiled_grids: 
+    compiled_grids.move_to_end(key)
+    return compiled_grids[key][1]
+  grid = CollisionGrid(maze, collision_block_char)
+  compiled_grids[key] = (maze, grid)
+  while len(compiled_grids) > compiled_grids_size: 
+    compiled_grids.popitem(last=False)
+  return grid
+
+
 def path_finder(maze, start, end, collision_block_char, verbose=False):
+  # <maze> is either a <CollisionGrid> (e.g., Maze.collision_grid) or the 
+  # collision maze itself, which is then compiled once (see compiled_grid).
+  if isinstance(maze, CollisionGrid): 
+    grid = maze
+  else: 
+    grid = compiled_grid(maze, collision_block_char)
+
   # EMERGENCY PATCH
   start = (start[1], start[0])
   end = (end[1], end[0])
   # END EMERGENCY PATCH
 
-  path = path_finder_v2(maze, start, end, collision_block_char, verbose)
+  path = path_finder_bfs(grid, start, end)
 
   new_path = []
   for i in path: 
@@ -207,8 +485,12 @@ def path_finder_2(maze, start, end, collision_block_char, verbose=False):
   t_right = (end[0]+1, end[1])
   pot_target_coordinates = [t_top, t_bottom, t_left, t_right]
 
-  maze_width = len(maze[0]) 
-  maze_height = len(maze)
+  if isinstance(maze, CollisionGrid): 
+    maze_width = maze.width
+    maze_height = maze.height
+  else: 
+    maze_width = len(maze[0]) 
+    maze_height = len(maze)
   target_coordinates = []
   for coordinate in pot_target_coordinates: 
     if coordinate[0] >= 0 and coordinate[0] < maze_width and coordinate[1] >= 0 and coordinate[1] < maze_height: 
@@ -39,6 +39,10 @@ def execute(persona, maze, personas, plan):
     # <target_tiles> 是智能体可能前往执行当前动作的瓦片坐标列表。
     # 目标是从中选择一个。
     target_tiles = None
+    # <field_address> 是默认执行时的目标地址（见下面的 Maze.address_path）。
+    field_address = None
+    # 已经知道前往目标瓦片的路径时，<path> 不为 None，无需再寻路。
+    path = None
 
     print ('aldhfoaf/????')
     print (plan)
@@ -47,25 +51,20 @@ def execute(persona, maze, personas, plan):
       # 执行智能体间的交互。
       target_p_tile = (personas[plan.split("<persona>")[-1].strip()]
                        .scratch.curr_tile)
-      potential_path = path_finder(maze.collision_maze, 
-                                   persona.scratch.curr_tile, 
-                                   target_p_tile, 
-                                   collision_block_id)
+      # 目标智能体不可达时，与 path_finder 一样以 [target_p_tile] 作为路径。
+      _, potential_path = maze.path_to_nearest(persona.scratch.curr_tile, 
+                                               [target_p_tile])
+      if not potential_path: 
+        potential_path = [target_p_tile]
       if len(potential_path) <= 2: 
         target_tiles = [potential_path[0]]
       else: 
-        potential_1 = path_finder(maze.collision_maze, 
-                                persona.scratch.curr_tile, 
-                                potential_path[int(len(potential_path)/2)], 
-                                collision_block_id)
-        potential_2 = path_finder(maze.collision_maze, 
-                                persona.scratch.curr_tile, 
-                                potential_path[int(len(potential_path)/2)+1], 
-                                collision_block_id)
-        if len(potential_1) <= len(potential_2): 
-          target_tiles = [potential_path[int(len(potential_path)/2)]]
-        else: 
-          target_tiles = [potential_path[int(len(potential_path)/2+1)]]
+        # potential_path 是最短路径，所以到其中点的最短路径就是它的前半段，
+        # 且中点比中点 +1 更近（原先分别寻路到这两个瓦片再比较长度，结果
+        # 总是中点）。
+        middle = int(len(potential_path)/2)
+        target_tiles = [potential_path[middle]]
+        path = potential_path[:middle+1]
     
     elif "<waiting>" in plan: 
       # 执行智能体决定在执行其动作之前等待的交互。
@@ -87,6 +86,7 @@ def execute(persona, maze, personas, plan):
         maze.address_tiles["Johnson Park:park:park garden"] #ERRORRRRRRR
       else: 
         target_tiles = maze.address_tiles[plan]
+        field_address = plan
 
     # 有时会从中返回多个瓦片（例如，一张桌子可能跨越许多坐标）。
     # 所以，我们在这里采样一些。从那个随机样本中，我们将取最近的那些。 
@@ -111,25 +111,28 @@ def execute(persona, maze, personas, plan):
       new_target_tiles = target_tiles
     target_tiles = new_target_tiles
 
-    # 现在我们已经确定了目标瓦片，我们找到到其中一个目标瓦片的最短路径。 
+    # 前往已知地址时，沿该地址缓存的距离场直接走到最近的可通行瓦片（见 
+    # Maze.address_path），无需寻路。该瓦片已被其他智能体占据时，仍按上面
+    # 采样的目标瓦片寻路。
     curr_tile = persona.scratch.curr_tile
     collision_maze = maze.collision_maze
     closest_target_tile = None
-    path = None
-    for i in target_tiles: 
-      # path_finder 接受 collision_maze 和 curr_tile 坐标作为输入，
-      # 并返回成为路径的坐标元组列表。
-      # 例如：[(0, 1), (1, 1), (1, 2), (1, 3), (1, 4)...]
-      curr_path = path_finder(maze.collision_maze, 
-                              curr_tile, 
-                              i, 
-                              collision_block_id)
-      if not closest_target_tile: 
-        closest_target_tile = i
-        path = curr_path
-      elif len(curr_path) < len(path): 
-        closest_target_tile = i
-        path = curr_path
+    if field_address: 
+      path = maze.address_path(curr_tile, field_address)
+      if path and len(path) > 1: 
+        for j in maze.access_tile(path[-1])["events"]: 
+          if j[0] in persona_name_set: 
+            path = None
+            break
+
+    # 否则，我们通过一次搜索找到到最近的目标瓦片的最短路径，它是坐标元组
+    # 列表，例如：[(0, 1), (1, 1), (1, 2), (1, 3), (1, 4)...]
+    # 所有目标瓦片都不可达时，智能体留在原地。
+    if not path: 
+      closest_target_tile, path = maze.path_to_nearest(
+                                    curr_tile, [tuple(i) for i in target_tiles])
+      if not path: 
+        path = [curr_tile]
 
     # 实际设置 <planned_path> 和 <act_path_set>。我们切掉 planned_path 中的
     # 第一个元素，因为它包含 curr_tile。
@@ -104,11 +104,9 @@ def perceive(persona, maze):
     desc = f"{s.split(':')[-1]} is {desc}"
     p_event = (s, p, o)
 
-    # 我们检索最新的 persona.scratch.retention 个事件。如果发生了新事情
-    # （即 p_event 不在 latest_events 中），那么我们将该事件添加到 a_mem 并返回它。 
-    latest_events = persona.a_mem.get_summarized_latest_events(
-                                    persona.scratch.retention)
-    if p_event not in latest_events:
+    # 我们检查最新的 persona.scratch.retention 个事件。如果发生了新事情
+    # （即 p_event 不在其中），那么我们将该事件添加到 a_mem 并返回它。 
+    if not persona.a_mem.has_latest_event(p_event, persona.scratch.retention):
       # 我们首先管理关键词。
       keywords = set()
       sub = p_event[0]
@@ -128,7 +126,7 @@ def perceive(persona, maze):
       if desc_embedding_in in persona.a_mem.embeddings: 
         event_embedding = persona.a_mem.embeddings[desc_embedding_in]
       else: 
-        event_embedding = get_embedding(desc_embedding_in)
+        event_embedding = get_embedding_deferred(desc_embedding_in)
       event_embedding_pair = (desc_embedding_in, event_embedding)
       
       # 获取事件重要性。
@@ -144,8 +142,8 @@ def perceive(persona, maze):
           chat_embedding = persona.a_mem.embeddings[
                              persona.scratch.act_description]
         else: 
-          chat_embedding = get_embedding(persona.scratch
-                                                .act_description)
+          chat_embedding = get_embedding_deferred(persona.scratch
+                                                         .act_description)
         chat_embedding_pair = (persona.scratch.act_description, 
                                chat_embedding)
         chat_poignancy = generate_poig_score(persona, "chat", 
@@ -21,15 +21,16 @@ from persona.cognitive_modules.retrieve import *
 def generate_focal_points(persona, n=3): 
   if debug: print ("GNS FUNCTION: <generate_focal_points>")
   
-  nodes = [[i.last_accessed, i]
-            for i in persona.a_mem.seq_event + persona.a_mem.seq_thought
-            if "idle" not in i.embedding_key]
-
-  nodes = sorted(nodes, key=lambda x: x[0])
-  nodes = [i for created, i in nodes]
+  # 从时近性索引中取出最近访问的 importance_ele_n 个非 idle 节点
+  # （为 0 时与原先的切片 [-0:] 一样取全部节点）。
+  recency_index = persona.a_mem.recency_index
+  if persona.scratch.importance_ele_n > 0: 
+    nodes = recency_index.most_recent(persona.scratch.importance_ele_n)
+  else: 
+    nodes = recency_index.nodes()
 
   statements = ""
-  for node in nodes[-1*persona.scratch.importance_ele_n:]: 
+  for node in nodes: 
     statements += node.embedding_key + "\n"
 
   return run_gpt_prompt_focal_pt(persona, statements, n)[0]
@@ -111,23 +112,39 @@ def run_reflect(persona):
   # <retrieved> 以焦点为键，以关联的节点为值。
   retrieved = new_retrieve(persona, focal_points)
 
-  # 为每个焦点生成思考并将其保存在智能体的记忆中。 
-  for focal_pt, nodes in retrieved.items(): 
+  # 各焦点的见解生成互不依赖，因此通过 llm_gateway 同时发出。
+  insight_futures = []
+  for focal_pt, nodes in retrieved.items():
     xx = [i.embedding_key for i in nodes]
     for xxx in xx: print (xxx)
 
-    thoughts = generate_insights_and_evidence(persona, nodes, 5)
-    for thought, evidence in thoughts.items(): 
-      created = persona.scratch.curr_time
-      expiration = persona.scratch.curr_time + datetime.timedelta(days=30)
-      s, p, o = generate_action_event_triple(thought, persona)
-      keywords = set([s, p, o])
-      thought_poignancy = generate_poig_score(persona, "thought", thought)
-      thought_embedding_pair = (thought, get_embedding(thought))
-
-      persona.a_mem.add_thought(created, expiration, s, p, o, 
-                                thought, keywords, thought_poignancy, 
-                                thought_embedding_pair, evidence)
+    insight_futures += [llm_gateway.submit(generate_insights_and_evidence,
+                                           persona, nodes, 5)]
+
+  # 每条思考的三元组和重要性同样互不依赖，也一并并发请求。嵌入则交给
+  # embedding_batcher，在本步结束时与其他嵌入合并为一次请求。
+  pending = []
+  for f in insight_futures:
+    for thought, evidence in f.result().items():
+      pending += [[thought, evidence,
+                   llm_gateway.submit(generate_action_event_triple,
+                                      thought, persona),
+                   llm_gateway.submit(generate_poig_score,
+                                      persona, "thought", thought),
+                   get_embedding_deferred(thought)]]
+
+  # 按原有顺序将思考保存在智能体的记忆中。
+  for thought, evidence, f_triple, f_poig, embedding in pending:
+    created = persona.scratch.curr_time
+    expiration = persona.scratch.curr_time + datetime.timedelta(days=30)
+    s, p, o = f_triple.result()
+    keywords = set([s, p, o])
+    thought_poignancy = f_poig.result()
+    thought_embedding_pair = (thought, embedding)
+
+    persona.a_mem.add_thought(created, expiration, s, p, o,
+                              thought, keywords, thought_poignancy,
+                              thought_embedding_pair, evidence)
 
 
 def reflection_trigger(persona): 
@@ -148,7 +165,7 @@ def reflection_trigger(persona):
   print (persona.scratch.importance_trigger_max)
 
   if (persona.scratch.importance_trigger_curr <= 0 and 
-      [] != persona.a_mem.seq_event + persona.a_mem.seq_thought): 
+      (persona.a_mem.seq_event or persona.a_mem.seq_thought)): 
     return True 
   return False
 
@@ -219,7 +236,7 @@ def reflect(persona):
       s, p, o = generate_action_event_triple(planning_thought, persona)
       keywords = set([s, p, o])
       thought_poignancy = generate_poig_score(persona, "thought", planning_thought)
-      thought_embedding_pair = (planning_thought, get_embedding(planning_thought))
+      thought_embedding_pair = (planning_thought, get_embedding_deferred(planning_thought))
 
       persona.a_mem.add_thought(created, expiration, s, p, o, 
                                 planning_thought, keywords, thought_poignancy, 
@@ -235,7 +252,7 @@ def reflect(persona):
       s, p, o = generate_action_event_triple(memo_thought, persona)
       keywords = set([s, p, o])
       thought_poignancy = generate_poig_score(persona, "thought", memo_thought)
-      thought_embedding_pair = (memo_thought, get_embedding(memo_thought))
+      thought_embedding_pair = (memo_thought, get_embedding_deferred(memo_thought))
 
       persona.a_mem.add_thought(created, expiration, s, p, o, 
                                 memo_thought, keywords, thought_poignancy, 
@@ -10,9 +10,14 @@ sys.path.append('../../')
 from global_methods import *
 from persona.prompt_template.gpt_structure import *
 
+import numpy as np
 from numpy import dot
 from numpy.linalg import norm
 
+from persona.memory_structures.embedding_matrix import normalize_embedding
+from persona.memory_structures.node_columns import datetime_to_seconds
+from persona.memory_structures.retrieval_cache import retrieval_cache_enabled
+
 def retrieve(persona, perceived): 
   """
   此函数接受智能体感知到的事件作为输入，并返回智能体在规划时需要考虑作为上下文的
@@ -97,6 +102,29 @@ def normalize_dict_floats(d, target_min, target_max):
   return d
 
 
+def normalize_vector_floats(v, target_min, target_max):
+  """
+  The numpy counterpart of normalize_dict_floats: scales the values of the 
+  1-d array 'v' to the range between target_min and target_max. As in 
+  normalize_dict_floats, an array whose values are all equal is set to 
+  (target_max - target_min)/2. 
+
+  INPUT: 
+    v: 1-d numpy array of floats.
+    target_min: Integer or float. The minimum of the target range.
+    target_max: Integer or float. The maximum of the target range.
+  OUTPUT: 
+    A new 1-d numpy array with the normalized values. 
+  """
+  min_val = v.min()
+  range_val = v.max() - min_val
+
+  if range_val == 0: 
+    return np.full(v.shape, (target_max - target_min)/2, dtype=np.float64)
+  return ((v - min_val) * (target_max - target_min) 
+          / range_val + target_min)
+
+
 def top_highest_x_values(d, x):
   """
   This function takes a dictionary 'd' and an integer 'x' as input, and 
@@ -181,88 +209,226 @@ def extract_relevance(persona, nodes, focal_pt):
 
   relevance_out = dict()
   for count, node in enumerate(nodes): 
-    node_embedding = persona.a_mem.embeddings[node.embedding_key]
+    node_embedding = resolve_embedding(
+                       persona.a_mem.embeddings[node.embedding_key])
     relevance_out[node.node_id] = cos_sim(node_embedding, focal_embedding)
 
   return relevance_out
 
 
-def new_retrieve(persona, focal_points, n_count=30): 
+def top_k_indices(scores, k): 
   """
-  给定当前智能体和焦点（焦点是我们要检索的事件或思考），我们为每个焦点检索
-  一组节点并返回一个字典。
+  Returns the indices of the k highest values of 'scores', ordered from the
+  highest to the lowest value. Equal values keep their index order, exactly
+  as a stable descending sort would. The candidates are selected with 
+  argpartition, so only those k values are fully sorted. 
+
+  INPUT: 
+    scores: 1-d numpy array of floats.
+    k: Integer. The number of indices to return. 
+  OUTPUT: 
+    A 1-d numpy array of at most k indices. 
+  """
+  n = scores.shape[0]
+  if k <= 0 or n == 0: 
+    return np.zeros(0, dtype=np.int64)
+  if k < n: 
+    # <threshold> is the k-th highest value. Every value above it is in the
+    # top k; the ties at the threshold are taken in index order. 
+    threshold = scores[np.argpartition(-scores, k - 1)[k - 1]]
+    above = np.flatnonzero(scores > threshold)
+    at = np.flatnonzero(scores == threshold)[:k - above.shape[0]]
+    candidates = np.concatenate([above, at])
+  else: 
+    candidates = np.arange(n)
+  return candidates[np.lexsort((candidates, -scores[candidates]))]
+
+
+def ann_relevance(ann_index, matrix, rows, focal_embedding, probe): 
+  """
+  使用近似最近邻索引计算归一化的相关性。<probe> 中的簇（候选）与最不
+  相似的簇（用于估计全体节点相关性的最小值）中的节点计算精确的余弦相似度；
+  其余节点的相关性取候选中的最小值，即假定它们不比任何候选更相关。
+
+  输入: 
+    ann_index: IVFIndex 对象
+    matrix: EmbeddingMatrix 对象（已归一化的行）
+    rows: 每个候选节点在矩阵中的行号
+    focal_embedding: 归一化的焦点向量
+    probe: 要搜索的簇编号数组
+  输出: 
+    relevance_out: 与 <rows> 等长的、归一化到 [0, 1] 的相关性数组
+  """
+  lists = np.concatenate([probe, ann_index.farthest(focal_embedding)])
+  scored = np.flatnonzero(ann_index.candidate_mask(rows, lists))
+  candidates = ann_index.candidate_mask(rows[scored], probe)
+  relevance = matrix.dot(rows[scored], focal_embedding).astype(np.float64)
+
+  relevance_out = np.zeros(rows.shape[0], dtype=np.float64)
+  if scored.shape[0] == 0: 
+    return relevance_out
+  if candidates.any(): 
+    relevance_out[:] = relevance[candidates].min()
+  else: 
+    relevance_out[:] = relevance.max()
+  relevance_out[scored] = relevance
+  return normalize_vector_floats(relevance_out, 0, 1)
+
+
+def new_retrieve_batch(persona, focal_points, n_count=30): 
+  """
+  new_retrieve 的批量版本：候选节点、时近性与重要性向量只构建一次，所有
+  焦点的嵌入在一次请求中取回，并通过一次矩阵-矩阵乘法与记忆矩阵计算
+  相关性。每个焦点的前 n_count 个节点通过 argpartition 选出。
+
+  与逐个焦点检索的结果完全一致：前一个焦点返回的节点会更新 
+  last_accessed 并成为最近访问的节点，从而影响后续焦点的时近性排序。
+
+  记忆版本未变时，相同焦点的相关性取自智能体的检索缓存（见 
+  retrieval_cache.py）。
 
   输入: 
     persona: 我们正在检索其记忆的当前智能体对象。
     focal_points: 焦点列表（作为当前检索焦点的事件或思考的字符串描述）。
+    n_count: 每个焦点返回的节点数。
   输出: 
     retrieved: 字典，其键为字符串焦点，值为智能体联想记忆中的节点对象列表。
-
-  输入示例:
-    persona = <persona> 对象 
-    focal_points = ["How are you?", "Jane is swimming in the pond"]
   """
   # <retrieved> 是我们返回的主要字典
   retrieved = dict() 
+
+  # 从智能体的时近性索引中获取所有非 idle 的节点（思考和事件），
+  # 已按最近访问从旧到新排列，无需再排序。
+  a_mem = persona.a_mem
+  recency_index = a_mem.recency_index
+  nodes = recency_index.nodes()
+  if not nodes: 
+    for focal_pt in focal_points: 
+      retrieved[focal_pt] = []
+    return retrieved
+
+  # 从节点的列存储中读取重要性。
+  columns = a_mem.node_columns
+  node_rows = np.array([i.row for i in nodes])
+
+  # 时近性只取决于节点在排序中的位置，因此按位置计算一次即可。
+  recency_by_pos = persona.scratch.recency_decay ** np.arange(
+                     1, len(nodes) + 1, dtype=np.float64)
+  recency_by_pos = normalize_vector_floats(recency_by_pos, 0, 1)
+  importance_out = normalize_vector_floats(columns.poignancy[node_rows], 0, 1)
+
+  # <relevance_by_focal> 是每个焦点归一化后的相关性，与 <nodes> 对齐。
+  # 记忆版本未变时，相关性取自检索缓存（按嵌入矩阵的行号保存）。
+  rows = np.array([a_mem.node_to_row[i.node_id] for i in nodes])
+  matrix = a_mem.embedding_matrix
+  cache = a_mem.retrieval_cache if retrieval_cache_enabled else None
+  relevance_by_focal = dict()
+  for focal_pt in dict.fromkeys(focal_points): 
+    if cache is not None: 
+      relevance = cache.get(focal_pt, a_mem.version)
+      if relevance is not None: 
+        relevance_by_focal[focal_pt] = relevance[rows]
+  misses = [focal_pt for focal_pt in dict.fromkeys(focal_points)
+            if focal_pt not in relevance_by_focal]
+
+  if misses: 
+    # 所有未命中焦点的嵌入合并为一次请求，并与记忆矩阵做一次矩阵-矩阵
+    # 乘法。<relevance_all> 的形状为 (节点数, 未命中焦点数)。
+    focal_embeddings = [get_embedding_deferred(focal_pt) 
+                        for focal_pt in misses]
+    focal_matrix = np.stack([normalize_embedding(resolve_embedding(i))
+                             for i in focal_embeddings], axis=1)
+
+    # 如果启用了近似最近邻索引（见 ann_index.py）且记忆足够大，则每个焦点
+    # 只对其候选簇中的节点计算相关性，其余节点的相关性取候选中的最小值
+    # （见 ann_relevance）。
+    ann_index = a_mem.ann_index
+    if ann_index is not None and ann_index.ready(): 
+      probes = ann_index.probe(focal_matrix)
+    else: 
+      probes = None
+      relevance_all = matrix.dot(rows, focal_matrix).astype(np.float64)
+
+    for count, focal_pt in enumerate(misses): 
+      if probes is None: 
+        relevance_out = normalize_vector_floats(relevance_all[:, count], 0, 1)
+      else: 
+        relevance_out = ann_relevance(ann_index, matrix, rows, 
+                                      focal_matrix[:, count], probes[count])
+      relevance_by_focal[focal_pt] = relevance_out
+      if cache is not None: 
+        relevance = np.zeros(matrix.n_rows, dtype=np.float64)
+        relevance[rows] = relevance_out
+        cache.put(focal_pt, a_mem.version, relevance)
+
+  # 计算结合组件值的最终分数。
+  # 自我提醒：测试不同的权重。[1, 1, 1] 通常工作得相当好，
+  # 但在未来，这些权重可能应该通过类似 RL 的过程来学习。
+  # gw = [1, 1, 1]
+  # gw = [1, 2, 1]
+  gw = [0.5, 3, 2]
+  curr_time = datetime_to_seconds(persona.scratch.curr_time)
+  # <order> 将时近性排序中的位置映射到 <nodes> 中的下标。
+  order = np.arange(len(nodes))
+  node_index = {node.node_id: count for count, node in enumerate(nodes)}
   for focal_pt in focal_points: 
-    # 从智能体的记忆中获取所有节点（思考和事件），并按创建的日期时间排序。
-    # 你也可以想象获取原始对话，但目前先这样。
-    nodes = [[i.last_accessed, i]
-              for i in persona.a_mem.seq_event + persona.a_mem.seq_thought
-              if "idle" not in i.embedding_key]
-    nodes = sorted(nodes, key=lambda x: x[0])
-    nodes = [i for created, i in nodes]
-
-    # 计算组件字典并对其进行归一化。
-    recency_out = extract_recency(persona, nodes)
-    recency_out = normalize_dict_floats(recency_out, 0, 1)
-    importance_out = extract_importance(persona, nodes)
-    importance_out = normalize_dict_floats(importance_out, 0, 1)  
-    relevance_out = extract_relevance(persona, nodes, focal_pt)
-    relevance_out = normalize_dict_floats(relevance_out, 0, 1)
-
-    # 计算结合组件值的最终分数。
-    # 自我提醒：测试不同的权重。[1, 1, 1] 通常工作得相当好，
-    # 但在未来，这些权重可能应该通过类似 RL 的过程来学习。
-    # gw = [1, 1, 1]
-    # gw = [1, 2, 1]
-    gw = [0.5, 3, 2]
-    master_out = dict()
-    for key in recency_out.keys(): 
-      master_out[key] = (persona.scratch.recency_w*recency_out[key]*gw[0] 
-                     + persona.scratch.relevance_w*relevance_out[key]*gw[1] 
-                     + persona.scratch.importance_w*importance_out[key]*gw[2])
-
-    master_out = top_highest_x_values(master_out, len(master_out.keys()))
-    for key, val in master_out.items(): 
-      print (persona.a_mem.id_to_node[key].embedding_key, val)
-      print (persona.scratch.recency_w*recency_out[key]*1, 
-             persona.scratch.relevance_w*relevance_out[key]*1, 
-             persona.scratch.importance_w*importance_out[key]*1)
-
-    # 提取最高的 x 个值。
-    # <master_out> 具有 node.id 的键和浮点数的值。一旦我们得到最高的 x 个值，
-    # 我们希望将 node.id 转换为节点并返回节点列表。
-    master_out = top_highest_x_values(master_out, n_count)
-    master_nodes = [persona.a_mem.id_to_node[key] 
-                    for key in list(master_out.keys())]
-
-    for n in master_nodes: 
-      n.last_accessed = persona.scratch.curr_time
+    recency_out = recency_by_pos
+    relevance_out = relevance_by_focal[focal_pt][order]
+
+    master_out = (persona.scratch.recency_w*recency_out*gw[0] 
+                  + persona.scratch.relevance_w*relevance_out*gw[1] 
+                  + persona.scratch.importance_w*importance_out[order]*gw[2])
+
+    # 提取最高的 x 个值；同分节点保持其在排序中的先后顺序。
+    top = top_k_indices(master_out, n_count)
+    if debug: 
+      for i in top: 
+        print (nodes[order[i]].embedding_key, master_out[i])
+        print (persona.scratch.recency_w*recency_out[i]*1, 
+               persona.scratch.relevance_w*relevance_out[i]*1, 
+               persona.scratch.importance_w*importance_out[order[i]]*1)
+
+    master_nodes = [nodes[i] for i in order[top]]
+    touch_retrieved(a_mem, master_nodes, curr_time)
+
+    # 被返回的节点移入时近性排序末尾 last_accessed 为当前时间的一组（组内
+    # 的顺序见 recency_index.py）；其余节点的先后顺序不变。
+    latest = np.array([node_index[i.node_id] for i in recency_index.most_recent(
+                         recency_index.count_since(curr_time))], 
+                      dtype=np.int64)
+    moved = np.zeros(len(nodes), dtype=bool)
+    moved[latest] = True
+    order = np.concatenate([order[~moved[order]], latest])
       
     retrieved[focal_pt] = master_nodes
 
   return retrieved
 
 
+def touch_retrieved(a_mem, nodes, curr_time): 
+  """
+  将检索返回的 <nodes> 的 last_accessed 设为 <curr_time>（距 epoch 的秒数），
+  并按返回顺序将它们标记为最近访问。
+  """
+  if not nodes: 
+    return
+  a_mem.node_columns.last_accessed[[i.row for i in nodes]] = curr_time
+  a_mem.recency_index.touch(nodes)
 
 
+def new_retrieve(persona, focal_points, n_count=30): 
+  """
+  给定当前智能体和焦点（焦点是我们要检索的事件或思考），我们为每个焦点检索
+  一组节点并返回一个字典。具体的计算由 new_retrieve_batch 完成。
 
+  输入: 
+    persona: 我们正在检索其记忆的当前智能体对象。
+    focal_points: 焦点列表（作为当前检索焦点的事件或思考的字符串描述）。
+  输出: 
+    retrieved: 字典，其键为字符串焦点，值为智能体联想记忆中的节点对象列表。
 
-
-
-
-
-
-
-
+  输入示例:
+    persona = <persona> 对象 
+    focal_points = ["How are you?", "Jane is swimming in the pond"]
+  """
+  return new_retrieve_batch(persona, focal_points, n_count)
@@ -0,0 +1,147 @@
+"""
+文件: ann_index.py
+描述: 定义 IVFIndex，一个基于 numpy 的倒排文件（IVF）近似最近邻索引，
+      用于在记忆节点数量很大时缩小检索中相关性计算的范围。
+
+索引将 EmbeddingMatrix 的行按球面 k-means 聚类到 n_lists 个簇中。查询时
+只对与焦点最接近的 n_probe 个簇中的行计算相关性；这些候选节点随后与全部
+节点的时近性和重要性一起重新排序（见 retrieve.py 的 new_retrieve_batch）。
+
+新加入的行在下一次查询时被分配到最近的簇（增量维护）；当行数增长到上一次
+训练时的 <retrain_factor> 倍时，重新训练簇中心。
+"""
+import numpy as np
+
+# <ann_index_enabled> 为 True 时，新建的 AssociativeMemory 会创建 IVFIndex。
+ann_index_enabled = False
+# 行数少于 <ann_min_rows> 时不使用索引，检索仍为精确计算。
+ann_min_rows = 20000
+
+
+# IVF 近似最近邻索引类
+class IVFIndex:
+  def __init__(self, matrix, min_rows=None, n_lists=None, n_probe=None,
+               retrain_factor=4, n_iter=10, seed=0):
+    # <matrix> 是被索引的 EmbeddingMatrix（行已归一化）。
+    self.matrix = matrix
+    self.min_rows = ann_min_rows if min_rows is None else min_rows
+    # 未指定时，n_lists 取 sqrt(行数)，n_probe 取 n_lists 的 1/8。
+    self.n_lists = n_lists
+    self.n_probe = n_probe
+    self.retrain_factor = retrain_factor
+    self.n_iter = n_iter
+    self.rng = np.random.RandomState(seed)
+
+    # <centroids> 是 (簇数 x 维度) 的单位向量矩阵；<assignments> 记录每一行
+    # 所属的簇；<n_assigned> 之前的行都已分配。
+    self.centroids = None
+    self.assignments = np.zeros(0, dtype=np.int32)
+    self.n_assigned = 0
+    self.n_trained = 0
+
+
+  def reset(self, matrix):
+    """
+    改为索引 <matrix>（例如压缩后的新矩阵）；簇中心在下一次查询时重新训练。
+    """
+    self.matrix = matrix
+    self.centroids = None
+    self.assignments = np.zeros(0, dtype=np.int32)
+    self.n_assigned = 0
+    self.n_trained = 0
+
+
+  def ready(self):
+    """
+    行数达到 <min_rows> 时返回 True，此时检索使用索引。
+    """
+    return self.matrix.n_rows >= max(1, self.min_rows)
+
+
+  def _train(self, n_rows):
+    n_lists = self.n_lists or max(1, int(np.sqrt(n_rows)))
+    n_lists = min(n_lists, n_rows)
+
+    # 在样本上运行球面 k-means：点积即余弦相似度。
+    n_sample = min(n_rows, 64 * n_lists)
+    sample = self.matrix.take(
+               np.sort(self.rng.choice(n_rows, n_sample, replace=False)))
+    centroids = sample[self.rng.choice(n_sample, n_lists, replace=False)]
+    for _ in range(self.n_iter):
+      labels = np.argmax(sample @ centroids.T, axis=1)
+      sums = np.zeros_like(centroids)
+      np.add.at(sums, labels, sample)
+      lengths = np.linalg.norm(sums, axis=1)
+      # 空簇保留原来的中心。
+      filled = lengths > 0
+      centroids[filled] = sums[filled] / lengths[filled, None]
+
+    self.centroids = centroids.astype(np.float32)
+    self.n_trained = n_rows
+    self.n_assigned = 0
+
+
+  def _assign(self, n_rows, start):
+    if self.assignments.shape[0] < n_rows:
+      capacity = max(n_rows, 2 * self.assignments.shape[0])
+      assignments = np.zeros(capacity, dtype=np.int32)
+      assignments[:self.n_assigned] = self.assignments[:self.n_assigned]
+      self.assignments = assignments
+    # 分块计算，避免一次生成过大的相似度矩阵。
+    for i in range(start, n_rows, 8192):
+      block = self.matrix.view(i, min(n_rows, i + 8192))
+      self.assignments[i:i+block.shape[0]] = np.argmax(
+        block @ self.centroids.T, axis=1)
+    self.n_assigned = n_rows
+
+
+  def update(self):
+    """
+    将尚未分配的行分配到簇中；必要时（重新）训练簇中心。
+    """
+    self.matrix.fill()
+    n_rows = self.matrix.n_rows
+    if n_rows == 0:
+      return
+    if (self.centroids is None
+        or n_rows >= self.retrain_factor * self.n_trained):
+      self._train(n_rows)
+    if self.n_assigned < n_rows:
+      self._assign(n_rows, self.n_assigned)
+
+
+  def probe(self, focal_matrix, n_probe=None):
+    """
+    返回每个焦点要搜索的簇。
+
+    输入:
+      focal_matrix: (维度 x 焦点数) 的归一化焦点向量矩阵
+      n_probe: 每个焦点搜索的簇数（默认为 self.n_probe）
+    输出:
+      列表，第 i 个元素是第 i 个焦点的簇编号数组
+    """
+    self.update()
+    n_probe = n_probe or self.n_probe or max(1, self.centroids.shape[0] // 8)
+    n_probe = min(n_probe, self.centroids.shape[0])
+    sims = self.centroids @ focal_matrix
+    probes = []
+    for count in range(sims.shape[1]):
+      probes += [np.argpartition(-sims[:, count], n_probe - 1)[:n_probe]]
+    return probes
+
+
+  def farthest(self, focal_embedding, n_lists=1):
+    """
+    返回与 <focal_embedding> 最不相似的 <n_lists> 个簇，用于估计相关性的
+    最小值。
+    """
+    sims = self.centroids @ focal_embedding
+    n_lists = min(n_lists, sims.shape[0])
+    return np.argpartition(sims, n_lists - 1)[:n_lists]
+
+
+  def candidate_mask(self, rows, lists):
+    """
+    返回一个布尔数组，标记 <rows>（矩阵行号数组）中哪些行属于 <lists> 中的簇。
+    """
+    return np.isin(self.assignments[rows], lists)
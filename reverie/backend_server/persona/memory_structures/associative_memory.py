@@ -4,112 +4,266 @@
 import sys
 sys.path.append('../../')
 
+import os
 import json
+import heapq
 import datetime
+import itertools
+
+import numpy as np
 
 from global_methods import *
+from persona.memory_structures.embedding_store import *
+from persona.memory_structures.embedding_matrix import *
+from persona.memory_structures.embedding_storage import *
+from persona.memory_structures.newest_first_list import *
+from persona.memory_structures.node_columns import *
+from persona.memory_structures.ann_index import *
+from persona.memory_structures.recency_index import *
+from persona.memory_structures.time_index import *
+from persona.memory_structures.retrieval_cache import *
+from persona.memory_structures.memory_archive import *
+
+# <nodes_log_compact_min> 是触发压缩前日志中至少要积累的节点数。日志中的
+# 节点数同时超过它和检查点中的节点数时，save() 会重写 nodes.json。
+nodes_log_compact_min = 1000
+
+
+def read_nodes_log(folder): 
+  """
+  读取 <folder> 中 nodes_log.jsonl 记录的节点。
+
+  输入: 
+    folder: associative_memory 文件夹
+  输出: 
+    (节点字典列表, 日志是否完整)。上次写入中断时，最后一行可能不完整，
+    此时它会被忽略，并返回 False，以便下一次保存时压缩日志。
+  """
+  if not os.path.exists(folder + "/nodes_log.jsonl"): 
+    return [], True
+
+  nodes = []
+  with open(folder + "/nodes_log.jsonl") as f: 
+    for line in f: 
+      if not line.strip(): 
+        continue
+      try: 
+        nodes += [json.loads(line)]
+      except ValueError: 
+        return nodes, False
+  return nodes, True
+
 
 # 概念节点类，定义相关字段
+# 节点数量很多，因此使用 __slots__ 以省去每个实例的 __dict__；type、depth、
+# created、last_accessed、poignancy 保存在 NodeColumns 的对应行中，
+# 通过同名属性读写。
 class ConceptNode: 
+  __slots__ = ["node_id", "node_count", "type_count", "expiration", 
+               "subject", "predicate", "object", 
+               "description", "embedding_key", "keywords", "filling", 
+               "columns", "row"]
+
   def __init__(self,
                node_id, node_count, type_count, node_type, depth,
                created, expiration, 
                s, p, o, 
-               description, embedding_key, poignancy, keywords, filling): 
+               description, embedding_key, poignancy, keywords, filling, 
+               columns=None): 
+    # === 列存储中的位置 ===
+    # 未指定 <columns> 时，节点使用自己独立的列存储。
+    if columns is None: 
+      columns = NodeColumns(capacity=1)
+    self.columns = columns
+    self.row = columns.append(node_type, depth, created, poignancy)
+
     # === 节点标识信息 ===
     self.node_id = node_id           # 唯一ID: "node_1", "node_2"...
     self.node_count = node_count     # 全局节点计数器
     self.type_count = type_count     # 同类型节点计数器
-    self.type = node_type           # 节点类型: "event"/"thought"/"chat"
-    self.depth = depth              # 抽象层级: 0=原始观察, 1+=反思层级
+    # type: 节点类型 "event"/"thought"/"chat"（列存储）
+    # depth: 抽象层级 0=原始观察, 1+=反思层级（列存储）
 
     # === 时间属性 ===
-    self.created = created          # 创建时间(datetime对象)
+    # created: 创建时间（列存储，读取时为 datetime 对象）
+    # last_accessed: 最后访问时间，用于时近性计算（列存储）
     self.expiration = expiration    # 过期时间(可选，用于临时记忆)
-    self.last_accessed = self.created  # 最后访问时间(用于时近性计算)
 
     # === SPO三元组结构 (主语-谓语-宾语) ===
-    self.subject = s                # 主语: 谁/什么
-    self.predicate = p              # 谓语: 做什么/是什么状态
-    self.object = o                 # 宾语: 对什么/在哪里
+    # 同样的主语、谓语、宾语在大量节点中重复出现，驻留后只保存一份。
+    self.subject = intern_str(s)        # 主语: 谁/什么
+    self.predicate = intern_str(p)      # 谓语: 做什么/是什么状态
+    self.object = intern_str(o)         # 宾语: 对什么/在哪里
 
     # === 内容和元数据 ===
     self.description = description   # 人类可读的描述文本
     self.embedding_key = embedding_key  # 向量嵌入的键名
-    self.poignancy = poignancy      # 重要性/情感强度评分(1-10)
-    self.keywords = keywords        # 关键词集合(用于快速检索)
+    # poignancy: 重要性/情感强度评分(1-10)（列存储）
+    self.keywords = set(intern_str(i) for i in keywords)  # 关键词集合(用于快速检索)
     self.filling = filling          # 填充信息(用于思考节点的支撑证据)
 
+  @property
+  def type(self): 
+    return node_type_names[self.columns.type[self.row]]
+
+  @property
+  def depth(self): 
+    return int(self.columns.depth[self.row])
+
+  @property
+  def created(self): 
+    return seconds_to_datetime(self.columns.created[self.row])
+
+  @property
+  def last_accessed(self): 
+    return seconds_to_datetime(self.columns.last_accessed[self.row])
+
+  @last_accessed.setter
+  def last_accessed(self, value): 
+    self.columns.last_accessed[self.row] = datetime_to_seconds(value)
+
+  @property
+  def poignancy(self): 
+    poignancy = float(self.columns.poignancy[self.row])
+    if poignancy.is_integer(): 
+      return int(poignancy)
+    return poignancy
+
   # 返回对象的SPO三元组
   def spo_summary(self): 
     return (self.subject, self.predicate, self.object)
 
+# 驻留字符串；非字符串的值原样返回
+def intern_str(value): 
+  if type(value) == str: 
+    return sys.intern(value)
+  return value
+
+
 # 联想记忆类，定义相关字段
 class AssociativeMemory: 
   def __init__(self, f_saved): 
+    # === 节点数值属性的列存储 ===
+    # 每个节点在 <node_columns> 中占一行（见 ConceptNode.row）。
+    self.node_columns = NodeColumns()
+
     # === 初始化空字典，用于存储节点ID到节点的映射表 ===
     self.id_to_node = dict()        # ID到节点的映射表 {"node_1": ConceptNode, ...}
 
+    # === 节点计数器 ===
+    # 节点被归档后会从 id_to_node 和各序列中移出，因此节点 ID 和类型计数
+    # 不能再由它们的长度得出。<n_nodes> 是已分配的最大节点计数。
+    self.n_nodes = 0
+    self.type_counts = {"event": 0, "chat": 0, "thought": 0}
+
     # === 按类型分类的时序列表 (最新的在前) ===
-    self.seq_event = []             # 事件序列 [newest_event, ..., oldest_event]
-    self.seq_thought = []           # 思考序列 [newest_thought, ..., oldest_thought]  
-    self.seq_chat = []              # 对话序列 [newest_chat, ..., oldest_chat]
+    # NewestFirstList 在末尾追加存储，插入为 O(1)，读取顺序仍为最新在前。
+    self.seq_event = NewestFirstList()    # 事件序列 [newest_event, ..., oldest_event]
+    self.seq_thought = NewestFirstList()  # 思考序列 [newest_thought, ..., oldest_thought]  
+    self.seq_chat = NewestFirstList()     # 对话序列 [newest_chat, ..., oldest_chat]
+
+    # === 时近性索引 ===
+    # 非 idle 的事件和思考节点按最近访问从旧到新排列（见 recency_index.py），
+    # 检索时无需再按 last_accessed 排序。
+    self.recency_index = RecencyIndex(self.node_columns)
+
+    # === 检索结果缓存 ===
+    # <version> 在加入事件或思考节点时加一；检索缓存只使用当前版本的结果
+    # （见 retrieval_cache.py）。
+    self.version = 0
+    self.retrieval_cache = RetrievalCache()
+
+    # === 最近事件的 SPO 摘要 ===
+    # <latest_spo> 是最新 <latest_window> 个事件的 (s, p, o) -> 出现次数，
+    # 随 add_event 增量维护，供 perceive 的去重检查使用（见 
+    # has_latest_event）。<latest_window> 为 None 表示尚未建立。
+    self.latest_window = None
+    self.latest_spo = dict()
+
+    # === 过期与冷存储 ===
+    # <expiry_heap> 是 (过期时间, 节点计数, node_id) 的最小堆；过期或低分的
+    # 节点由 archive_memories() 移入冷存储 <archive>（见 memory_archive.py）。
+    self.expiry_heap = []
+    self.archive = MemoryArchive(f_saved)
+    self.archive_swept = None
 
     # === 关键词倒排索引 (用于快速检索) ===
     self.kw_to_event = dict()       # 关键词->事件节点列表 {"sleep": [node1, node2]}
     self.kw_to_thought = dict()     # 关键词->思考节点列表  
     self.kw_to_chat = dict()        # 关键词->对话节点列表
 
+    # === 按创建时间排序的索引 (见 time_index.py) ===
+    # <time_index>: 节点类型 -> 该类型节点的 TimeIndex，用于 query_nodes。
+    # <partner_to_chat>: 对话伙伴姓名（对话节点的 object）-> 与其的对话节点
+    # 的 TimeIndex，用于 get_last_chat 和 get_chats_with。
+    self.time_index = {"event": TimeIndex(), "chat": TimeIndex(), 
+                       "thought": TimeIndex()}
+    self.partner_to_chat = dict()
+
     # === 关键词统计强度 (用于重要性计算) ===
     self.kw_strength_event = dict()   # 事件中关键词出现频次 {"sleep": 5}
     self.kw_strength_thought = dict() # 思考中关键词出现频次
 
     # === 语义向量嵌入库 ===
-    self.embeddings = json.load(open(f_saved + "/embeddings.json"))
+    # 向量登记在全局的 embedding_store 中，这里只保存对它的引用，
+    # 以免相同的嵌入在多个智能体之间重复占用内存。
+    # 如果存在二进制格式（见 embedding_storage.py），则以内存映射方式加载，
+    # 否则加载 embeddings.json。<embedding_format> 决定保存时使用的格式。
+    self.embeddings = dict()
+    if has_binary_embeddings(f_saved): 
+      self.embedding_format = "binary"
+      embeddings_load = load_binary_embeddings(f_saved)
+    else: 
+      self.embedding_format = "json"
+      embeddings_load = json.load(open(f_saved + "/embeddings.json"))
+    for key, embedding in embeddings_load.items():
+      self.store_embedding(key, embedding)
+
+    # === 检索用的嵌入矩阵 ===
+    # 事件和思考节点的嵌入按行保存在归一化的 float32 矩阵中，
+    # <node_to_row> 记录每个节点对应的行。
+    self.embedding_matrix = EmbeddingMatrix()
+    self.node_to_row = dict()
+    # 可选的近似最近邻索引（见 ann_index.py），新增的行在查询时增量分配。
+    self.ann_index = None
+    if ann_index_enabled: 
+      self.enable_ann_index()
 
     # === 从保存的JSON文件加载现有记忆 ===
+    # nodes.json 是最近一次的检查点，nodes_log.jsonl 按顺序记录检查点之后
+    # 新增的节点（见 save()）。依次重放两者即可恢复内存中的状态。
+    # 已归档的节点不再加载（它们可能仍在检查点或日志中）。
     nodes_load = json.load(open(f_saved + "/nodes.json"))
-    for count in range(len(nodes_load.keys())): 
-      node_id = f"node_{str(count+1)}"
-      node_details = nodes_load[node_id]
-
-      # 提取节点基本信息
-      node_count = node_details["node_count"]
-      type_count = node_details["type_count"] 
-      node_type = node_details["type"]
-      depth = node_details["depth"]
-
-      # 解析时间信息
-      created = datetime.datetime.strptime(node_details["created"], 
-                                           '%Y-%m-%d %H:%M:%S')
-      expiration = None
-      if node_details["expiration"]: 
-        expiration = datetime.datetime.strptime(node_details["expiration"],
-                                                '%Y-%m-%d %H:%M:%S')
-
-      # 提取SPO三元组
-      s = node_details["subject"]      # 主语
-      p = node_details["predicate"]    # 谓语  
-      o = node_details["object"]       # 宾语
-
-      # 提取描述和元数据
-      description = node_details["description"]
-      embedding_pair = (node_details["embedding_key"], 
-                        self.embeddings[node_details["embedding_key"]])
-      poignancy = node_details["poignancy"]    # 重要性评分
-      keywords = set(node_details["keywords"])  # 关键词集合
-      filling = node_details["filling"]        # 填充信息
-      
-      # 根据节点类型调用相应的添加方法，重建内存中的索引结构
-      if node_type == "event": 
-        self.add_event(created, expiration, s, p, o, 
-                   description, keywords, poignancy, embedding_pair, filling)
-      elif node_type == "chat": 
-        self.add_chat(created, expiration, s, p, o, 
-                   description, keywords, poignancy, embedding_pair, filling)
-      elif node_type == "thought": 
-        self.add_thought(created, expiration, s, p, o, 
-                   description, keywords, poignancy, embedding_pair, filling)
+    for node_details in sorted(nodes_load.values(), 
+                               key=lambda x: x["node_count"]): 
+      if f"node_{node_details['node_count']}" not in self.archive: 
+        self.load_node(node_details)
+
+    log_load, log_intact = read_nodes_log(f_saved)
+    for node_details in log_load: 
+      # 检查点写入后、日志清空前中断时，日志中的节点可能已在检查点中。
+      if (node_details["node_id"] not in self.id_to_node
+          and node_details["node_id"] not in self.archive): 
+        self.load_node(node_details)
+
+    # 新节点的计数要大于所有已归档节点的计数。
+    self.n_nodes = max(self.n_nodes, self.archive.max_counts["node"])
+    for node_type in self.type_counts: 
+      self.type_counts[node_type] = max(self.type_counts[node_type], 
+                                        self.archive.max_counts[node_type])
+    # 只被已归档节点使用的嵌入不留在内存中。
+    used_keys = set(i.embedding_key for i in self.id_to_node.values())
+    for key in set(self.archive.id_to_key.values()) - used_keys: 
+      self.drop_embedding(key)
+
+    # <nodes_saved> 记录节点已保存到哪个文件夹、共保存了多少个节点、其中
+    # 多少个在检查点中，以及日志是否完整。save() 据此只追加新节点。
+    self.nodes_saved = {"folder": os.path.abspath(f_saved), 
+                        "count": self.n_nodes, 
+                        "checkpoint": max([i["node_count"] 
+                                           for i in nodes_load.values()], 
+                                          default=0), 
+                        "intact": log_intact}
 
     # === 加载关键词强度统计数据 ===
     kw_strength_load = json.load(open(f_saved + "/kw_strength.json"))
@@ -121,42 +275,44 @@ class AssociativeMemory:
   # 将记忆数据保存到JSON文件
   def save(self, out_json): 
 
-    # === 保存所有记忆节点到 nodes.json ===
-    r = dict()
-    # 注意：这里倒序遍历是为了保持节点ID的顺序性
-    for count in range(len(self.id_to_node.keys()), 0, -1): 
-      node_id = f"node_{str(count)}" # f""实现拼接，将数字转换为字符串，并添加前缀 "node_"
-      node = self.id_to_node[node_id]
-
-      # 序列化单个节点的所有属性
-      r[node_id] = dict()
-      r[node_id]["node_count"] = node.node_count
-      r[node_id]["type_count"] = node.type_count
-      r[node_id]["type"] = node.type
-      r[node_id]["depth"] = node.depth
-
-      # 时间格式化为字符串
-      r[node_id]["created"] = node.created.strftime('%Y-%m-%d %H:%M:%S')
-      r[node_id]["expiration"] = None
-      if node.expiration: 
-        r[node_id]["expiration"] = (node.expiration
-                                        .strftime('%Y-%m-%d %H:%M:%S'))
-
-      # SPO三元组
-      r[node_id]["subject"] = node.subject
-      r[node_id]["predicate"] = node.predicate
-      r[node_id]["object"] = node.object
-
-      # 内容和元数据
-      r[node_id]["description"] = node.description
-      r[node_id]["embedding_key"] = node.embedding_key
-      r[node_id]["poignancy"] = node.poignancy
-      r[node_id]["keywords"] = list(node.keywords)  # 集合转为列表
-      r[node_id]["filling"] = node.filling
-
-    # 写入节点文件
-    with open(out_json+"/nodes.json", "w") as outfile:
-      json.dump(r, outfile)
+    # === 保存记忆节点 ===
+    # 通常只将上次保存之后新增的节点追加到 nodes_log.jsonl。当日志比检查点
+    # 还长（且超过 nodes_log_compact_min）、保存到新的文件夹或日志不完整时，
+    # 则压缩：将所有节点重写到 nodes.json 并清空日志。已归档的节点先写入
+    # 冷存储，不再写入 nodes.json 和日志。
+    self.archive.save(out_json)
+    n_nodes = self.n_nodes
+    saved = self.nodes_saved
+    n_logged = n_nodes - saved["checkpoint"]
+    if (saved["folder"] != os.path.abspath(out_json) 
+        or not saved["intact"] 
+        or n_logged > max(nodes_log_compact_min, saved["checkpoint"])): 
+      r = dict()
+      # 注意：这里倒序遍历是为了保持节点ID的顺序性
+      for count in range(n_nodes, 0, -1): 
+        node_id = f"node_{str(count)}" # f""实现拼接，将数字转换为字符串，并添加前缀 "node_"
+        if node_id in self.id_to_node: 
+          r[node_id] = self.node_details(self.id_to_node[node_id])
+
+      # 先写入检查点，再清空日志
+      with open(out_json+"/nodes.json.tmp", "w") as outfile:
+        json.dump(r, outfile)
+      os.replace(out_json+"/nodes.json.tmp", out_json+"/nodes.json")
+      open(out_json+"/nodes_log.jsonl", "w").close()
+      self.nodes_saved = {"folder": os.path.abspath(out_json), 
+                          "count": n_nodes, 
+                          "checkpoint": n_nodes, 
+                          "intact": True}
+    else: 
+      with open(out_json+"/nodes_log.jsonl", "a") as outfile:
+        for count in range(saved["count"] + 1, n_nodes + 1): 
+          node_id = f"node_{str(count)}"
+          if node_id not in self.id_to_node: 
+            continue
+          node_details = self.node_details(self.id_to_node[node_id])
+          node_details["node_id"] = node_id
+          outfile.write(json.dumps(node_details) + "\n")
+      saved["count"] = n_nodes
 
     # === 保存关键词强度统计到 kw_strength.json ===
     r = dict()
@@ -165,9 +321,284 @@ class AssociativeMemory:
     with open(out_json+"/kw_strength.json", "w") as outfile:
       json.dump(r, outfile)
 
-    # === 保存向量嵌入到 embeddings.json ===
-    with open(out_json+"/embeddings.json", "w") as outfile:
-      json.dump(self.embeddings, outfile)
+    # === 保存向量嵌入 ===
+    # 尚未取回的嵌入（PendingEmbedding）需要先解析为向量。
+    self.resolve_embeddings()
+    if self.embedding_format == "binary" or has_binary_embeddings(out_json): 
+      # 二进制格式只追加新的行。
+      append_binary_embeddings(out_json, self.embeddings)
+    else: 
+      # 从其他智能体共享来的向量可能是 numpy 数组，需要转换为列表。
+      with open(out_json+"/embeddings.json", "w") as outfile:
+        json.dump(self.embeddings, outfile, default=lambda v: v.tolist())
+
+  # 从快照（见 persona_snapshot.py）加载后调用：记忆所在的文件夹改为 
+  # <f_saved>，嵌入重新登记到全局的 embedding_store 中
+  def restore(self, f_saved): 
+    self.nodes_saved["folder"] = os.path.abspath(f_saved)
+    self.archive.folder = os.path.abspath(f_saved) + "/archive"
+
+    packed = self.embeddings
+    if packed[0] == "binary": 
+      embeddings_load = load_binary_embeddings(f_saved)
+      self.embeddings = {key: embeddings_load[key] for key in packed[1] 
+                         if key in embeddings_load}
+    elif packed[0] == "packed": 
+      self.embeddings = dict(zip(packed[1], packed[2]))
+    else: 
+      self.embeddings = packed[1]
+    for key, embedding in self.embeddings.items(): 
+      self.embeddings[key] = embedding_store.intern(key, embedding, hold=True)
+    self.embedding_matrix.refill(self.embeddings)
+
+  # 将 <key> 的向量登记到全局的 embedding_store 中并保存其引用；本记忆
+  # 第一次持有该键时计为它的一个持有者。
+  def store_embedding(self, key, embedding): 
+    hold = key not in self.embeddings
+    self.embeddings[key] = embedding_store.intern(key, embedding, hold)
+
+  # 不再持有 <key> 的向量（见 EmbeddingStore.release）
+  def drop_embedding(self, key): 
+    if self.embeddings.pop(key, None) is not None: 
+      embedding_store.release([key])
+
+  # 快照中的嵌入：二进制格式的嵌入在 restore() 时重新以内存映射方式打开；
+  # 其余的嵌入合并为一个数组保存，比逐个保存大量小数组快得多。快照必须在
+  # save() 之后写入，这样二进制文件中已有所有的嵌入。
+  def __getstate__(self): 
+    state = dict(self.__dict__)
+    keys = list(self.embeddings)
+    vectors = [self.embeddings[key] for key in keys]
+    if self.embedding_format == "binary": 
+      state["embeddings"] = ("binary", keys)
+    elif len(set(len(i) for i in vectors)) == 1: 
+      if all(getattr(i, "dtype", None) == np.float32 for i in vectors): 
+        dtype = np.float32
+      else: 
+        dtype = np.float64
+      state["embeddings"] = ("packed", keys, np.array(vectors, dtype=dtype))
+    else: 
+      state["embeddings"] = ("dict", dict(self.embeddings))
+    return state
+
+  # 为嵌入矩阵启用近似最近邻索引；参数见 IVFIndex
+  def enable_ann_index(self, **kwargs): 
+    self.ann_index = IVFIndex(self.embedding_matrix, **kwargs)
+    return self.ann_index
+
+  # 将节点序列化为 nodes.json 中的字典
+  def node_details(self, node): 
+    r = dict()
+    r["node_count"] = node.node_count
+    r["type_count"] = node.type_count
+    r["type"] = node.type
+    r["depth"] = node.depth
+
+    # 时间格式化为字符串
+    r["created"] = node.created.strftime('%Y-%m-%d %H:%M:%S')
+    r["expiration"] = None
+    if node.expiration: 
+      r["expiration"] = node.expiration.strftime('%Y-%m-%d %H:%M:%S')
+
+    # SPO三元组
+    r["subject"] = node.subject
+    r["predicate"] = node.predicate
+    r["object"] = node.object
+
+    # 内容和元数据
+    r["description"] = node.description
+    r["embedding_key"] = node.embedding_key
+    r["poignancy"] = node.poignancy
+    r["keywords"] = list(node.keywords)  # 集合转为列表
+    r["filling"] = node.filling
+    return r
+
+  # 根据 nodes.json 中的字典重建节点
+  def load_node(self, node_details): 
+    # 提取节点基本信息
+    node_type = node_details["type"]
+
+    # 解析时间信息
+    created = datetime.datetime.strptime(node_details["created"], 
+                                         '%Y-%m-%d %H:%M:%S')
+    expiration = None
+    if node_details["expiration"]: 
+      expiration = datetime.datetime.strptime(node_details["expiration"],
+                                              '%Y-%m-%d %H:%M:%S')
+
+    # 提取SPO三元组
+    s = node_details["subject"]      # 主语
+    p = node_details["predicate"]    # 谓语  
+    o = node_details["object"]       # 宾语
+
+    # 提取描述和元数据
+    description = node_details["description"]
+    embedding_pair = (node_details["embedding_key"], 
+                      self.embeddings[node_details["embedding_key"]])
+    poignancy = node_details["poignancy"]    # 重要性评分
+    keywords = set(node_details["keywords"])  # 关键词集合
+    filling = node_details["filling"]        # 填充信息
+    
+    # 节点计数沿用保存时的值（归档会在计数中留下空缺）
+    self.n_nodes = node_details["node_count"] - 1
+    self.type_counts[node_type] = node_details["type_count"] - 1
+
+    # 根据节点类型调用相应的添加方法，重建内存中的索引结构
+    if node_type == "event": 
+      self.add_event(created, expiration, s, p, o, 
+                 description, keywords, poignancy, embedding_pair, filling)
+    elif node_type == "chat": 
+      self.add_chat(created, expiration, s, p, o, 
+                 description, keywords, poignancy, embedding_pair, filling)
+    elif node_type == "thought": 
+      self.add_thought(created, expiration, s, p, o, 
+                 description, keywords, poignancy, embedding_pair, filling)
+
+  # 将延迟获取的嵌入替换为实际向量
+  def resolve_embeddings(self): 
+    for key, embedding in self.embeddings.items(): 
+      if hasattr(embedding, "resolve"): 
+        self.embeddings[key] = embedding_store.intern(key, embedding.resolve())
+
+  # 将过期的节点（以及启用时的低分节点）移入冷存储，返回归档的节点数
+  def archive_memories(self, curr_time):
+    if not memory_archive_enabled:
+      return 0
+
+    nodes = []
+    now = datetime_to_seconds(curr_time)
+    while self.expiry_heap and self.expiry_heap[0][0] <= now:
+      node_id = heapq.heappop(self.expiry_heap)[2]
+      if node_id in self.id_to_node:
+        nodes += [self.id_to_node[node_id]]
+
+    # 低分节点：重要性低且长时间未被访问的事件和思考。
+    if (archive_max_poignancy is not None
+        and (self.archive_swept is None
+             or curr_time - self.archive_swept >= archive_sweep_interval)):
+      self.archive_swept = curr_time
+      candidates = [i for i in self.seq_event + self.seq_thought]
+      if candidates:
+        rows = np.array([i.row for i in candidates])
+        columns = self.node_columns
+        low = ((columns.poignancy[rows] <= archive_max_poignancy)
+               & (columns.last_accessed[rows]
+                  <= now - archive_idle_days * 86400))
+        nodes += [candidates[i] for i in np.flatnonzero(low)]
+
+    return self.archive_nodes(nodes)
+
+  # 将 <nodes> 从内存中的各个索引移入冷存储，返回归档的节点数
+  def archive_nodes(self, nodes):
+    nodes = list({i.node_id: i for i in nodes
+                  if i.node_id in self.id_to_node}.values())
+    if not nodes:
+      return 0
+
+    for node in nodes:
+      node_details = self.node_details(node)
+      node_details["node_id"] = node.node_id
+      self.archive.add(node_details, self.embeddings.get(node.embedding_key))
+      del self.id_to_node[node.node_id]
+      self.node_to_row.pop(node.node_id, None)
+      self.recency_index.remove(node)
+
+    # 从时序列表和关键词倒排索引中一次性删除。
+    removed = set(nodes)
+    seqs = {"event": self.seq_event, "chat": self.seq_chat,
+            "thought": self.seq_thought}
+    kw_to = {"event": self.kw_to_event, "chat": self.kw_to_chat,
+             "thought": self.kw_to_thought}
+    postings = set()
+    for node in nodes:
+      for kw in node.keywords:
+        postings.add((node.type, kw.lower()))
+    for node_type in set(i.type for i in nodes):
+      seqs[node_type].remove_all(removed)
+      self.time_index[node_type].remove_all(removed)
+    if "event" in set(i.type for i in nodes):
+      # 最近事件窗口在下一次查询时重建。
+      self.latest_window = None
+    for partner in set(i.object for i in nodes if i.type == "chat"):
+      self.partner_to_chat[partner].remove_all(removed)
+      if not self.partner_to_chat[partner]:
+        del self.partner_to_chat[partner]
+    for node_type, kw in postings:
+      if kw in kw_to[node_type]:
+        kw_to[node_type][kw].remove_all(removed)
+        if not kw_to[node_type][kw]:
+          del kw_to[node_type][kw]
+
+    # 只被已归档节点使用的嵌入不再留在内存中；嵌入矩阵中无用的行超过
+    # 三分之一时重建矩阵。
+    used_keys = set(i.embedding_key for i in self.id_to_node.values())
+    for node in nodes:
+      if node.embedding_key not in used_keys:
+        self.drop_embedding(node.embedding_key)
+    if self.embedding_matrix.n_rows > 1.5 * max(64, len(self.node_to_row)):
+      self.compact_embedding_matrix()
+
+    self.version += 1
+    return len(nodes)
+
+  # 只用仍在内存中的事件和思考节点重建嵌入矩阵（以及近似最近邻索引）
+  def compact_embedding_matrix(self):
+    matrix = EmbeddingMatrix(dtype=self.embedding_matrix.dtype)
+    node_to_row = dict()
+    for node_id in self.node_to_row:
+      key = self.id_to_node[node_id].embedding_key
+      node_to_row[node_id] = matrix.row_for(key, self.embeddings[key])
+    self.embedding_matrix = matrix
+    self.node_to_row = node_to_row
+    if self.ann_index is not None:
+      self.ann_index.reset(matrix)
+
+  # 按关键词、类型和创建时间查询冷存储，返回节点对象列表（最新的在前）
+  def retrieve_archived(self, keywords=None, node_type=None,
+                        start=None, end=None):
+    return self.archived_nodes(
+             self.archive.search(keywords, node_type, start, end))
+
+  # 返回冷存储中嵌入与 <embedding> 最相似的 <n> 个节点对象
+  def retrieve_archived_similar(self, embedding, n=10, node_type=None):
+    return self.archived_nodes(
+             self.archive.search_similar(embedding, n, node_type))
+
+  # 将冷存储返回的节点字典转换为 ConceptNode（使用单独的列存储，
+  # 不会加入内存中的索引）
+  def archived_nodes(self, details_list):
+    columns = NodeColumns(capacity=max(1, len(details_list)))
+    nodes = []
+    for node_details in details_list:
+      created = datetime.datetime.strptime(node_details["created"],
+                                           '%Y-%m-%d %H:%M:%S')
+      expiration = None
+      if node_details["expiration"]:
+        expiration = datetime.datetime.strptime(node_details["expiration"],
+                                                '%Y-%m-%d %H:%M:%S')
+      nodes += [ConceptNode(node_details["node_id"],
+                            node_details["node_count"],
+                            node_details["type_count"],
+                            node_details["type"], node_details["depth"],
+                            created, expiration,
+                            node_details["subject"],
+                            node_details["predicate"],
+                            node_details["object"],
+                            node_details["description"],
+                            node_details["embedding_key"],
+                            node_details["poignancy"],
+                            set(node_details["keywords"]),
+                            node_details["filling"], columns)]
+    return nodes
+
+  # 更新节点计数，并登记节点的过期时间
+  def _track_node(self, node):
+    self.n_nodes = node.node_count
+    self.type_counts[node.type] = node.type_count
+    if node.expiration: 
+      heapq.heappush(self.expiry_heap, 
+                     (datetime_to_seconds(node.expiration), 
+                      node.node_count, node.node_id))
 
   # 添加事件节点
   def add_event(self, created, expiration, s, p, o, 
@@ -175,8 +606,8 @@ class AssociativeMemory:
                       embedding_pair, filling):
 
     # === 设置节点标识和类型信息 ===
-    node_count = len(self.id_to_node.keys()) + 1  # 全局节点计数器
-    type_count = len(self.seq_event) + 1           # 事件节点计数器
+    node_count = self.n_nodes + 1                 # 全局节点计数器
+    type_count = self.type_counts["event"] + 1    # 事件节点计数器
     node_type = "event"
     node_id = f"node_{str(node_count)}"
     depth = 0  # 事件节点始终为原始观察层级
@@ -193,23 +624,36 @@ class AssociativeMemory:
                        created, expiration, 
                        s, p, o, 
                        description, embedding_pair[0], 
-                       poignancy, keywords, filling)
+                       poignancy, keywords, filling, self.node_columns)
 
     # === 更新各种索引结构（插入到列表头部，保持时序） ===
-    # 由于左闭右开，这个切片本身是空的，当对这个 “空切片” 赋值时，
-    # Python 会把新元素插入到这个切片的位置，也就是开头
-    self.seq_event[0:0] = [node]  # 将新事件插入到事件序列的开头
+    # NewestFirstList.prepend 在内部追加，对外等价于插入到开头
+    self.seq_event.prepend(node)  # 将新事件插入到事件序列的开头
+    self.time_index["event"].add(node, created)
+
+    # 新事件进入最近事件窗口，第 <latest_window> 新的事件移出窗口。
+    if self.latest_window is not None: 
+      spo = node.spo_summary()
+      self.latest_spo[spo] = self.latest_spo.get(spo, 0) + 1
+      if len(self.seq_event) > self.latest_window: 
+        spo = self.seq_event[self.latest_window].spo_summary()
+        self.latest_spo[spo] -= 1
+        if not self.latest_spo[spo]: 
+          del self.latest_spo[spo]
     
     # 更新关键词倒排索引（关键词转小写以统一检索）
     keywords = [i.lower() for i in keywords]
     for kw in keywords: 
       if kw in self.kw_to_event: 
-        self.kw_to_event[kw][0:0] = [node]  # 插入到该关键词对应列表的开头
+        self.kw_to_event[kw].prepend(node)  # 插入到该关键词对应列表的开头
       else: 
-        self.kw_to_event[kw] = [node]       # 创建新的关键词条目
+        self.kw_to_event[kw] = NewestFirstList([node])  # 创建新的关键词条目
     
     # 更新ID映射表
     self.id_to_node[node_id] = node 
+    self._track_node(node)
+    self.recency_index.add(node)
+    self.version += 1
 
     # === 更新关键词强度统计（排除idle状态） ===
     if f"{p} {o}" != "is idle":   # 过滤掉无意义的idle状态
@@ -220,7 +664,10 @@ class AssociativeMemory:
           self.kw_strength_event[kw] = 1     # 初始化新关键词计数
 
     # === 存储向量嵌入数据 ===
-    self.embeddings[embedding_pair[0]] = embedding_pair[1]
+    self.store_embedding(*embedding_pair)
+    self.node_to_row[node_id] = self.embedding_matrix.row_for(
+                                  embedding_pair[0], 
+                                  self.embeddings[embedding_pair[0]])
 
     return node
 
@@ -229,8 +676,8 @@ class AssociativeMemory:
                         description, keywords, poignancy, 
                         embedding_pair, filling):
     # 设置节点 ID 和计数。
-    node_count = len(self.id_to_node.keys()) + 1
-    type_count = len(self.seq_thought) + 1
+    node_count = self.n_nodes + 1
+    type_count = self.type_counts["thought"] + 1
     node_type = "thought"
     node_id = f"node_{str(node_count)}"
     depth = 1 
@@ -244,17 +691,22 @@ class AssociativeMemory:
     node = ConceptNode(node_id, node_count, type_count, node_type, depth,
                        created, expiration, 
                        s, p, o, 
-                       description, embedding_pair[0], poignancy, keywords, filling)
+                       description, embedding_pair[0], poignancy, keywords, filling, 
+                       self.node_columns)
 
     # 创建各种字典缓存以便快速访问。
-    self.seq_thought[0:0] = [node]
+    self.seq_thought.prepend(node)
+    self.time_index["thought"].add(node, created)
     keywords = [i.lower() for i in keywords]
     for kw in keywords: 
       if kw in self.kw_to_thought: 
-        self.kw_to_thought[kw][0:0] = [node]
+        self.kw_to_thought[kw].prepend(node)
       else: 
-        self.kw_to_thought[kw] = [node]
+        self.kw_to_thought[kw] = NewestFirstList([node])
     self.id_to_node[node_id] = node 
+    self._track_node(node)
+    self.recency_index.add(node)
+    self.version += 1
 
     # 添加关键词强度
     if f"{p} {o}" != "is idle":  
@@ -264,7 +716,10 @@ class AssociativeMemory:
         else: 
           self.kw_strength_thought[kw] = 1
 
-    self.embeddings[embedding_pair[0]] = embedding_pair[1]
+    self.store_embedding(*embedding_pair)
+    self.node_to_row[node_id] = self.embedding_matrix.row_for(
+                                  embedding_pair[0], 
+                                  self.embeddings[embedding_pair[0]])
 
     return node
 
@@ -274,8 +729,8 @@ class AssociativeMemory:
                      embedding_pair, filling): 
 
     # 设置节点ID和计数。
-    node_count = len(self.id_to_node.keys()) + 1
-    type_count = len(self.seq_chat) + 1
+    node_count = self.n_nodes + 1
+    type_count = self.type_counts["chat"] + 1
     node_type = "chat"
     node_id = f"node_{str(node_count)}"
     depth = 0
@@ -284,25 +739,29 @@ class AssociativeMemory:
     node = ConceptNode(node_id, node_count, type_count, node_type, depth,
                        created, expiration, 
                        s, p, o, 
-                       description, embedding_pair[0], poignancy, keywords, filling)
+                       description, embedding_pair[0], poignancy, keywords, filling, 
+                       self.node_columns)
 
     # 创建各种字典缓存以实现快速访问。
     # 将新聊天事件添加到聊天序列的开头（最近的在前面）。
-    self.seq_chat[0:0] = [node]
+    self.seq_chat.prepend(node)
+    self.time_index["chat"].add(node, created)
     # 将关键词转换为小写。
     keywords = [i.lower() for i in keywords]
     for kw in keywords: 
       # 如果关键词已存在，则将新节点添加到对应关键词的聊天事件列表开头。
       if kw in self.kw_to_chat: 
-        self.kw_to_chat[kw][0:0] = [node]
+        self.kw_to_chat[kw].prepend(node)
       # 否则，创建一个新的关键词条目。
       else: 
-        self.kw_to_chat[kw] = [node]
+        self.kw_to_chat[kw] = NewestFirstList([node])
+    self.partner_to_chat.setdefault(o, TimeIndex()).add(node, created)
     # 将新节点添加到ID到节点映射中。
     self.id_to_node[node_id] = node 
+    self._track_node(node)
 
     # 存储嵌入向量。
-    self.embeddings[embedding_pair[0]] = embedding_pair[1]
+    self.store_embedding(*embedding_pair)
         
     return node
 
@@ -315,6 +774,26 @@ class AssociativeMemory:
       ret_set.add(e_node.spo_summary())
     return ret_set
 
+  def has_latest_event(self, spo, retention): 
+    """
+    返回 (s, p, o) 三元组 <spo> 是否在最新的 <retention> 个事件中，等价于
+    spo in self.get_summarized_latest_events(retention)，但不必每次重建
+    集合。
+
+    输入:
+      spo: (s, p, o) 三元组
+      retention: 最近事件窗口的大小
+    输出:
+      True 或 False
+    """
+    if retention != self.latest_window: 
+      self.latest_window = retention
+      self.latest_spo = dict()
+      for e_node in self.seq_event[:retention]: 
+        spo_summary = e_node.spo_summary()
+        self.latest_spo[spo_summary] = self.latest_spo.get(spo_summary, 0) + 1
+    return spo in self.latest_spo
+
   # 获取事件序列的字符串表示
   # 返回值示例：
   # Event 1: (Isabella, is cooking, kitchen) -- Isabella is cooking in the kitchen
@@ -409,13 +888,66 @@ class AssociativeMemory:
 
   def get_last_chat(self, target_persona_name): 
 
-    if target_persona_name.lower() in self.kw_to_chat: 
-      # 返回该智能体对话列表中的第一个（最新的）
-      return self.kw_to_chat[target_persona_name.lower()][0]
+    if target_persona_name in self.partner_to_chat: 
+      # 返回与该智能体的最新一次对话
+      return self.partner_to_chat[target_persona_name].latest()
     else: 
       return False  # 没有找到相关对话记录
 
 
+  def get_chats_with(self, target_persona_name, start=None, end=None): 
+    """
+    返回与 <target_persona_name> 的对话节点中创建时间在 [start, end] 之内的
+    节点，最新的在前。
+
+    输入:
+      target_persona_name: 对话伙伴的姓名
+      start, end: 创建时间的范围（datetime，None 表示不限）
+    输出:
+      对话节点列表
+    """
+    if target_persona_name not in self.partner_to_chat: 
+      return []
+    return [node for _, node in 
+            self.partner_to_chat[target_persona_name].newest_first(start, end)]
+
+
+  def query_nodes(self, node_type=None, start=None, end=None, 
+                  keywords=None, limit=None): 
+    """
+    按节点类型、创建时间范围和关键词查询记忆节点。只访问时间范围内的
+    节点；已归档的节点不在其中（见 retrieve_archived）。
+
+    输入:
+      node_type: "event"、"chat"、"thought" 或它们的列表（None 表示全部）
+      start, end: 创建时间的范围 [start, end]（datetime，None 表示不限）
+      keywords: 关键词列表，节点含有其中任意一个即可（不区分大小写，
+                None 表示不限）
+      limit: 最多返回的节点数（None 表示不限）
+    输出:
+      节点列表，最新的在前；创建时间相同的节点中后加入的在前
+    """
+    if node_type is None: 
+      node_type = ["event", "chat", "thought"]
+    elif isinstance(node_type, str): 
+      node_type = [node_type]
+
+    # 各类型的节点按 (创建时间, 节点计数) 从新到旧合并。
+    streams = [self.time_index[i].newest_first(start, end) for i in node_type]
+    if len(streams) == 1: 
+      nodes = (node for _, node in streams[0])
+    else: 
+      nodes = (node for _, node in heapq.merge(
+                 *streams, key=lambda x: (x[0], x[1].node_count), 
+                 reverse=True))
+
+    if keywords is not None: 
+      keywords = set(i.lower() for i in keywords)
+      nodes = (node for node in nodes 
+               if any(i.lower() in keywords for i in node.keywords))
+    return list(itertools.islice(nodes, limit))
+
+
 
 
 
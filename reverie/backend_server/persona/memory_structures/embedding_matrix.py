@@ -0,0 +1,242 @@
+"""
+文件: embedding_matrix.py
+描述: 定义 EmbeddingMatrix，将联想记忆中的嵌入保存为一个连续的、
+      预先归一化的矩阵，使检索时对所有节点的相关性计算变为一次
+      矩阵-向量乘法。
+
+矩阵可以按以下精度保存（<embedding_matrix_dtype>）:
+  "float32"  每维 4 字节（默认）
+  "float16"  每维 2 字节
+  "int8"     每维 1 字节，每行另存一个 float32 缩放系数
+
+矩阵的行是向量的第二份副本：向量本身由 embedding_store 在所有智能体之间
+共享（以列表传入的向量保存为 float64 数组，每维 8 字节），每个智能体的
+矩阵再为其每个键保存一行归一化的向量。float32 时行约为共享向量的一半大小，
+见 benchmarks/bench_embedding_memory.py。
+"""
+import numpy as np
+
+# <embedding_matrix_dtype> 是新建的 EmbeddingMatrix 默认使用的精度。
+embedding_matrix_dtype = "float32"
+
+embedding_dtypes = {"float32": np.float32,
+                    "float16": np.float16,
+                    "int8": np.int8}
+
+
+def quantize_rows(rows, dtype):
+  """
+  将 float32 矩阵 <rows> 转换为 <dtype> 精度。
+
+  输入:
+    rows: (行数 x 维度) 的 float32 矩阵
+    dtype: "float32"、"float16" 或 "int8"
+  输出:
+    (data, scale)。int8 时 scale 为每行的缩放系数，使 data * scale 近似
+    原矩阵；其他精度时 scale 为 None。
+  """
+  if dtype == "int8":
+    scale = np.abs(rows).max(axis=1) / 127
+    scale[scale == 0] = 1
+    data = np.round(rows / scale[:, None]).astype(np.int8)
+    return data, scale.astype(np.float32)
+  return rows.astype(embedding_dtypes[dtype]), None
+
+
+def dequantize_rows(data, scale=None):
+  """
+  quantize_rows 的逆操作，返回 float32 矩阵。
+  """
+  rows = data.astype(np.float32)
+  if scale is not None:
+    rows *= scale[:, None]
+  return rows
+
+
+# 嵌入矩阵类：每个嵌入键占一行，行向量已归一化为单位长度
+class EmbeddingMatrix:
+  def __init__(self, capacity=64, dtype=None):
+    self.dtype = dtype or embedding_matrix_dtype
+
+    # <rows> 在第一次得知向量维度时才分配；容量不足时按两倍扩容。
+    # int8 精度时，<scale> 保存每行的缩放系数。
+    self.rows = None
+    self.scale = None
+    self.capacity = capacity
+    self.n_rows = 0
+
+    # <key_to_row> 将嵌入键映射到它所在的行，相同的键共用一行。
+    self.key_to_row = dict()
+    # <unfilled> 保存已经分配行号但尚未写入矩阵的嵌入（向量或
+    # PendingEmbedding），在使用矩阵时才写入。
+    self.unfilled = dict()
+
+
+  def row_for(self, key, embedding):
+    """
+    返回嵌入键 <key> 所在的行；如果还没有，则为其分配新的一行。
+
+    输入:
+      key: 嵌入键（str）
+      embedding: 该键的向量（list）或 PendingEmbedding
+    输出:
+      行号（int）
+    """
+    if key in self.key_to_row:
+      return self.key_to_row[key]
+    row = self.n_rows
+    self.n_rows += 1
+    self.key_to_row[key] = row
+    self.unfilled[row] = embedding
+    return row
+
+
+  def _reserve(self, dim):
+    if self.rows is None:
+      self.capacity = max(self.capacity, self.n_rows)
+      self.rows = np.zeros((self.capacity, dim),
+                           dtype=embedding_dtypes[self.dtype])
+      if self.dtype == "int8":
+        self.scale = np.ones(self.capacity, dtype=np.float32)
+    elif self.n_rows > self.rows.shape[0]:
+      capacity = self.rows.shape[0]
+      while capacity < self.n_rows:
+        capacity *= 2
+      rows = np.zeros((capacity, self.rows.shape[1]), dtype=self.rows.dtype)
+      rows[:self.rows.shape[0]] = self.rows
+      self.rows = rows
+      if self.scale is not None:
+        scale = np.ones(capacity, dtype=np.float32)
+        scale[:self.scale.shape[0]] = self.scale
+        self.scale = scale
+    self.capacity = self.rows.shape[0]
+
+
+  def fill(self):
+    """
+    将所有尚未写入的嵌入归一化后写入矩阵（必要时先取回 PendingEmbedding）。
+    """
+    if not self.unfilled:
+      return
+    rows = sorted(self.unfilled)
+    vecs = []
+    for row in rows:
+      embedding = self.unfilled[row]
+      if hasattr(embedding, "resolve"):
+        embedding = embedding.resolve()
+      vecs += [normalize_embedding(embedding)]
+    vecs = np.stack(vecs)
+    self._reserve(vecs.shape[1])
+    data, scale = quantize_rows(vecs, self.dtype)
+    self.rows[rows] = data
+    if scale is not None:
+      self.scale[rows] = scale
+    self.unfilled = dict()
+
+
+  def __getstate__(self):
+    # 快照（见 persona_snapshot.py）中不保存矩阵的行，加载后由 refill()
+    # 根据嵌入重新写入。
+    state = dict(self.__dict__)
+    state["rows"] = None
+    state["scale"] = None
+    state["unfilled"] = dict()
+    return state
+
+
+  def refill(self, embeddings):
+    """
+    从快照加载后调用：将每个嵌入键的行标记为待写入（在下一次使用矩阵时
+    写入）。
+
+    输入:
+      embeddings: 字典，其键为嵌入键，值为向量
+    """
+    if self.rows is None:
+      self.unfilled = {row: embeddings[key]
+                       for key, row in self.key_to_row.items()
+                       if key in embeddings}
+
+
+  def take(self, rows):
+    """
+    返回 <rows>（行号数组）对应的 float32 矩阵。
+    """
+    self.fill()
+    if self.rows is None:
+      return np.zeros((0, 0), dtype=np.float32)
+    if self.dtype == "float32":
+      return self.rows[rows]
+    scale = None if self.scale is None else self.scale[rows]
+    return dequantize_rows(self.rows[rows], scale)
+
+
+  def dot(self, rows, focal_matrix):
+    """
+    返回 <rows> 对应的行与 <focal_matrix>（维度 x 焦点数，或一维向量）的
+    乘积，即这些行与各焦点的余弦相似度。
+    """
+    self.fill()
+    if self.dtype == "int8":
+      sims = self.rows[rows].astype(np.float32) @ focal_matrix
+      scale = self.scale[rows]
+      if sims.ndim == 2:
+        scale = scale[:, None]
+      return sims * scale
+    return self.take(rows) @ focal_matrix
+
+
+  def view(self, start=0, stop=None):
+    """
+    返回第 <start> 到 <stop> 行的 float32 矩阵（默认为全部已使用的行）。
+    float32 精度时不复制。
+    """
+    self.fill()
+    if self.rows is None:
+      return np.zeros((0, 0), dtype=np.float32)
+    if stop is None:
+      stop = self.n_rows
+    if self.dtype == "float32":
+      return self.rows[start:stop]
+    scale = None if self.scale is None else self.scale[start:stop]
+    return dequantize_rows(self.rows[start:stop], scale)
+
+
+  def astype(self, dtype):
+    """
+    返回一个以 <dtype> 精度保存相同行的新 EmbeddingMatrix。
+    """
+    matrix = EmbeddingMatrix(capacity=max(1, self.n_rows), dtype=dtype)
+    matrix.key_to_row = dict(self.key_to_row)
+    matrix.n_rows = self.n_rows
+    self.fill()
+    if self.rows is not None:
+      matrix._reserve(self.rows.shape[1])
+      for start in range(0, self.n_rows, 8192):
+        stop = min(self.n_rows, start + 8192)
+        data, scale = quantize_rows(self.view(start, stop), dtype)
+        matrix.rows[start:stop] = data
+        if scale is not None:
+          matrix.scale[start:stop] = scale
+    return matrix
+
+
+  def nbytes(self):
+    if self.rows is None:
+      return 0
+    n_bytes = self.n_rows * self.rows.shape[1] * self.rows.itemsize
+    if self.scale is not None:
+      n_bytes += self.n_rows * self.scale.itemsize
+    return n_bytes
+
+
+def normalize_embedding(embedding):
+  """
+  将单个向量转换为单位长度的 float32 数组，用于与 EmbeddingMatrix 的行
+  做点积。
+  """
+  vec = np.asarray(embedding, dtype=np.float32)
+  length = np.linalg.norm(vec)
+  if length > 0:
+    vec = vec / length
+  return vec
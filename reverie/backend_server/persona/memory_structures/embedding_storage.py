@@ -0,0 +1,249 @@
+"""
+文件: embedding_storage.py
+描述: 联想记忆嵌入的二进制存储格式。
+
+embeddings.json 在加载时需要把每个浮点数解析为 Python 对象，保存时又要
+整体重写。二进制格式将向量按行保存在原始二进制文件中，并以内存映射
+方式打开，加载时不再解析向量；保存时只追加新的行。
+
+一个 associative_memory 文件夹中的二进制格式由以下文件组成:
+  embeddings.f32          按行存放的向量（float16 时为 embeddings.f16，
+                          int8 时为 embeddings.i8）
+  embeddings_scale.f32    仅 int8：每行的 float32 缩放系数
+  embeddings_keys.jsonl   每行一个 JSON 字符串，第 i 行为第 i 个向量的键
+  embeddings_meta.json    {"dim": 向量维度, "dtype": 精度}
+
+用法（将已有模拟中的 embeddings.json 转换为二进制格式）:
+  python persona/memory_structures/embedding_storage.py <模拟或记忆文件夹> [float32|float16|int8]
+"""
+import os
+import sys
+import json
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "../.."))
+
+from persona.memory_structures.embedding_matrix import (embedding_dtypes,
+                                                        quantize_rows)
+
+# <embedding_storage_dtype> 是新建二进制文件使用的精度；已有的文件沿用
+# 其 embeddings_meta.json 中记录的精度。
+embedding_storage_dtype = "float32"
+
+embedding_rows_files = {"float32": "embeddings.f32",
+                        "float16": "embeddings.f16",
+                        "int8": "embeddings.i8"}
+embedding_scale_file = "embeddings_scale.f32"
+embedding_keys_file = "embeddings_keys.jsonl"
+embedding_meta_file = "embeddings_meta.json"
+
+
+# int8 文件中的一行：保留内存映射的 int8 行和它的缩放系数，只在使用时
+# 才还原为 float32 向量，因此加载 int8 文件不会在内存中复制整个矩阵。
+class QuantizedRow:
+  __slots__ = ("data", "scale")
+  dtype = np.dtype(np.float32)
+
+  def __init__(self, data, scale):
+    self.data = data
+    self.scale = scale
+
+  def __array__(self, dtype=None, copy=None):
+    vec = self.data.astype(np.float32) * np.float32(self.scale)
+    return vec if dtype is None else vec.astype(dtype)
+
+  def __len__(self):
+    return len(self.data)
+
+  def tolist(self):
+    return np.asarray(self).tolist()
+
+
+def has_binary_embeddings(folder):
+  return (os.path.exists(f"{folder}/{embedding_keys_file}")
+          and os.path.exists(f"{folder}/{embedding_meta_file}"))
+
+
+def _load_meta(folder):
+  meta = json.load(open(f"{folder}/{embedding_meta_file}"))
+  meta["dtype"] = meta.get("dtype", "float32")
+  return meta
+
+
+def _read_keys(folder):
+  """
+  返回 (键列表, 完整的行所占的字节数)。没有以换行符结尾的最后一行是被
+  中断的写入，不计入。
+  """
+  with open(f"{folder}/{embedding_keys_file}", "rb") as f:
+    data = f.read()
+  complete = data.rfind(b"\n") + 1
+  keys = [json.loads(line) for line in data[:complete].decode().splitlines()
+          if line.strip()]
+  return keys, complete
+
+
+def _load_keys(folder):
+  return _read_keys(folder)[0]
+
+
+def _repair(folder, meta):
+  """
+  截掉上一次保存中断时留下的不完整部分：键文件中不完整的最后一行，以及
+  向量（和缩放系数）文件中多于已保存键的行。返回已完整保存的键列表。
+  """
+  keys, complete = _read_keys(folder)
+  n_rows = len(keys)
+  rows_file = f"{folder}/{embedding_rows_files[meta['dtype']]}"
+  scale_file = f"{folder}/{embedding_scale_file}"
+  row_bytes = meta["dim"] * np.dtype(embedding_dtypes[meta["dtype"]]).itemsize
+  scale_bytes = np.dtype(np.float32).itemsize
+  if meta["dim"] and os.path.exists(rows_file):
+    n_rows = min(n_rows, os.path.getsize(rows_file) // row_bytes)
+    if meta["dtype"] == "int8":
+      n_rows = min(n_rows, os.path.getsize(scale_file) // scale_bytes)
+  elif meta["dim"]:
+    n_rows = 0
+
+  if n_rows < len(keys):
+    keys = keys[:n_rows]
+    with open(f"{folder}/{embedding_keys_file}", "w") as outfile:
+      for key in keys:
+        outfile.write(json.dumps(key) + "\n")
+  elif complete < os.path.getsize(f"{folder}/{embedding_keys_file}"):
+    os.truncate(f"{folder}/{embedding_keys_file}", complete)
+  if meta["dim"] and os.path.exists(rows_file):
+    os.truncate(rows_file, n_rows * row_bytes)
+    if meta["dtype"] == "int8":
+      os.truncate(scale_file, n_rows * scale_bytes)
+  return keys
+
+
+def load_binary_embeddings(folder):
+  """
+  以内存映射方式打开 <folder> 中的二进制嵌入。
+
+  输入:
+    folder: associative_memory 文件夹
+  输出:
+    字典，其键为嵌入键，值为内存映射矩阵中对应行的只读视图（float32 或
+    float16）。int8 文件的值为 QuantizedRow，在使用时才按缩放系数还原，
+    向量本身留在内存映射文件中。
+  """
+  meta = _load_meta(folder)
+  dim = meta["dim"]
+  dtype = embedding_dtypes[meta["dtype"]]
+  rows_file = f"{folder}/{embedding_rows_files[meta['dtype']]}"
+  keys = _load_keys(folder)
+  if dim == 0 or not os.path.exists(rows_file):
+    return dict()
+
+  # 如果上一次保存在写入键之前中断，矩阵中可能多出几行；
+  # 反之亦然。只使用两者都完整的部分。
+  row_bytes = dim * np.dtype(dtype).itemsize
+  n_rows = min(len(keys), os.path.getsize(rows_file) // row_bytes)
+  if meta["dtype"] == "int8":
+    n_rows = min(n_rows, os.path.getsize(f"{folder}/{embedding_scale_file}")
+                         // np.dtype(np.float32).itemsize)
+  if n_rows == 0:
+    return dict()
+
+  rows = np.memmap(rows_file, dtype=dtype, mode="r", shape=(n_rows, dim))
+  embeddings = dict()
+  if meta["dtype"] == "int8":
+    scale = np.fromfile(f"{folder}/{embedding_scale_file}", dtype=np.float32,
+                        count=n_rows)
+    for count in range(n_rows):
+      embeddings[keys[count]] = QuantizedRow(rows[count], scale[count])
+    return embeddings
+  for count in range(n_rows):
+    embeddings[keys[count]] = rows[count]
+  return embeddings
+
+
+def append_binary_embeddings(folder, embeddings, dtype=None):
+  """
+  将 <embeddings> 中尚未保存在 <folder> 的键追加到二进制文件中。已保存的
+  行不会被重写。
+
+  输入:
+    folder: associative_memory 文件夹
+    embeddings: 字典，其键为嵌入键，值为向量
+    dtype: 新建文件时使用的精度（默认为 embedding_storage_dtype）；
+           已有文件沿用原来的精度
+  输出:
+    追加的行数
+  """
+  if has_binary_embeddings(folder):
+    meta = _load_meta(folder)
+    dim, dtype = meta["dim"], meta["dtype"]
+    saved_keys = set(_repair(folder, meta))
+  else:
+    dim = None
+    dtype = dtype or embedding_storage_dtype
+    saved_keys = set()
+    files = [embedding_rows_files[dtype], embedding_keys_file]
+    if dtype == "int8":
+      files += [embedding_scale_file]
+    for f in files:
+      open(f"{folder}/{f}", "w").close()
+
+  new_keys = [key for key in embeddings if key not in saved_keys]
+  if not new_keys:
+    if dim is None:
+      with open(f"{folder}/{embedding_meta_file}", "w") as outfile:
+        json.dump({"dim": 0, "dtype": dtype}, outfile)
+    return 0
+
+  rows = np.stack([np.asarray(embeddings[key], dtype=np.float32)
+                   for key in new_keys])
+  if not dim:
+    dim = rows.shape[1]
+    with open(f"{folder}/{embedding_meta_file}", "w") as outfile:
+      json.dump({"dim": dim, "dtype": dtype}, outfile)
+  if rows.shape[1] != dim:
+    raise ValueError(f"embedding dimension {rows.shape[1]} does not match "
+                     f"the saved dimension {dim}")
+
+  # 先写向量（和缩放系数），再写键：中断时多出的行会在加载时被忽略，
+  # 并在下一次追加之前被截掉（见 _repair）。
+  data, scale = quantize_rows(rows, dtype)
+  with open(f"{folder}/{embedding_rows_files[dtype]}", "ab") as outfile:
+    outfile.write(data.tobytes())
+  if scale is not None:
+    with open(f"{folder}/{embedding_scale_file}", "ab") as outfile:
+      outfile.write(scale.tobytes())
+  with open(f"{folder}/{embedding_keys_file}", "a") as outfile:
+    for key in new_keys:
+      outfile.write(json.dumps(key) + "\n")
+  return len(new_keys)
+
+
+def convert_embeddings_to_binary(folder, dtype=None):
+  """
+  将 <folder> 中的 embeddings.json 转换为 <dtype> 精度的二进制格式。
+  embeddings.json 会被保留，但之后加载时优先使用二进制文件。
+
+  输入:
+    folder: associative_memory 文件夹
+    dtype: "float32"、"float16" 或 "int8"（默认为 embedding_storage_dtype）
+  输出:
+    转换的行数
+  """
+  embeddings = json.load(open(f"{folder}/embeddings.json"))
+  files = list(embedding_rows_files.values())
+  files += [embedding_scale_file, embedding_keys_file, embedding_meta_file]
+  for f in files:
+    if os.path.exists(f"{folder}/{f}"):
+      os.remove(f"{folder}/{f}")
+  return append_binary_embeddings(folder, embeddings, dtype)
+
+
+if __name__ == '__main__':
+  dtype = sys.argv[2] if len(sys.argv) > 2 else None
+  for root, dirs, files in os.walk(sys.argv[1]):
+    if "embeddings.json" in files and "nodes.json" in files:
+      n_rows = convert_embeddings_to_binary(root, dtype)
+      print (f"{root}: {n_rows} embeddings")
@@ -0,0 +1,154 @@
+"""
+文件: embedding_store.py
+描述: 定义整个模拟共享的向量嵌入库。
+
+不同智能体的记忆中有大量相同的嵌入键（例如 "bed is idle"、
+"cafe counter is being used"）。EmbeddingStore 让每个键在进程中只保存
+一份向量，各智能体的 AssociativeMemory.embeddings 只持有对它的引用；
+get_embedding 在发出网络请求之前也会先查询这里。
+
+以列表形式传入的向量（embeddings.json 或嵌入请求的结果）以 float64 数组
+保存：每维 8 字节，而列表每维需要一个 float 对象（约 32 字节）。数值不变，
+保存为 embeddings.json 时与原来完全相同。此外每个智能体的 EmbeddingMatrix
+还为每个键保存一行归一化的向量（float32 时每维 4 字节），见
+benchmarks/bench_embedding_memory.py。
+
+每个键记录持有它的联想记忆的数量（intern 的 hold 参数）；release 将其
+减一，没有持有者的向量从库中移除。没有持有者的键（例如检索焦点和查询
+字符串的嵌入）只按最近使用保留最多 <embedding_store_unheld_size> 个，
+超出时移除最久未使用的。
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# 没有持有者的向量最多保留的个数。
+embedding_store_unheld_size = 2048
+
+
+def compact_vector(embedding):
+  # 列表形式的向量转换为 float64 数组，其他对象原样返回。
+  if isinstance(embedding, list):
+    return np.array(embedding, dtype=np.float64)
+  return embedding
+
+
+# 全局嵌入库类：嵌入键 -> 唯一的向量对象
+class EmbeddingStore:
+  def __init__(self):
+    # <vectors> 的值为向量（list），或尚未取回的 PendingEmbedding。
+    self.vectors = dict()
+    # <holders> 将嵌入键映射到持有它的联想记忆的数量；<unheld> 是没有
+    # 持有者的键，按最近使用从旧到新排列。
+    self.holders = dict()
+    self.unheld = OrderedDict()
+    self._lock = threading.Lock()
+
+    # 命中与未命中计数，用于 stats()
+    self.hits = 0
+    self.misses = 0
+
+
+  def _settle(self, key, embedding):
+    # 已经取回的 PendingEmbedding 替换为其向量本身。
+    if hasattr(embedding, "resolve") and embedding.value is not None:
+      embedding = compact_vector(embedding.value)
+      self.vectors[key] = embedding
+    return embedding
+
+
+  def _use_unheld(self, key):
+    # 将没有持有者的 <key> 标记为最近使用，并移除超出上限的最久未使用的键。
+    self.unheld[key] = True
+    self.unheld.move_to_end(key)
+    while len(self.unheld) > embedding_store_unheld_size:
+      self.vectors.pop(self.unheld.popitem(last=False)[0], None)
+
+
+  def get(self, key):
+    """
+    返回 <key> 的向量（或 PendingEmbedding）；库中没有时返回 None。
+    """
+    with self._lock:
+      embedding = self.vectors.get(key)
+      if embedding is None:
+        self.misses += 1
+        return None
+      self.hits += 1
+      if key in self.unheld:
+        self.unheld.move_to_end(key)
+      return self._settle(key, embedding)
+
+
+  def intern(self, key, embedding, hold=False):
+    """
+    将 <embedding> 登记为 <key> 的向量，并返回库中的唯一对象。若库中已有
+    该键的向量，则丢弃传入的副本，返回已有的对象。
+
+    输入:
+      key: 嵌入键（str）
+      embedding: 向量（list）或 PendingEmbedding
+      hold: 为 True 时，调用者成为 <key> 的一个持有者，之后须以 release
+            释放；否则 <key> 没有持有者时，它可能在之后被移除
+    输出:
+      库中 <key> 对应的对象
+    """
+    with self._lock:
+      if hold:
+        self.holders[key] = self.holders.get(key, 0) + 1
+        self.unheld.pop(key, None)
+      elif key not in self.holders:
+        self._use_unheld(key)
+      curr = self.vectors.get(key)
+      if curr is not None:
+        curr = self._settle(key, curr)
+        # 已有的仍在等待而传入的已是向量时，以向量为准。
+        if hasattr(curr, "resolve") and not hasattr(embedding, "resolve"):
+          embedding = compact_vector(embedding)
+          self.vectors[key] = embedding
+          return embedding
+        return curr
+      embedding = compact_vector(embedding)
+      self.vectors[key] = embedding
+      return self._settle(key, embedding)
+
+
+  def release(self, keys):
+    """
+    <keys> 中每个键的持有者数量减一（例如在智能体的联想记忆卸载之后），
+    并从库中移除已没有持有者的向量，使其内存得以释放。
+
+    输入:
+      keys: 嵌入键列表，每个键对应此前一次 hold=True 的 intern
+    输出:
+      移除的向量数量
+    """
+    count = 0
+    with self._lock:
+      for key in keys:
+        holders = self.holders.pop(key, 0) - 1
+        if holders > 0:
+          self.holders[key] = holders
+        elif self.vectors.pop(key, None) is not None:
+          count += 1
+    return count
+
+
+  def clear(self):
+    with self._lock:
+      self.vectors = dict()
+      self.holders = dict()
+      self.unheld = OrderedDict()
+
+
+  def stats(self):
+    total = self.hits + self.misses
+    return {"keys": len(self.vectors),
+            "unheld_keys": len(self.unheld),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0}
+
+
+embedding_store = EmbeddingStore()
@@ -0,0 +1,251 @@
+"""
+文件: memory_archive.py
+描述: 定义 MemoryArchive，联想记忆的冷存储层。
+
+思考节点带有 30 天的过期时间，但原先没有任何节点会真正过期，记忆节点、
+关键词倒排索引和嵌入随模拟时长无限增长。AssociativeMemory.archive_memories()
+将过期的节点（以及可选的低分节点）从内存中的各个索引移出，交给
+MemoryArchive 保存在磁盘上：
+
+  archive/nodes.jsonl   每行一个节点字典（与 nodes.json 中的格式相同，
+                        另含 "node_id"），只追加
+  archive/embeddings.*  冷存储节点的嵌入，使用 embedding_storage.py 的
+                        二进制格式
+
+冷存储在内存中只保留每个节点在 nodes.jsonl 中的偏移、嵌入键和关键词
+倒排索引，节点本身在查询时才从磁盘读取。
+"""
+import os
+import json
+import shutil
+import datetime
+
+import numpy as np
+
+from persona.memory_structures.embedding_storage import *
+from persona.memory_structures.embedding_matrix import normalize_embedding
+
+# <memory_archive_enabled> 为 True 时，archive_memories() 将过期的节点
+# 移入冷存储。默认关闭：归档的节点不再参与检索，会改变模拟的行为。已有的
+# 冷存储在加载时仍然有效。
+memory_archive_enabled = False
+# 低分节点的归档（默认关闭）：<archive_max_poignancy> 不为 None 时，重要性
+# 不超过它、且超过 <archive_idle_days> 天未被访问的事件和思考节点也会被
+# 归档。低分节点的扫描间隔为 <archive_sweep_interval>。
+archive_max_poignancy = None
+archive_idle_days = 7
+archive_sweep_interval = datetime.timedelta(days=1)
+
+
+# 冷存储类：保存从联想记忆中移出的节点
+class MemoryArchive:
+  def __init__(self, folder):
+    # <folder> 是冷存储所在的文件夹（associative_memory/archive）。
+    self.folder = os.path.abspath(folder) + "/archive"
+
+    # <offsets>: node_id -> 记录在 nodes.jsonl 中的字节偏移
+    # <pending>: 尚未写入磁盘的记录，node_id -> 节点字典
+    self.offsets = dict()
+    self.pending = dict()
+    # <id_to_key>: node_id -> 嵌入键；<kw_to_ids>: 小写关键词 -> node_id 列表
+    self.id_to_key = dict()
+    self.kw_to_ids = dict()
+    # 冷存储中最大的节点计数，避免新节点重用已归档节点的 ID。
+    self.max_counts = {"node": 0, "event": 0, "chat": 0, "thought": 0}
+
+    # <embeddings> 在第一次需要时才从磁盘加载（见 _load_embeddings）。
+    self.embeddings = None
+    self.pending_embeddings = dict()
+
+    # 上次写入中断时，nodes.jsonl 的最后一行可能不完整；<valid_size> 是
+    # 完整部分的长度，下一次保存前截断到这里。
+    self.valid_size = 0
+    self._scan()
+
+
+  def _index(self, node_id, details):
+    self.id_to_key[node_id] = details["embedding_key"]
+    for kw in details["keywords"]:
+      self.kw_to_ids.setdefault(kw.lower(), []).append(node_id)
+    self.max_counts["node"] = max(self.max_counts["node"],
+                                  details["node_count"])
+    self.max_counts[details["type"]] = max(self.max_counts[details["type"]],
+                                           details["type_count"])
+
+
+  def _scan(self):
+    f_nodes = f"{self.folder}/nodes.jsonl"
+    if not os.path.exists(f_nodes):
+      return
+    with open(f_nodes, "rb") as f:
+      offset = 0
+      for line in f:
+        try:
+          details = json.loads(line)
+        except ValueError:
+          break
+        self.offsets[details["node_id"]] = offset
+        self._index(details["node_id"], details)
+        offset += len(line)
+    self.valid_size = offset
+
+
+  def __getstate__(self):
+    # 冷存储的嵌入是内存映射，不随快照保存，需要时重新加载。
+    state = dict(self.__dict__)
+    state["embeddings"] = None
+    return state
+
+
+  def _load_embeddings(self):
+    if self.embeddings is None:
+      self.embeddings = dict()
+      if has_binary_embeddings(self.folder):
+        self.embeddings = load_binary_embeddings(self.folder)
+    return self.embeddings
+
+
+  def __contains__(self, node_id):
+    return node_id in self.offsets or node_id in self.pending
+
+
+  def __len__(self):
+    return len(self.offsets) + len(self.pending)
+
+
+  def add(self, details, embedding):
+    """
+    将一个节点加入冷存储（在下一次 save() 时写入磁盘）。
+
+    输入:
+      details: 节点字典（AssociativeMemory.node_details 的格式，另含 "node_id"）
+      embedding: 该节点的嵌入向量（或 PendingEmbedding）
+    """
+    node_id = details["node_id"]
+    self.pending[node_id] = details
+    self._index(node_id, details)
+    key = details["embedding_key"]
+    if embedding is not None and key not in self._load_embeddings():
+      self.pending_embeddings[key] = embedding
+
+
+  def save(self, folder):
+    """
+    将尚未保存的节点和嵌入追加到 <folder>/archive。保存到新的文件夹时，
+    先复制已有的冷存储。
+    """
+    target = os.path.abspath(folder) + "/archive"
+    if target != self.folder:
+      if os.path.exists(self.folder):
+        shutil.copytree(self.folder, target, dirs_exist_ok=True)
+      self.folder = target
+    if not self.pending:
+      return
+    os.makedirs(self.folder, exist_ok=True)
+
+    # 先写嵌入，再写节点记录。
+    embeddings = dict()
+    for key, embedding in self.pending_embeddings.items():
+      if hasattr(embedding, "resolve"):
+        embedding = embedding.resolve()
+      embeddings[key] = embedding
+    if embeddings:
+      append_binary_embeddings(self.folder, embeddings)
+      self.embeddings = None
+    self.pending_embeddings = dict()
+
+    f_nodes = f"{self.folder}/nodes.jsonl"
+    if os.path.exists(f_nodes) and os.path.getsize(f_nodes) > self.valid_size:
+      os.truncate(f_nodes, self.valid_size)
+    with open(f_nodes, "ab") as outfile:
+      for node_id, details in self.pending.items():
+        self.offsets[node_id] = outfile.tell()
+        outfile.write((json.dumps(details) + "\n").encode("utf-8"))
+      self.valid_size = outfile.tell()
+    self.pending = dict()
+
+
+  def get_many(self, node_ids):
+    """
+    返回 <node_ids> 对应的节点字典列表（顺序相同）。
+    """
+    details = []
+    f = None
+    for node_id in node_ids:
+      if node_id in self.pending:
+        details += [self.pending[node_id]]
+        continue
+      if f is None:
+        f = open(f"{self.folder}/nodes.jsonl", "rb")
+      f.seek(self.offsets[node_id])
+      details += [json.loads(f.readline())]
+    if f is not None:
+      f.close()
+    return details
+
+
+  def search(self, keywords=None, node_type=None, start=None, end=None):
+    """
+    按关键词、节点类型和创建时间查询冷存储。
+
+    输入:
+      keywords: 关键词列表，匹配其中任意一个即可（None 表示不限）
+      node_type: "event"、"chat" 或 "thought"（None 表示不限）
+      start, end: 创建时间的范围 [start, end]（datetime，None 表示不限）
+    输出:
+      节点字典列表，最新的在前
+    """
+    if keywords is None:
+      node_ids = list(self.offsets) + list(self.pending)
+    else:
+      node_ids = []
+      for kw in keywords:
+        node_ids += self.kw_to_ids.get(kw.lower(), [])
+      node_ids = list(dict.fromkeys(node_ids))
+
+    ret = []
+    for details in self.get_many(node_ids):
+      if node_type and details["type"] != node_type:
+        continue
+      created = datetime.datetime.strptime(details["created"],
+                                           '%Y-%m-%d %H:%M:%S')
+      if (start and created < start) or (end and created > end):
+        continue
+      ret += [details]
+    return sorted(ret, key=lambda x: x["node_count"], reverse=True)
+
+
+  def search_similar(self, embedding, n=10, node_type=None):
+    """
+    返回嵌入与 <embedding> 余弦相似度最高的 <n> 个冷存储节点（节点字典
+    列表，最相似的在前）。
+    """
+    embeddings = dict(self._load_embeddings())
+    embeddings.update(self.pending_embeddings)
+    node_ids = [i for i in self.id_to_key if self.id_to_key[i] in embeddings]
+    if not node_ids:
+      return []
+    keys = list(dict.fromkeys(self.id_to_key[i] for i in node_ids))
+    key_to_col = {key: count for count, key in enumerate(keys)}
+    matrix = np.stack([normalize_embedding(
+                         embeddings[key].resolve()
+                         if hasattr(embeddings[key], "resolve")
+                         else embeddings[key]) for key in keys])
+    sims = (matrix @ normalize_embedding(embedding))[
+             [key_to_col[self.id_to_key[i]] for i in node_ids]]
+
+    ret = []
+    for count in np.argsort(-sims, kind="stable"):
+      details = self.get_many([node_ids[count]])[0]
+      if node_type and details["type"] != node_type:
+        continue
+      ret += [details]
+      if len(ret) >= n:
+        break
+    return ret
+
+
+  def stats(self):
+    return {"nodes": len(self),
+            "unsaved": len(self.pending),
+            "keywords": len(self.kw_to_ids)}
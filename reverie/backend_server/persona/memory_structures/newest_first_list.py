@@ -0,0 +1,94 @@
+"""
+文件: newest_first_list.py
+描述: 定义 NewestFirstList，一个按插入顺序追加存储、但对外呈现为
+      "最新在前"顺序的列表。
+
+联想记忆中的 seq_event、seq_thought、seq_chat 以及关键词倒排索引都是
+最新在前的列表。原先通过 lst[0:0] = [node] 在开头插入，每次都要移动整个
+列表；NewestFirstList 在内部列表末尾追加，插入为 O(1)，而读取方看到的
+顺序（索引、切片、迭代、拼接）与原来的列表完全相同。
+"""
+
+
+class NewestFirstList:
+  def __init__(self, items=None):
+    # <_items> 按插入顺序保存元素：_items[-1] 是最新的元素。
+    self._items = []
+    if items:
+      self._items = list(reversed(list(items)))
+
+
+  def prepend(self, item):
+    """
+    将 <item> 作为最新的元素加入，等价于 lst[0:0] = [item]。
+    """
+    self._items.append(item)
+
+
+  def remove(self, item):
+    self._items.remove(item)
+
+
+  def remove_all(self, items):
+    """
+    一次遍历删除 <items>（集合）中的所有元素。
+    """
+    self._items = [i for i in self._items if i not in items]
+
+
+  def __len__(self):
+    return len(self._items)
+
+
+  def __bool__(self):
+    return bool(self._items)
+
+
+  def __iter__(self):
+    return reversed(self._items)
+
+
+  def __reversed__(self):
+    return iter(self._items)
+
+
+  def __contains__(self, item):
+    return item in self._items
+
+
+  def __getitem__(self, index):
+    n = len(self._items)
+    if isinstance(index, slice):
+      start, stop, step = index.indices(n)
+      if step == 1:
+        # 最新在前的 [start:stop] 对应内部列表的 [n-stop:n-start] 反转。
+        if stop <= start:
+          return []
+        return self._items[n-stop:n-start][::-1]
+      return [self._items[n-1-i] for i in range(start, stop, step)]
+
+    if index < 0:
+      index += n
+    if index < 0 or index >= n:
+      raise IndexError("NewestFirstList index out of range")
+    return self._items[n-1-index]
+
+
+  def __add__(self, other):
+    return list(self) + list(other)
+
+
+  def __radd__(self, other):
+    return list(other) + list(self)
+
+
+  def __eq__(self, other):
+    if isinstance(other, NewestFirstList):
+      return self._items == other._items
+    if isinstance(other, list):
+      return list(self) == other
+    return NotImplemented
+
+
+  def __repr__(self):
+    return repr(list(self))
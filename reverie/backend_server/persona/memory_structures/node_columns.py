@@ -0,0 +1,68 @@
+"""
+文件: node_columns.py
+描述: 定义 NodeColumns，按列保存联想记忆节点的数值属性。
+
+长时间的模拟会产生数万个 ConceptNode。created、last_accessed、poignancy、
+depth 和 type 这几个属性保存在按节点行号索引的 numpy 数组中，ConceptNode
+（使用 __slots__）只记住自己的行号；检索时可以直接以 numpy 数组的形式
+读取这些列。
+"""
+import datetime
+
+import numpy as np
+
+# 时间列保存的是距 <column_epoch> 的秒数。
+column_epoch = datetime.datetime(1970, 1, 1)
+
+# type 列中节点类型的编码
+node_type_codes = {"event": 0, "chat": 1, "thought": 2}
+node_type_names = ["event", "chat", "thought"]
+
+
+def datetime_to_seconds(dt):
+  return (dt - column_epoch).total_seconds()
+
+
+def seconds_to_datetime(seconds):
+  return column_epoch + datetime.timedelta(seconds=float(seconds))
+
+
+# 节点列存储类：每个节点占一行，容量不足时按两倍扩容
+class NodeColumns:
+  def __init__(self, capacity=256):
+    self.n_rows = 0
+    self.created = np.zeros(capacity, dtype=np.float64)
+    self.last_accessed = np.zeros(capacity, dtype=np.float64)
+    self.poignancy = np.zeros(capacity, dtype=np.float64)
+    self.depth = np.zeros(capacity, dtype=np.int16)
+    self.type = np.zeros(capacity, dtype=np.int8)
+
+
+  def _grow(self):
+    capacity = max(1, self.created.shape[0]) * 2
+    for name in ["created", "last_accessed", "poignancy", "depth", "type"]:
+      old = getattr(self, name)
+      new = np.zeros(capacity, dtype=old.dtype)
+      new[:old.shape[0]] = old
+      setattr(self, name, new)
+
+
+  def append(self, node_type, depth, created, poignancy):
+    """
+    为一个新节点分配一行，并返回行号。last_accessed 初始化为 created。
+    """
+    if self.n_rows == self.created.shape[0]:
+      self._grow()
+    row = self.n_rows
+    self.n_rows += 1
+    self.created[row] = datetime_to_seconds(created)
+    self.last_accessed[row] = self.created[row]
+    self.poignancy[row] = poignancy
+    self.depth[row] = depth
+    self.type[row] = node_type_codes[node_type]
+    return row
+
+
+  def nbytes(self):
+    return (self.created.nbytes + self.last_accessed.nbytes
+            + self.poignancy.nbytes + self.depth.nbytes + self.type.nbytes)
@@ -0,0 +1,96 @@
+"""
+文件: recency_index.py
+描述: 定义 RecencyIndex，按最近访问顺序维护联想记忆中的事件和思考节点。
+
+new_retrieve 与 reflect.generate_focal_points 原先在每次调用时收集全部
+事件和思考（seq_event + seq_thought，各自最新的在前）、用子串判断过滤
+"idle" 节点，再按 last_accessed 稳定排序。RecencyIndex 在节点加入时判断
+一次是否为 idle 节点，并按与原先排序完全相同的键将节点保存在有序列表中：
+
+  (last_accessed, 思考排在事件之后, 同类节点中较新的在前)
+
+节点被检索访问时只需将它们移到新键的位置，因此无需排序即可得到完整的
+时近性顺序或最近的 K 个节点。模拟时间只会前进，被访问的节点总是移到
+末尾的同一时间组中。
+"""
+import bisect
+
+
+class RecencyIndex:
+  def __init__(self, columns):
+    # <columns> 是节点的列存储（见 node_columns.py），从中读取 last_accessed。
+    self.columns = columns
+    # <entries> 是按排序键从旧到新排列的 (排序键..., 节点)；<keys> 将
+    # node_id 映射到节点当前的条目。
+    self.entries = []
+    self.keys = dict()
+
+
+  def _entry(self, node):
+    # node_count 在所有节点中唯一，因此比较不会进行到节点本身。
+    return (float(self.columns.last_accessed[node.row]),
+            node.type == "thought", -node.node_count, node)
+
+
+  def add(self, node):
+    """
+    按节点的 last_accessed 加入新节点。idle 节点不参与检索，不会被加入。
+    """
+    if "idle" in node.embedding_key:
+      return
+    entry = self._entry(node)
+    self.keys[node.node_id] = entry
+    bisect.insort(self.entries, entry)
+
+
+  def touch(self, nodes):
+    """
+    <nodes> 的 last_accessed 已被更新，将它们移到新的位置。
+    """
+    for node in nodes:
+      old = self.keys.get(node.node_id)
+      if old is None:
+        continue
+      new = self._entry(node)
+      if new[:3] != old[:3]:
+        del self.entries[bisect.bisect_left(self.entries, old)]
+        bisect.insort(self.entries, new)
+        self.keys[node.node_id] = new
+
+
+  def remove(self, node):
+    entry = self.keys.pop(node.node_id, None)
+    if entry is not None:
+      del self.entries[bisect.bisect_left(self.entries, entry)]
+
+
+  def count_since(self, seconds):
+    """
+    返回 last_accessed 不早于 <seconds>（距 epoch 的秒数）的节点数，即
+    位于顺序末尾的这些节点的个数。
+    """
+    return len(self.entries) - bisect.bisect_left(self.entries, (seconds,))
+
+
+  def nodes(self):
+    """
+    返回全部节点，按最近访问从旧到新排列。
+    """
+    return [entry[3] for entry in self.entries]
+
+
+  def most_recent(self, k):
+    """
+    返回最近访问的 <k> 个节点，按从旧到新排列（即 nodes()[-k:]）。
+    """
+    if k <= 0:
+      return []
+    return [entry[3] for entry in self.entries[-k:]]
+
+
+  def __len__(self):
+    return len(self.entries)
+
+
+  def __contains__(self, node):
+    return node.node_id in self.keys
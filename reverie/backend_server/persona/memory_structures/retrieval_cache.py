@@ -0,0 +1,73 @@
+"""
+文件: retrieval_cache.py
+描述: 定义 RetrievalCache，每个智能体的检索相关性缓存。
+
+对话（converse.agent_chat_v2）和反思在短时间内会以相同的焦点多次调用
+new_retrieve，而其间记忆通常没有变化。检索的三个分数中，时近性取决于
+时近性顺序，而每次检索都会把返回的节点标记为最近访问、改变这个顺序，
+因此连续两次相同的检索本来就可能返回不同的节点，检索结果本身不能缓存。
+相关性则只取决于焦点和记忆中的节点：缓存以焦点为键，保存归一化后的
+相关性（按嵌入矩阵的行号排列），并且只保存一个记忆版本下的结果。
+AssociativeMemory 在加入或归档事件和思考节点时将版本加一，旧的结果随之
+失效。命中时无需取回焦点的嵌入，也无需与记忆矩阵相乘，时近性与重要性
+仍在每次检索时重新计算，结果与不使用缓存时完全相同。
+"""
+from collections import OrderedDict
+
+# <retrieval_cache_enabled> 为 False 时，new_retrieve 不使用缓存。
+retrieval_cache_enabled = True
+# 每个智能体最多缓存的焦点数，超出时丢弃最久未使用的焦点。
+retrieval_cache_size = 32
+
+
+# 检索相关性缓存类：焦点 -> 按嵌入矩阵行号排列的归一化相关性
+class RetrievalCache:
+  def __init__(self):
+    # <entries> 只保存记忆版本为 <version> 时的结果（见上文）。
+    self.version = None
+    self.entries = OrderedDict()
+
+    # 命中与未命中计数，用于 stats()
+    self.hits = 0
+    self.misses = 0
+
+
+  def _check_version(self, version):
+    if version != self.version:
+      self.version = version
+      self.entries = OrderedDict()
+
+
+  def get(self, focal_pt, version):
+    """
+    返回记忆版本为 <version> 时 <focal_pt> 的相关性数组（下标为嵌入矩阵
+    的行号）；没有缓存时返回 None。
+    """
+    self._check_version(version)
+    relevance = self.entries.get(focal_pt)
+    if relevance is None:
+      self.misses += 1
+      return None
+    self.entries.move_to_end(focal_pt)
+    self.hits += 1
+    return relevance
+
+
+  def put(self, focal_pt, version, relevance):
+    self._check_version(version)
+    self.entries[focal_pt] = relevance
+    self.entries.move_to_end(focal_pt)
+    while len(self.entries) > retrieval_cache_size:
+      self.entries.popitem(last=False)
+
+
+  def clear(self):
+    self.entries = OrderedDict()
+
+
+  def stats(self):
+    total = self.hits + self.misses
+    return {"entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0}
@@ -0,0 +1,63 @@
+"""
+文件: time_index.py
+描述: 定义 TimeIndex，按创建时间排序的节点索引。
+
+seq_event、seq_thought、seq_chat 按加入顺序排列，要取某个时间范围内的
+节点只能从头扫描。TimeIndex 保存按创建时间从旧到新排列的时间列表和节点
+列表，用二分查找定位时间范围，只访问范围内的节点。节点几乎总是按时间
+顺序加入，插入通常就是追加在末尾。创建时间相同的节点按加入的先后排列。
+"""
+import bisect
+
+
+class TimeIndex:
+  def __init__(self):
+    # <times>[i] 是 <nodes>[i] 的创建时间，两者都按从旧到新排列。
+    self.times = []
+    self.nodes = []
+
+
+  def add(self, node, created):
+    """
+    将创建时间为 <created> 的 <node> 加入索引。
+    """
+    index = bisect.bisect_right(self.times, created)
+    self.times.insert(index, created)
+    self.nodes.insert(index, node)
+
+
+  def remove_all(self, items):
+    """
+    一次遍历删除 <items>（集合）中的所有节点。
+    """
+    kept = [count for count, node in enumerate(self.nodes)
+            if node not in items]
+    self.times = [self.times[i] for i in kept]
+    self.nodes = [self.nodes[i] for i in kept]
+
+
+  def bounds(self, start=None, end=None):
+    """
+    返回创建时间在 [start, end] 之内的节点在 <nodes> 中的下标范围
+    [lo, hi)。<start>、<end> 为 None 表示不限。
+    """
+    lo = bisect.bisect_left(self.times, start) if start else 0
+    hi = bisect.bisect_right(self.times, end) if end else len(self.times)
+    return lo, hi
+
+
+  def newest_first(self, start=None, end=None):
+    """
+    从新到旧依次产生创建时间在 [start, end] 之内的 (创建时间, 节点)。
+    """
+    lo, hi = self.bounds(start, end)
+    for count in range(hi - 1, lo - 1, -1):
+      yield self.times[count], self.nodes[count]
+
+
+  def latest(self):
+    return self.nodes[-1]
+
+
+  def __len__(self):
+    return len(self.nodes)
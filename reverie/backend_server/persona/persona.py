@@ -10,8 +10,11 @@ paper.
 """
 import math
 import sys
+import atexit
+import shutil
 import datetime
 import random
+import tempfile
 sys.path.append('../')
 
 from global_methods import *
@@ -19,6 +22,7 @@ from global_methods import *
 from persona.memory_structures.spatial_memory import *
 from persona.memory_structures.associative_memory import *
 from persona.memory_structures.scratch import *
+from persona.persona_snapshot import *
 
 from persona.cognitive_modules.perceive import *
 from persona.cognitive_modules.retrieve import *
@@ -27,6 +31,23 @@ from persona.cognitive_modules.reflect import *
 from persona.cognitive_modules.execute import *
 from persona.cognitive_modules.converse import *
 
+# LAZY LOADING
+# When <lazy_persona_loading> is True, a persona's spatial memory and scratch
+# are loaded when it is created, but its associative memory (most of its
+# state, including the embeddings) is only loaded the first time it is used.
+# A persona whose associative memory has not been used for 
+# <persona_unload_idle> of game time is unloaded again by unload_if_idle(),
+# which spills it to a temporary folder rather than to bootstrap_memory, so
+# that bootstrap_memory only ever holds a whole persona written by save(). 
+lazy_persona_loading = False
+persona_unload_idle = datetime.timedelta(hours=1)
+# When <skip_sleeping_cognition> is True, a persona that is sleeping skips 
+# perception, retrieval and reflection until its sleep ends, so that sleeping
+# personas can stay unloaded in the lazy loading mode. This changes the 
+# simulation: sleeping personas no longer notice events or accumulate 
+# poignancy, so it is off by default. 
+skip_sleeping_cognition = False
+
 class Persona: 
   def __init__(self, name, folder_mem_saved=False):
     # PERSONA BASE STATE 
@@ -36,16 +57,91 @@ class Persona:
 
     # PERSONA MEMORY 
     # If there is already memory in folder_mem_saved, we load that. Otherwise,
-    # we create new memory instances. 
-    # <s_mem> is the persona's spatial memory. 
-    f_s_mem_saved = f"{folder_mem_saved}/bootstrap_memory/spatial_memory.json"
-    self.s_mem = MemoryTree(f_s_mem_saved)
-    # <s_mem> is the persona's associative memory. 
-    f_a_mem_saved = f"{folder_mem_saved}/bootstrap_memory/associative_memory"
-    self.a_mem = AssociativeMemory(f_a_mem_saved)
-    # <scratch> is the persona's scratch (short term memory) space. 
-    scratch_saved = f"{folder_mem_saved}/bootstrap_memory/scratch.json"
-    self.scratch = Scratch(scratch_saved)
+    # we create new memory instances. Snapshots of the already-built memory
+    # (see persona_snapshot.py) are used when they are up to date with the 
+    # JSON files. 
+    # <f_mem_saved> is the persona's bootstrap_memory folder. 
+    self.f_mem_saved = f"{folder_mem_saved}/bootstrap_memory"
+    if not load_persona_snapshot(self, self.f_mem_saved): 
+      # <s_mem> is the persona's spatial memory. 
+      f_s_mem_saved = f"{self.f_mem_saved}/spatial_memory.json"
+      self.s_mem = MemoryTree(f_s_mem_saved)
+      # <scratch> is the persona's scratch (short term memory) space. 
+      scratch_saved = f"{self.f_mem_saved}/scratch.json"
+      self.scratch = Scratch(scratch_saved)
+
+    # <a_mem> is the persona's associative memory (see the a_mem property). 
+    # <a_mem_last_used> is the game time at which it was last used. 
+    # <f_a_mem_spilled> is the temporary folder that unload_if_idle() wrote 
+    # it to, if it has been unloaded since it was last saved. 
+    self._a_mem = None
+    self.a_mem_last_used = None
+    self.f_a_mem_spilled = None
+    if not lazy_persona_loading: 
+      self._a_mem = self.load_a_mem()
+
+
+  @property
+  def a_mem(self): 
+    if self._a_mem is None: 
+      self._a_mem = self.load_a_mem()
+    self.a_mem_last_used = self.scratch.curr_time
+    return self._a_mem
+
+
+  @a_mem.setter
+  def a_mem(self, a_mem): 
+    self._a_mem = a_mem
+
+
+  def load_a_mem(self): 
+    """
+    Loads the persona's associative memory from where unload_if_idle() 
+    spilled it, or else from its bootstrap_memory folder. 
+
+    INPUT: 
+      None
+    OUTPUT: 
+      The <AssociativeMemory> instance. 
+    """
+    f_a_mem_saved = (self.f_a_mem_spilled 
+                     or f"{self.f_mem_saved}/associative_memory")
+    a_mem = load_a_mem_snapshot(self.name, f_a_mem_saved)
+    if a_mem is None: 
+      a_mem = AssociativeMemory(f_a_mem_saved)
+    return a_mem
+
+
+  def unload_if_idle(self, curr_time): 
+    """
+    In the lazy loading mode, unloads the persona's associative memory if it
+    has not been used for <persona_unload_idle>. It is first written to a 
+    temporary spill folder (not to bootstrap_memory, which would then be 
+    ahead of the saved scratch) and is loaded again from there when it is 
+    next used. 
+
+    INPUT: 
+      curr_time: datetime instance that indicates the game's current time. 
+    OUTPUT: 
+      True if the associative memory was unloaded. 
+    """
+    if (not lazy_persona_loading or self._a_mem is None 
+        or self.a_mem_last_used is None
+        or curr_time - self.a_mem_last_used < persona_unload_idle): 
+      return False
+    if self.f_a_mem_spilled is None: 
+      spill_folder = tempfile.mkdtemp(prefix="persona_")
+      atexit.register(shutil.rmtree, spill_folder, True)
+      self.f_a_mem_spilled = f"{spill_folder}/associative_memory"
+      os.makedirs(self.f_a_mem_spilled)
+    self._a_mem.save(self.f_a_mem_spilled)
+    save_a_mem_snapshot(self.name, self._a_mem, self.f_a_mem_spilled)
+    # The embeddings that no other persona holds are dropped from the shared
+    # embedding store too. 
+    keys = list(self._a_mem.embeddings)
+    self._a_mem = None
+    embedding_store.release(keys)
+    return True
 
 
   def save(self, save_folder): 
@@ -68,8 +164,20 @@ class Persona:
     # Associative memory contains a csv with the following rows: 
     # [event.type, event.created, event.expiration, s, p, o]
     # e.g., event,2022-10-23 00:00:00,,Isabella Rodriguez,is,idle
+    # An associative memory that is not loaded and was not spilled (see 
+    # unload_if_idle) is already saved in the persona's own bootstrap_memory
+    # folder. A spilled one is loaded again to be saved. 
     f_a_mem = f"{save_folder}/associative_memory"
-    self.a_mem.save(f_a_mem)
+    own_folder = (os.path.abspath(save_folder) 
+                  == os.path.abspath(self.f_mem_saved))
+    if self._a_mem is not None or self.f_a_mem_spilled or not own_folder: 
+      if self._a_mem is None: 
+        self._a_mem = self.load_a_mem()
+      self._a_mem.save(f_a_mem)
+      save_a_mem_snapshot(self.name, self._a_mem, f_a_mem)
+      if own_folder and self.f_a_mem_spilled: 
+        shutil.rmtree(os.path.dirname(self.f_a_mem_spilled), True)
+        self.f_a_mem_spilled = None
 
     # Scratch contains non-permanent data associated with the persona. When 
     # it is saved, it takes a json form. When we load it, we move the values
@@ -77,6 +185,10 @@ class Persona:
     f_scratch = f"{save_folder}/scratch.json"
     self.scratch.save(f_scratch)
 
+    # The snapshots let the next run load the memory without rebuilding it 
+    # from the JSON files above. 
+    save_persona_snapshot(self, save_folder)
+
 
   def perceive(self, maze):
     """
@@ -216,6 +328,22 @@ class Persona:
       new_day = "New day"
     self.scratch.curr_time = curr_time
 
+    # With skip_sleeping_cognition, a sleeping persona only keeps following 
+    # its plan until its sleep ends, without using its associative memory. 
+    if (skip_sleeping_cognition and not new_day 
+        and self.scratch.act_description
+        and "sleeping" in self.scratch.act_description
+        and not self.scratch.act_check_finished()): 
+      plan = self.plan(maze, personas, new_day, dict())
+      return self.execute(maze, personas, plan)
+
+    # When memory_archive_enabled is set (see memory_archive.py), expired 
+    # memories are moved out of the associative memory's in-memory indices 
+    # into its on-disk archive. This does not load an unloaded associative 
+    # memory; its expired memories are archived once it is loaded again. 
+    if self._a_mem is not None: 
+      self._a_mem.archive_memories(curr_time)
+
     # Main cognitive sequence begins here. 
     perceived = self.perceive(maze)
     retrieved = self.retrieve(perceived)
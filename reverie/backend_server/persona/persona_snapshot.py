@@ -0,0 +1,153 @@
+"""
+File: persona_snapshot.py
+Description: Binary snapshots of a persona's memory for fast cold starts.
+
+Loading a persona from its JSON files parses every node (including a
+strptime per timestamp) and replays add_event/add_thought/add_chat to
+rebuild the associative memory's indices. Persona.save() additionally
+pickles the already-built memory, and Persona loads the pickles in one read
+each when they are usable. There are two snapshots so that the associative
+memory can be loaded separately (see lazy_persona_loading in persona.py):
+
+  bootstrap_memory/persona_snapshot.pkl                     s_mem, scratch
+  bootstrap_memory/associative_memory/persona_snapshot.pkl  a_mem
+
+Each snapshot file holds two pickles: a small header and the memory itself.
+The header records <persona_snapshot_version>, the persona's name and the
+size and mtime of every file the snapshot stands in for (the associative
+memory snapshot covers the associative_memory folder, the other one the rest
+of bootstrap_memory). A snapshot is only used if all of them still match;
+otherwise (e.g., the JSON files were edited or saved without a snapshot, or
+the classes changed) the memory is loaded from JSON as before.
+"""
+import os
+import pickle
+
+# Bump <persona_snapshot_version> whenever the pickled classes change in a
+# way that older snapshots cannot be loaded into.
+persona_snapshot_version = 7
+persona_snapshot_enabled = True
+persona_snapshot_file = "persona_snapshot.pkl"
+
+
+def snapshot_fingerprint(folder, exclude=()):
+  """
+  Returns the (relative path, size, mtime) of every file in <folder> other
+  than the snapshots and the subfolders named in <exclude>.
+  """
+  fingerprint = []
+  for root, dirs, files in os.walk(folder):
+    if root == folder:
+      dirs[:] = [i for i in dirs if i not in exclude]
+    dirs.sort()
+    for file_name in sorted(files):
+      if file_name.startswith(persona_snapshot_file):
+        continue
+      path = os.path.join(root, file_name)
+      stat = os.stat(path)
+      fingerprint += [(os.path.relpath(path, folder),
+                       stat.st_size, int(stat.st_mtime))]
+  return fingerprint
+
+
+def write_snapshot(folder, name, body, exclude=()):
+  f_snapshot = f"{folder}/{persona_snapshot_file}"
+  header = {"version": persona_snapshot_version,
+            "name": name,
+            "fingerprint": snapshot_fingerprint(folder, exclude)}
+  with open(f_snapshot + ".tmp", "wb") as outfile:
+    pickle.dump(header, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+    pickle.dump(body, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+  os.replace(f_snapshot + ".tmp", f_snapshot)
+
+
+def read_snapshot(folder, name, exclude=()):
+  """
+  Returns the body of the snapshot in <folder>, or None if there is no
+  usable one.
+  """
+  f_snapshot = f"{folder}/{persona_snapshot_file}"
+  if not persona_snapshot_enabled or not os.path.exists(f_snapshot):
+    return None
+
+  try:
+    with open(f_snapshot, "rb") as f:
+      header = pickle.load(f)
+      if (header.get("version") != persona_snapshot_version
+          or header.get("name") != name
+          or header.get("fingerprint")
+             != snapshot_fingerprint(folder, exclude)):
+        return None
+      return pickle.load(f)
+  except Exception as e:
+    print (f"persona snapshot {f_snapshot} could not be loaded ({e}); "
+           "loading from JSON")
+    return None
+
+
+def save_persona_snapshot(persona, bootstrap_folder):
+  """
+  Pickles the spatial memory and scratch of <persona> into
+  <bootstrap_folder>. This has to be called after the JSON files in
+  <bootstrap_folder> have been written.
+
+  INPUT:
+    persona: The Persona instance.
+    bootstrap_folder: The persona's bootstrap_memory folder.
+  OUTPUT:
+    None
+  """
+  if not persona_snapshot_enabled:
+    return
+  write_snapshot(bootstrap_folder, persona.name,
+                 {"s_mem": persona.s_mem, "scratch": persona.scratch},
+                 exclude=("associative_memory",))
+
+
+def load_persona_snapshot(persona, bootstrap_folder):
+  """
+  Loads the spatial memory and scratch of <persona> from the snapshot in
+  <bootstrap_folder> if there is a usable one.
+
+  INPUT:
+    persona: The Persona instance whose s_mem and scratch are set.
+    bootstrap_folder: The persona's bootstrap_memory folder.
+  OUTPUT:
+    True if the snapshot was loaded, False if the caller has to load them
+    from JSON.
+  """
+  body = read_snapshot(bootstrap_folder, persona.name,
+                       exclude=("associative_memory",))
+  if body is None:
+    return False
+  persona.s_mem = body["s_mem"]
+  persona.scratch = body["scratch"]
+  return True
+
+
+def save_a_mem_snapshot(name, a_mem, f_a_mem):
+  """
+  Pickles the associative memory <a_mem> of the persona <name> into its
+  folder <f_a_mem>. This has to be called after a_mem.save(f_a_mem).
+  """
+  if not persona_snapshot_enabled:
+    return
+  # Pending embeddings hold a reference to the embedding batcher and cannot
+  # be pickled. The rows of the embedding matrix are not pickled; they are
+  # refilled from the embeddings after loading.
+  a_mem.resolve_embeddings()
+  write_snapshot(f_a_mem, name, a_mem)
+
+
+def load_a_mem_snapshot(name, f_a_mem):
+  """
+  Returns the associative memory of the persona <name> loaded from the
+  snapshot in <f_a_mem>, or None if the caller has to load it from JSON.
+  """
+  a_mem = read_snapshot(f_a_mem, name)
+  if a_mem is None:
+    return None
+  # The snapshot may have been written in another simulation folder (e.g.,
+  # the one this simulation was forked from).
+  a_mem.restore(f_a_mem)
+  return a_mem
@@ -8,14 +8,45 @@ import json
 import random
 import openai
 import time 
+import asyncio
+import functools
+import threading
+import collections
+import concurrent.futures
 
 from utils import *
+from persona.prompt_template.llm_cache import *
+from persona.memory_structures.embedding_store import *
 
 openai.api_key = openai_api_key
 
 def temp_sleep(seconds=0.1):
   time.sleep(seconds)
 
+def cached_response(model, prompt, gpt_parameter, template, 
+                    func_validate, func_clean_up): 
+  """
+  Looks <prompt> up in the <llm_cache>. A cached response that fails 
+  <func_validate>, or that makes it or <func_clean_up> raise, is ignored so 
+  that the caller makes a live request instead. 
+  ARGS:
+    model: the name of the model (e.g., "gpt-3.5-turbo")
+    prompt: the str prompt that is sent to the model
+    gpt_parameter: the dictionary of GPT parameters, or None
+    template: the prompt template file the prompt was generated from, or None
+  RETURNS: 
+    (cache_key, hit, response): cache_key is None when the prompt is not 
+    cached; when hit is True, response is the cleaned up cached response. 
+  """
+  cache_key, cached = llm_cache.lookup(model, prompt, gpt_parameter, template)
+  if cached is not None: 
+    try: 
+      if func_validate(cached, prompt=prompt): 
+        return cache_key, True, func_clean_up(cached, prompt=prompt)
+    except: 
+      pass
+  return cache_key, False, None
+
 def ChatGPT_single_request(prompt): 
   temp_sleep()
 
@@ -89,6 +120,7 @@ def GPT4_safe_generate_response(prompt,
                                    func_validate=None,
                                    func_clean_up=None,
                                    verbose=False): 
+  template = getattr(prompt, "template", None)
   prompt = 'GPT-3 Prompt:\n"""\n' + prompt + '\n"""\n'
   prompt += f"Output the response to the prompt above in json. {special_instruction}\n"
   prompt += "Example output json:\n"
@@ -98,6 +130,11 @@ def GPT4_safe_generate_response(prompt,
     print ("CHAT GPT PROMPT")
     print (prompt)
 
+  cache_key, hit, response = cached_response("gpt-4", prompt, None, template,
+                                             func_validate, func_clean_up)
+  if hit: 
+    return response
+
   for i in range(repeat): 
 
     try: 
@@ -107,6 +144,9 @@ def GPT4_safe_generate_response(prompt,
       curr_gpt_response = json.loads(curr_gpt_response)["output"]
       
       if func_validate(curr_gpt_response, prompt=prompt): 
+        if cache_key: 
+          llm_cache.put(cache_key, "gpt-4", prompt, None, 
+                        curr_gpt_response)
         return func_clean_up(curr_gpt_response, prompt=prompt)
       
       if verbose: 
@@ -128,6 +168,7 @@ def ChatGPT_safe_generate_response(prompt,
                                    func_validate=None,
                                    func_clean_up=None,
                                    verbose=False): 
+  template = getattr(prompt, "template", None)
   # prompt = 'GPT-3 Prompt:\n"""\n' + prompt + '\n"""\n'
   prompt = '"""\n' + prompt + '\n"""\n'
   prompt += f"Output the response to the prompt above in json. {special_instruction}\n"
@@ -138,6 +179,12 @@ def ChatGPT_safe_generate_response(prompt,
     print ("CHAT GPT PROMPT")
     print (prompt)
 
+  cache_key, hit, response = cached_response("gpt-3.5-turbo", prompt, None, 
+                                             template, func_validate, 
+                                             func_clean_up)
+  if hit: 
+    return response
+
   for i in range(repeat): 
 
     try: 
@@ -151,6 +198,9 @@ def ChatGPT_safe_generate_response(prompt,
       # print ("000asdfhia")
       
       if func_validate(curr_gpt_response, prompt=prompt): 
+        if cache_key: 
+          llm_cache.put(cache_key, "gpt-3.5-turbo", prompt, None, 
+                        curr_gpt_response)
         return func_clean_up(curr_gpt_response, prompt=prompt)
       
       if verbose: 
@@ -174,10 +224,20 @@ def ChatGPT_safe_generate_response_OLD(prompt,
     print ("CHAT GPT PROMPT")
     print (prompt)
 
+  cache_key, hit, response = cached_response(
+                               "gpt-3.5-turbo", prompt, None, 
+                               getattr(prompt, "template", None), 
+                               func_validate, func_clean_up)
+  if hit: 
+    return response
+
   for i in range(repeat): 
     try: 
       curr_gpt_response = ChatGPT_request(prompt).strip()
       if func_validate(curr_gpt_response, prompt=prompt): 
+        if cache_key: 
+          llm_cache.put(cache_key, "gpt-3.5-turbo", prompt, None, 
+                        curr_gpt_response)
         return func_clean_up(curr_gpt_response, prompt=prompt)
       if verbose: 
         print (f"---- repeat count: {i}")
@@ -224,6 +284,15 @@ def GPT_request(prompt, gpt_parameter):
     return "TOKEN LIMIT EXCEEDED"
 
 
+class TemplatePrompt(str): 
+  """
+  A rendered str prompt that remembers the prompt template file it was 
+  generated from. The LLM response cache uses this to honour per-template 
+  opt-outs (see llm_cache_opt_out_templates). 
+  """
+  template = None
+
+
 def generate_prompt(curr_input, prompt_lib_file): 
   """
   Takes in the current input (e.g. comment that you want to classifiy) and 
@@ -249,7 +318,9 @@ def generate_prompt(curr_input, prompt_lib_file):
     prompt = prompt.replace(f"!<INPUT {count}>!", i)
   if "<commentblockmarker>###</commentblockmarker>" in prompt: 
     prompt = prompt.split("<commentblockmarker>###</commentblockmarker>")[1]
-  return prompt.strip()
+  prompt = TemplatePrompt(prompt.strip())
+  prompt.template = prompt_lib_file
+  return prompt
 
 
 def safe_generate_response(prompt, 
@@ -262,9 +333,19 @@ def safe_generate_response(prompt,
   if verbose: 
     print (prompt)
 
+  cache_key, hit, response = cached_response(
+                               gpt_parameter["engine"], prompt, gpt_parameter,
+                               getattr(prompt, "template", None), 
+                               func_validate, func_clean_up)
+  if hit: 
+    return response
+
   for i in range(repeat): 
     curr_gpt_response = GPT_request(prompt, gpt_parameter)
     if func_validate(curr_gpt_response, prompt=prompt): 
+      if cache_key: 
+        llm_cache.put(cache_key, gpt_parameter["engine"], prompt, 
+                      gpt_parameter, curr_gpt_response)
       return func_clean_up(curr_gpt_response, prompt=prompt)
     if verbose: 
       print ("---- repeat count: ", i, curr_gpt_response)
@@ -274,11 +355,241 @@ def safe_generate_response(prompt,
 
 
 def get_embedding(text, model="text-embedding-ada-002"):
-  text = text.replace("\n", " ")
-  if not text: 
-    text = "this is blank"
-  return openai.Embedding.create(
-          input=[text], model=model)['data'][0]['embedding']
+  """
+  Returns the embedding of <text>. Any other embeddings that are pending in 
+  the <embedding_batcher> are fetched in the same request. 
+  """
+  return resolve_embedding(get_embedding_deferred(text, model))
+
+
+def get_embedding_deferred(text, model="text-embedding-ada-002"):
+  """
+  Returns the vector of <text> if the simulation-wide <embedding_store>
+  already has it. Otherwise, queues <text> on the <embedding_batcher> and 
+  returns a PendingEmbedding right away. The vector is fetched, together 
+  with everything else that is pending, when it is first resolved or when
+  the batcher is flushed at the end of the simulation step. 
+  """
+  if model != embedding_batcher.model: 
+    return EmbeddingBatcher(model).request(text)
+
+  embedding = embedding_store.get(text)
+  if embedding is None: 
+    embedding = embedding_store.intern(text, embedding_batcher.request(text))
+  return embedding
+
+
+def resolve_embedding(embedding): 
+  """
+  Returns the vector of <embedding>, which is either a vector already or a
+  PendingEmbedding. 
+  """
+  if isinstance(embedding, PendingEmbedding): 
+    return embedding.resolve()
+  return embedding
+
+
+# ============================================================================
+# #######################[SECTION 3: ASYNC LLM GATEWAY] ######################
+# ============================================================================
+
+# <llm_max_in_flight> is the default number of requests that the gateway 
+# keeps open against the OpenAI server at the same time. 
+llm_max_in_flight = 8
+
+class LLMGateway: 
+  """
+  Runs LLM requests concurrently on a background asyncio event loop, with at
+  most <max_in_flight> of them in flight at any time. 
+
+  Each request (e.g., any of the run_gpt_prompt_* functions) runs on a 
+  worker thread, so independent prompts overlap instead of queueing behind 
+  each other. 
+
+  e.g., 
+    f_1 = llm_gateway.submit(run_gpt_prompt_event_triple, desc_1, persona)
+    f_2 = llm_gateway.submit(run_gpt_prompt_event_triple, desc_2, persona)
+    triple_1, triple_2 = f_1.result()[0], f_2.result()[0]
+  """
+  def __init__(self, max_in_flight=llm_max_in_flight): 
+    self.max_in_flight = max_in_flight
+
+    self._loop = None
+    self._thread = None
+    self._executor = None
+    self._semaphore = None
+    self._lock = threading.Lock()
+
+
+  def _ensure_started(self): 
+    with self._lock: 
+      if self._loop: 
+        return
+      self._loop = asyncio.new_event_loop()
+      self._executor = concurrent.futures.ThreadPoolExecutor(
+                         max_workers=self.max_in_flight, 
+                         thread_name_prefix="llm_gateway")
+      self._thread = threading.Thread(target=self._loop.run_forever, 
+                                      name="llm_gateway_loop", 
+                                      daemon=True)
+      self._thread.start()
+
+
+  async def _run(self, func, args, kwargs): 
+    # The semaphore is created lazily so that it binds to the gateway loop. 
+    if not self._semaphore: 
+      self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+    async with self._semaphore: 
+      return await self._loop.run_in_executor(
+               self._executor, functools.partial(func, *args, **kwargs))
+
+
+  def submit(self, func, *args, **kwargs): 
+    """
+    Schedules func(*args, **kwargs) on the gateway and returns immediately.
+
+    INPUT: 
+      func: a blocking callable (e.g., any of the run_gpt_prompt_* 
+            functions). 
+    OUTPUT: 
+      a concurrent.futures.Future that resolves to the return value of func.
+    """
+    self._ensure_started()
+    return asyncio.run_coroutine_threadsafe(self._run(func, args, kwargs), 
+                                            self._loop)
+
+
+  def shutdown(self): 
+    with self._lock: 
+      if not self._loop: 
+        return
+      self._loop.call_soon_threadsafe(self._loop.stop)
+      self._thread.join()
+      self._executor.shutdown(wait=True)
+      self._loop.close()
+      self._loop = None
+      self._thread = None
+      self._executor = None
+      self._semaphore = None
+
+
+llm_gateway = LLMGateway()
+
+
+# ============================================================================
+# #######################[SECTION 4: EMBEDDING BATCHER] ######################
+# ============================================================================
+
+# <embedding_max_batch_size> is the maximum number of texts that we send in
+# a single multi-input embedding request. 
+embedding_max_batch_size = 256
+
+class PendingEmbedding: 
+  """
+  An embedding that has been requested from the EmbeddingBatcher but that 
+  may not have been fetched yet. 
+  """
+  def __init__(self, batcher, text): 
+    self.batcher = batcher
+    self.text = text
+    self.value = None
+
+
+  def resolve(self): 
+    while self.value is None: 
+      self.batcher.flush()
+      # If another thread's flush is fetching it, wait for that one. 
+      self.batcher.wait_for(self)
+    return self.value
+
+
+class EmbeddingBatcher: 
+  """
+  Collects the embedding demands raised during a simulation step (across 
+  all personas) and resolves them with multi-input embedding requests, so a
+  step costs roughly one embedding round-trip instead of one per text. 
+  """
+  def __init__(self, model="text-embedding-ada-002", 
+               max_batch_size=embedding_max_batch_size): 
+    self.model = model
+    self.max_batch_size = max_batch_size
+
+    # <pending> maps a cleaned text to its unresolved PendingEmbedding. The
+    # same text requested twice shares one entry. <in_flight> holds the 
+    # entries that a flush is fetching. The lock is never held during a 
+    # request; <_fetched> is notified whenever a flush finishes. 
+    self.pending = collections.OrderedDict()
+    self.in_flight = dict()
+    self._lock = threading.Lock()
+    self._fetched = threading.Condition(self._lock)
+
+    # <n_texts> and <n_requests> count the texts embedded and the requests
+    # made to do so. 
+    self.n_texts = 0
+    self.n_requests = 0
+
+
+  def request(self, text): 
+    text = text.replace("\n", " ")
+    if not text: 
+      text = "this is blank"
+
+    with self._lock: 
+      if text in self.in_flight: 
+        return self.in_flight[text]
+      if text not in self.pending: 
+        self.pending[text] = PendingEmbedding(self, text)
+      return self.pending[text]
+
+
+  def flush(self): 
+    """
+    Fetches every pending embedding. 
+    """
+    with self._lock: 
+      batch = list(self.pending.values())
+      self.pending = collections.OrderedDict()
+      for p in batch: 
+        self.in_flight[p.text] = p
+
+    try: 
+      for i in range(0, len(batch), self.max_batch_size): 
+        chunk = batch[i:i+self.max_batch_size]
+        response = openai.Embedding.create(
+                     input=[p.text for p in chunk], model=self.model)
+        for row in response['data']: 
+          chunk[row['index']].value = row['embedding']
+        with self._lock: 
+          self.n_texts += len(chunk)
+          self.n_requests += 1
+
+    finally: 
+      with self._lock: 
+        for p in batch: 
+          del self.in_flight[p.text]
+          # Put back whatever was not fetched so that a later flush retries.
+          if p.value is None and p.text not in self.pending: 
+            self.pending[p.text] = p
+        self._fetched.notify_all()
+
+
+  def wait_for(self, embedding): 
+    """
+    Waits until <embedding> is no longer being fetched by a flush. 
+    """
+    with self._fetched: 
+      while embedding.value is None and embedding.text in self.in_flight: 
+        self._fetched.wait()
+
+
+  def stats(self): 
+    return {"texts": self.n_texts, 
+            "requests": self.n_requests, 
+            "pending": len(self.pending)}
+
+
+embedding_batcher = EmbeddingBatcher()
 
 
 if __name__ == '__main__':
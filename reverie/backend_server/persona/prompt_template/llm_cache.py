@@ -0,0 +1,215 @@
+"""
+File: llm_cache.py
+Description: Persistent, content-addressed cache for LLM responses.
+
+Forked simulations re-run many of the same prompts with identical inputs
+(e.g., the pronunciatio, event triple and poignancy prompts). This cache
+lets those reruns reuse an earlier answer instead of making another paid
+round-trip to the OpenAI server.
+
+Every entry is keyed by the hash of (model, rendered prompt, gpt_param) and
+is stored in its own small json file under <cache_dir>. The total size of
+the cache is bounded; once it is exceeded, the least recently used entries
+are evicted.
+
+Only deterministic prompts are cached by default. A prompt sampled with a
+temperature above <llm_cache_max_temperature> (e.g., the daily plan, or the
+hourly schedule that plan.py re-issues until its activities are diverse
+enough) would otherwise get the same answer on every call.
+"""
+import os
+import json
+import hashlib
+import threading
+import collections
+
+from utils import *
+
+# <llm_cache_dir> is the folder where the cached responses are stored. It is
+# shared by all simulations so that forks can reuse each other's answers.
+llm_cache_dir = f"{fs_temp_storage}/llm_cache"
+# <llm_cache_max_bytes> bounds the on-disk size of the cache.
+llm_cache_max_bytes = 256 * 1024 * 1024
+# <llm_cache_max_temperature> is the highest sampling temperature whose 
+# responses are cached. Raise it to also reuse sampled responses.
+llm_cache_max_temperature = 0
+# <llm_cache_opt_out_templates> lists prompt template files whose responses
+# should never be cached (e.g., prompts where we want a fresh sample every
+# time). Both the full template path and its file name are accepted. The
+# ChatGPT prompts are sent without a temperature (i.e., they are sampled), 
+# so the ones that write conversation lines are listed here. 
+llm_cache_opt_out_templates = {"agent_chat_v1.txt", "iterative_convo_v1.txt"}
+
+
+class LLMResponseCache:
+  def __init__(self,
+               cache_dir=llm_cache_dir,
+               max_bytes=llm_cache_max_bytes,
+               max_temperature=llm_cache_max_temperature,
+               opt_out_templates=llm_cache_opt_out_templates):
+    # <enabled> turns the whole cache on and off.
+    self.enabled = True
+    self.cache_dir = cache_dir
+    self.max_bytes = max_bytes
+    self.max_temperature = max_temperature
+    self.opt_out_templates = opt_out_templates
+
+    # <hits>, <misses> and <evictions> are the counters that we report in
+    # stats().
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+    # <_lru> maps an entry's key to its size in bytes, ordered from the least
+    # to the most recently used. It is built lazily from the files on disk.
+    self._lru = None
+    self._total_bytes = 0
+    self._lock = threading.Lock()
+
+
+  def _path(self, key):
+    return f"{self.cache_dir}/{key[:2]}/{key}.json"
+
+
+  def _load_index(self):
+    self._lru = collections.OrderedDict()
+    self._total_bytes = 0
+    if not os.path.isdir(self.cache_dir):
+      return
+
+    entries = []
+    for root, dirs, files in os.walk(self.cache_dir):
+      for f in files:
+        if not f.endswith(".json"):
+          continue
+        st = os.stat(os.path.join(root, f))
+        entries += [[st.st_mtime, f[:-len(".json")], st.st_size]]
+    for mtime, key, size in sorted(entries):
+      self._lru[key] = size
+      self._total_bytes += size
+
+
+  def make_key(self, model, prompt, gpt_param):
+    """
+    Returns the content address of a request.
+
+    INPUT:
+      model: the name of the model (e.g., "gpt-3.5-turbo")
+      prompt: the rendered str prompt that is sent to the model
+      gpt_param: the dictionary of GPT parameters, or None
+    OUTPUT:
+      a hex str key
+    """
+    content = json.dumps([model, str(prompt), gpt_param], sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+  def is_enabled_for(self, template, gpt_param=None):
+    """
+    Returns False if the cache is disabled, if the prompt is sampled with a
+    temperature above <max_temperature> (per <gpt_param>), or if
+    <template> (the prompt template file the prompt was generated from, or
+    None) opted out of caching.
+    """
+    if not self.enabled:
+      return False
+    if (gpt_param
+        and gpt_param.get("temperature", 0) > self.max_temperature):
+      return False
+    if template:
+      if (template in self.opt_out_templates
+          or os.path.basename(template) in self.opt_out_templates):
+        return False
+    return True
+
+
+  def get(self, key):
+    """
+    Returns the cached response for <key>, or None on a miss.
+    """
+    with self._lock:
+      if self._lru is None:
+        self._load_index()
+      if key not in self._lru:
+        self.misses += 1
+        return None
+
+      try:
+        with open(self._path(key)) as f:
+          response = json.load(f)["response"]
+      except:
+        # The file went missing or is corrupt -- treat it as a miss.
+        self._total_bytes -= self._lru.pop(key)
+        self.misses += 1
+        return None
+
+      self._lru.move_to_end(key)
+      try:
+        os.utime(self._path(key))
+      except OSError:
+        pass
+      self.hits += 1
+      return response
+
+
+  def put(self, key, model, prompt, gpt_param, response):
+    """
+    Stores <response> under <key> and evicts the least recently used entries
+    if the cache grew past <max_bytes>.
+    """
+    with self._lock:
+      if self._lru is None:
+        self._load_index()
+
+      entry = {"model": model,
+               "prompt": str(prompt),
+               "gpt_param": gpt_param,
+               "response": response}
+      path = self._path(key)
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      tmp_path = f"{path}.{threading.get_ident()}.tmp"
+      with open(tmp_path, "w") as outfile:
+        json.dump(entry, outfile)
+      os.replace(tmp_path, path)
+
+      if key in self._lru:
+        self._total_bytes -= self._lru.pop(key)
+      self._lru[key] = os.path.getsize(path)
+      self._total_bytes += self._lru[key]
+
+      while self._total_bytes > self.max_bytes and len(self._lru) > 1:
+        old_key, old_size = self._lru.popitem(last=False)
+        self._total_bytes -= old_size
+        self.evictions += 1
+        try:
+          os.remove(self._path(old_key))
+        except OSError:
+          pass
+
+
+  def lookup(self, model, prompt, gpt_param, template=None):
+    """
+    Convenience wrapper around get() used by the safe_generate_response
+    functions. Returns (key, response); key is None when the prompt should
+    not be cached and response is None on a miss.
+    """
+    if not self.is_enabled_for(template, gpt_param):
+      return None, None
+    key = self.make_key(model, prompt, gpt_param)
+    return key, self.get(key)
+
+
+  def stats(self):
+    with self._lock:
+      if self._lru is None:
+        self._load_index()
+      total = self.hits + self.misses
+      return {"hits": self.hits,
+              "misses": self.misses,
+              "hit_rate": self.hits / total if total else 0.0,
+              "evictions": self.evictions,
+              "entries": len(self._lru),
+              "bytes": self._total_bytes}
+
+
+llm_cache = LLMResponseCache()
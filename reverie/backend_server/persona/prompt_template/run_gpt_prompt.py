@@ -1458,14 +1458,12 @@ def run_gpt_prompt_create_conversation(persona, target_persona, curr_loc,
                           test_input=None): 
 
     prev_convo_insert = "\n"
-    if init_persona.a_mem.seq_chat: 
-      for i in init_persona.a_mem.seq_chat: 
-        if i.object == target_persona.scratch.name: 
-          v1 = int((init_persona.scratch.curr_time - i.created).total_seconds()/60)
-          prev_convo_insert += f'{str(v1)} minutes ago, they had the following conversation.\n'
-          for row in i.filling: 
-            prev_convo_insert += f'{row[0]}: "{row[1]}"\n'
-          break
+    last_chat = init_persona.a_mem.get_last_chat(target_persona.scratch.name)
+    if last_chat: 
+      v1 = int((init_persona.scratch.curr_time - last_chat.created).total_seconds()/60)
+      prev_convo_insert += f'{str(v1)} minutes ago, they had the following conversation.\n'
+      for row in last_chat.filling: 
+        prev_convo_insert += f'{row[0]}: "{row[1]}"\n'
     if prev_convo_insert == "\n": 
       prev_convo_insert = ""
     if init_persona.a_mem.seq_chat: 
@@ -2336,12 +2334,10 @@ def run_gpt_prompt_agent_chat(maze, persona, target_persona,
                                target_summ_idea, test_input=None, verbose=False): 
   def create_prompt_input(persona, target_persona, curr_context, init_summ_idea, target_summ_idea, test_input=None): 
     prev_convo_insert = "\n"
-    if persona.a_mem.seq_chat: 
-      for i in persona.a_mem.seq_chat: 
-        if i.object == target_persona.scratch.name: 
-          v1 = int((persona.scratch.curr_time - i.created).total_seconds()/60)
-          prev_convo_insert += f'{str(v1)} minutes ago, {persona.scratch.name} and {target_persona.scratch.name} were already {i.description} This context takes place after that conversation.'
-          break
+    last_chat = persona.a_mem.get_last_chat(target_persona.scratch.name)
+    if last_chat: 
+      v1 = int((persona.scratch.curr_time - last_chat.created).total_seconds()/60)
+      prev_convo_insert += f'{str(v1)} minutes ago, {persona.scratch.name} and {target_persona.scratch.name} were already {last_chat.description} This context takes place after that conversation.'
     if prev_convo_insert == "\n": 
       prev_convo_insert = ""
     if persona.a_mem.seq_chat: 
@@ -2822,12 +2818,10 @@ def run_gpt_generate_iterative_chat_utt(maze, init_persona, target_persona, retr
   def create_prompt_input(maze, init_persona, target_persona, retrieved, curr_context, curr_chat, test_input=None):
     persona = init_persona
     prev_convo_insert = "\n"
-    if persona.a_mem.seq_chat: 
-      for i in persona.a_mem.seq_chat: 
-        if i.object == target_persona.scratch.name: 
-          v1 = int((persona.scratch.curr_time - i.created).total_seconds()/60)
-          prev_convo_insert += f'{str(v1)} minutes ago, {persona.scratch.name} and {target_persona.scratch.name} were already {i.description} This context takes place after that conversation.'
-          break
+    last_chat = persona.a_mem.get_last_chat(target_persona.scratch.name)
+    if last_chat: 
+      v1 = int((persona.scratch.curr_time - last_chat.created).total_seconds()/60)
+      prev_convo_insert += f'{str(v1)} minutes ago, {persona.scratch.name} and {target_persona.scratch.name} were already {last_chat.description} This context takes place after that conversation.'
     if prev_convo_insert == "\n": 
       prev_convo_insert = ""
     if persona.a_mem.seq_chat: 
@@ -386,6 +386,15 @@ class ReverieServer:
             movements["persona"][persona_name]["chat"] = (persona
                                                           .scratch.chat)
 
+          # The embeddings that the personas deferred during this step are 
+          # fetched together here, in as few requests as possible. 
+          embedding_batcher.flush()
+
+          # In the lazy loading mode, the associative memories of personas 
+          # that have not used them for a while are unloaded. 
+          for persona_name, persona in self.personas.items(): 
+            persona.unload_if_idle(self.curr_time)
+
           # Include the meta information about the current stage in the 
           # movements dictionary. 
           movements["meta"]["curr_time"] = (self.curr_time 
@@ -550,7 +559,38 @@ class ReverieServer:
           ret_str += f'{self.curr_time.strftime("%B %d, %Y, %H:%M:%S")}\n'
           ret_str += f'steps: {self.step}'
 
-        elif ("print tile event" 
+        elif ("print llm cache stats"
+              in sim_command.lower()):
+          # Print the hit/miss counters of the on-disk LLM response cache.
+          # Ex: print llm cache stats
+          for key, val in llm_cache.stats().items():
+            ret_str += f"{key}: {val}\n"
+
+        elif ("print embedding batcher stats"
+              in sim_command.lower()):
+          # Print how many embedding requests were needed for the texts 
+          # embedded so far. 
+          # Ex: print embedding batcher stats
+          for key, val in embedding_batcher.stats().items():
+            ret_str += f"{key}: {val}\n"
+
+        elif ("print embedding store stats"
+              in sim_command.lower()):
+          # Print the size and hit rate of the simulation-wide embedding 
+          # store. 
+          # Ex: print embedding store stats
+          for key, val in embedding_store.stats().items():
+            ret_str += f"{key}: {val}\n"
+
+        elif ("print retrieval cache stats"
+              in sim_command.lower()):
+          # Print the hit/miss counters of every persona's retrieval cache.
+          # Ex: print retrieval cache stats
+          for persona_name, persona in self.personas.items():
+            ret_str += f"{persona_name}: "
+            ret_str += f"{persona.a_mem.retrieval_cache.stats()}\n"
+
+        elif ("print tile event"
               in sim_command[:16].lower()): 
           # Print the tile events in the tile specified in the prompt 
           # Ex: print tile event 50, 30
@@ -0,0 +1,149 @@
+"""
+File: memory_fixture.py
+Description: Helpers shared by the tests: an empty associative memory on
+disk, deterministic fake embeddings, a comparable summary of a memory, a
+minimal persona, and the baseline (pre-optimisation) retrieval that the
+optimised code must match.
+"""
+import os
+import sys
+import json
+import hashlib
+import datetime
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from persona.memory_structures.associative_memory import AssociativeMemory
+import persona.cognitive_modules.retrieve as retrieve_module
+
+
+def fake_embedding(text, model="text-embedding-ada-002", dim=16):
+  seed = int(hashlib.md5(text.encode()).hexdigest()[:8], 16)
+  return list(np.random.RandomState(seed).randn(dim))
+
+
+def make_memory(folder):
+  """
+  Writes an empty associative memory to <folder> and loads it.
+  """
+  os.makedirs(folder, exist_ok=True)
+  with open(f"{folder}/nodes.json", "w") as f:
+    json.dump(dict(), f)
+  with open(f"{folder}/embeddings.json", "w") as f:
+    json.dump(dict(), f)
+  with open(f"{folder}/kw_strength.json", "w") as f:
+    json.dump({"kw_strength_event": dict(), "kw_strength_thought": dict()}, f)
+  return AssociativeMemory(folder)
+
+
+def add_node(a_mem, node_type, created, description, poignancy=3,
+             keywords=None, expiration=None):
+  s, p, o = description.split(" ", 2) if " " in description else (
+              description, "is", "idle")
+  add = {"event": a_mem.add_event, "thought": a_mem.add_thought,
+         "chat": a_mem.add_chat}[node_type]
+  return add(created, expiration, s, p, o, description,
+             set(keywords or [s]), poignancy,
+             (description, fake_embedding(description)), None)
+
+
+def fill_memory(a_mem, seed=0, n_seconds=6, per_second=12):
+  """
+  Adds events and thoughts in groups that share a creation second (a few of
+  them idle), with poignancy drawn from a small set so that scores tie.
+  """
+  rng = np.random.RandomState(seed)
+  start = datetime.datetime(2023, 2, 13, 9, 0, 0)
+  for second in range(n_seconds):
+    created = start + datetime.timedelta(seconds=second)
+    for count in range(per_second):
+      node_type = "thought" if rng.rand() < 0.4 else "event"
+      topic = ["coffee", "Klaus Mueller", "party", "research"][rng.randint(4)]
+      description = f"Isabella {node_type} {second}-{count} about {topic}"
+      if node_type == "event" and rng.rand() < 0.1:
+        description = f"bed {second}-{count} is idle"
+      add_node(a_mem, node_type, created, description,
+               poignancy=int(rng.choice([1, 3, 5])), keywords=[topic])
+
+
+def node_state(a_mem, node):
+  details = a_mem.node_details(node)
+  # The keywords are a set, so their order in the details is arbitrary.
+  details["keywords"] = sorted(details["keywords"])
+  return details
+
+
+def memory_state(a_mem):
+  """
+  The nodes and indices of <a_mem>, for comparing two memories.
+  """
+  return {"nodes": {node_id: node_state(a_mem, node)
+                    for node_id, node in a_mem.id_to_node.items()},
+          "seq_event": [i.node_id for i in a_mem.seq_event],
+          "seq_thought": [i.node_id for i in a_mem.seq_thought],
+          "seq_chat": [i.node_id for i in a_mem.seq_chat],
+          "kw_to_event": {kw: [i.node_id for i in nodes]
+                          for kw, nodes in a_mem.kw_to_event.items()},
+          "kw_strength_event": a_mem.kw_strength_event,
+          "n_nodes": a_mem.n_nodes,
+          "type_counts": a_mem.type_counts}
+
+
+class FakeScratch:
+  def __init__(self, curr_time):
+    self.curr_time = curr_time
+    self.recency_w = 1
+    self.relevance_w = 1
+    self.importance_w = 1
+    self.recency_decay = 0.995
+    self.importance_ele_n = 0
+
+
+class FakePersona:
+  def __init__(self, a_mem, curr_time):
+    self.name = "Isabella Rodriguez"
+    self.a_mem = a_mem
+    self.scratch = FakeScratch(curr_time)
+
+
+def baseline_retrieve(persona, focal_points, n_count=30):
+  """
+  The original new_retrieve: sorts every non-idle event and thought by
+  last_accessed for each focal point and scores them with dictionaries.
+  """
+  R = retrieve_module
+  retrieved = dict()
+  for focal_pt in focal_points:
+    nodes = [[i.last_accessed, i]
+             for i in persona.a_mem.seq_event + persona.a_mem.seq_thought
+             if "idle" not in i.embedding_key]
+    nodes = sorted(nodes, key=lambda x: x[0])
+    nodes = [i for created, i in nodes]
+
+    recency_out = R.normalize_dict_floats(R.extract_recency(persona, nodes),
+                                          0, 1)
+    importance_out = R.normalize_dict_floats(
+                       R.extract_importance(persona, nodes), 0, 1)
+    relevance_out = R.normalize_dict_floats(
+                      R.extract_relevance(persona, nodes, focal_pt), 0, 1)
+
+    gw = [0.5, 3, 2]
+    master_out = dict()
+    for key in recency_out.keys():
+      master_out[key] = (persona.scratch.recency_w*recency_out[key]*gw[0]
+                     + persona.scratch.relevance_w*relevance_out[key]*gw[1]
+                     + persona.scratch.importance_w*importance_out[key]*gw[2])
+    master_out = R.top_highest_x_values(master_out, n_count)
+    master_nodes = [persona.a_mem.id_to_node[key]
+                    for key in list(master_out.keys())]
+    for n in master_nodes:
+      n.last_accessed = persona.scratch.curr_time
+    retrieved[focal_pt] = master_nodes
+  return retrieved
+
+
+def node_ids(retrieved):
+  return {focal_pt: [i.node_id for i in nodes]
+          for focal_pt, nodes in retrieved.items()}
@@ -0,0 +1,80 @@
+"""
+File: test_embedding_storage.py
+Description: Tests that the binary embedding format (embedding_storage.py)
+recovers from a save that was interrupted part-way.
+
+Usage (from reverie/backend_server):
+  python -m unittest tests/test_embedding_storage.py
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from persona.memory_structures.embedding_storage import *
+
+
+def make_embeddings(keys, dim=8):
+  return {key: np.random.RandomState(count).randn(dim).astype(np.float32)
+          for count, key in enumerate(keys)}
+
+
+class InterruptedSaveTest(unittest.TestCase):
+  def setUp(self):
+    self.folder = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.folder)
+
+  def assert_loaded(self, embeddings, dtype):
+    loaded = load_binary_embeddings(self.folder)
+    self.assertEqual(list(loaded), list(embeddings))
+    for key, vec in embeddings.items():
+      atol = 1e-6 if dtype == "float32" else 0.05
+      np.testing.assert_allclose(np.asarray(loaded[key], dtype=np.float32),
+                                 vec, atol=atol)
+
+  def interrupted_append(self, embeddings, dtype, partial_key):
+    # Writes the rows (and scales) of <embeddings> as an append would, but
+    # stops before the keys; with <partial_key>, half of the first key line
+    # is written.
+    data, scale = quantize_rows(np.stack(list(embeddings.values())), dtype)
+    with open(f"{self.folder}/{embedding_rows_files[dtype]}", "ab") as f:
+      f.write(data.tobytes())
+    if scale is not None:
+      with open(f"{self.folder}/{embedding_scale_file}", "ab") as f:
+        f.write(scale.tobytes())
+    if partial_key:
+      line = json.dumps(next(iter(embeddings))) + "\n"
+      with open(f"{self.folder}/{embedding_keys_file}", "a") as f:
+        f.write(line[:len(line) // 2])
+
+  def test_append_after_interrupted_save(self):
+    for dtype in ["float32", "float16", "int8"]:
+      for partial_key in [False, True]:
+        with self.subTest(dtype=dtype, partial_key=partial_key):
+          for f in os.listdir(self.folder):
+            os.remove(f"{self.folder}/{f}")
+          first = make_embeddings(["a", "b", "c"])
+          append_binary_embeddings(self.folder, first, dtype)
+
+          lost = make_embeddings(["lost 1", "lost 2"])
+          self.interrupted_append(lost, dtype, partial_key)
+          self.assert_loaded(first, dtype)
+
+          # The next save appends the lost keys again, with new ones, and
+          # every key must still be paired with its own vector.
+          second = dict(first)
+          second.update(make_embeddings(["d", "lost 1", "lost 2", "e"]))
+          self.assertEqual(append_binary_embeddings(self.folder, second), 4)
+          self.assert_loaded(second, dtype)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,65 @@
+"""
+File: test_embedding_store.py
+Description: Tests the holder counts of the shared EmbeddingStore
+(embedding_store.py) and the bound on the vectors that nothing holds, such
+as the embeddings of focal points and queries.
+
+Usage (from reverie/backend_server):
+  python -m unittest tests/test_embedding_store.py
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import persona.memory_structures.embedding_store as embedding_store_module
+from persona.memory_structures.embedding_store import EmbeddingStore
+
+
+class EmbeddingStoreTest(unittest.TestCase):
+  def setUp(self):
+    self.store = EmbeddingStore()
+    patch = mock.patch.object(embedding_store_module,
+                              "embedding_store_unheld_size", 3)
+    patch.start()
+    self.addCleanup(patch.stop)
+
+  def test_unheld_vectors_are_bounded(self):
+    for count in range(10):
+      self.store.intern(f"query {count}", [float(count)])
+    self.assertEqual(sorted(self.store.vectors),
+                     ["query 7", "query 8", "query 9"])
+
+    # A lookup keeps a vector; the least recently used one goes first.
+    self.assertIsNotNone(self.store.get("query 7"))
+    self.store.intern("query 10", [10.0])
+    self.assertEqual(sorted(self.store.vectors),
+                     ["query 10", "query 7", "query 9"])
+
+  def test_held_vectors_are_kept_until_released(self):
+    self.store.intern("bed is idle", [1.0], hold=True)
+    self.store.intern("bed is idle", [1.0], hold=True)
+    for count in range(10):
+      self.store.intern(f"query {count}", [float(count)])
+    self.assertIn("bed is idle", self.store.vectors)
+
+    # Two memories hold the key; it is dropped when both have released it.
+    self.assertEqual(self.store.release(["bed is idle"]), 0)
+    self.assertIn("bed is idle", self.store.vectors)
+    self.assertEqual(self.store.release(["bed is idle"]), 1)
+    self.assertNotIn("bed is idle", self.store.vectors)
+
+  def test_holding_an_unheld_vector(self):
+    # A focal point that later becomes a memory's embedding key.
+    first = self.store.intern("Klaus is reading", [1.0])
+    self.assertIs(self.store.intern("Klaus is reading", [1.0], hold=True),
+                  first)
+    for count in range(10):
+      self.store.intern(f"query {count}", [float(count)])
+    self.assertIs(self.store.get("Klaus is reading"), first)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,81 @@
+"""
+File: test_llm_cache.py
+Description: Tests which prompts safe_generate_response answers from the LLM
+response cache (llm_cache.py): deterministic prompts are reused, sampled
+ones and invalid cached responses are requested again.
+
+Usage (from reverie/backend_server):
+  python -m unittest tests/test_llm_cache.py
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import persona.prompt_template.gpt_structure as gpt_structure
+from persona.prompt_template.llm_cache import LLMResponseCache
+
+
+def make_gpt_param(temperature):
+  return {"engine": "text-davinci-003", "max_tokens": 50,
+          "temperature": temperature, "top_p": 1, "stream": False,
+          "frequency_penalty": 0, "presence_penalty": 0, "stop": None}
+
+
+class LLMCacheTest(unittest.TestCase):
+  def setUp(self):
+    self.folder = tempfile.mkdtemp()
+    self.responses = iter(f"response {count}" for count in range(100))
+    self.requests = []
+    for patch in [mock.patch.object(gpt_structure, "llm_cache",
+                                    LLMResponseCache(cache_dir=self.folder)),
+                  mock.patch.object(gpt_structure, "GPT_request",
+                                    self.fake_request)]:
+      patch.start()
+      self.addCleanup(patch.stop)
+
+  def tearDown(self):
+    shutil.rmtree(self.folder)
+
+  def fake_request(self, prompt, gpt_parameter):
+    self.requests += [prompt]
+    return next(self.responses)
+
+  def generate(self, gpt_param, func_validate=None):
+    prompt = gpt_structure.TemplatePrompt("Plan the day of Isabella.")
+    prompt.template = "persona/prompt_template/v2/daily_planning_v6.txt"
+    return gpt_structure.safe_generate_response(
+             prompt, gpt_param, 5, "error",
+             func_validate or (lambda response, prompt=None: True),
+             lambda response, prompt=None: response)
+
+  def test_deterministic_prompt_is_cached(self):
+    self.assertEqual(self.generate(make_gpt_param(0)), "response 0")
+    self.assertEqual(self.generate(make_gpt_param(0)), "response 0")
+    self.assertEqual(len(self.requests), 1)
+
+  def test_sampled_prompt_is_not_cached(self):
+    # e.g., the retries of generate_hourly_schedule in plan.py must get a
+    # fresh sample every time.
+    self.assertEqual(self.generate(make_gpt_param(0.5)), "response 0")
+    self.assertEqual(self.generate(make_gpt_param(0.5)), "response 1")
+    self.assertEqual(gpt_structure.llm_cache.stats()["entries"], 0)
+
+  def test_invalid_cached_response_is_requested_again(self):
+    self.generate(make_gpt_param(0))
+
+    def func_validate(response, prompt=None):
+      if response == "response 0":
+        raise ValueError(response)
+      return True
+    self.assertEqual(self.generate(make_gpt_param(0), func_validate),
+                     "response 1")
+    self.assertEqual(len(self.requests), 2)
+
+
+if __name__ == '__main__':
+  unittest.main()
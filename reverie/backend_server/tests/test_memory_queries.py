@@ -0,0 +1,113 @@
+"""
+File: test_memory_queries.py
+Description: Tests the indexed memory queries of AssociativeMemory
+(get_last_chat, get_chats_with and query_nodes, over the TimeIndex in
+time_index.py) against linear scans of the memory stream.
+
+Usage (from reverie/backend_server):
+  python -m unittest tests/test_memory_queries.py
+"""
+import os
+import sys
+import random
+import shutil
+import datetime
+import tempfile
+import unittest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from memory_fixture import *
+
+
+partners = ["Klaus Mueller", "Maria Lopez", "Tom Moreno"]
+topics = ["coffee", "party", "research", "Klaus Mueller"]
+
+
+def scan_last_chat(a_mem, name):
+  # The original lookup: the newest chat with the partner's name as keyword.
+  if name.lower() in a_mem.kw_to_chat:
+    return a_mem.kw_to_chat[name.lower()][0]
+  return False
+
+
+def scan_chats_with(a_mem, name, start=None, end=None):
+  return [i for i in a_mem.seq_chat if i.object == name
+          and (start is None or i.created >= start)
+          and (end is None or i.created <= end)]
+
+
+def scan_nodes(a_mem, node_type=None, start=None, end=None, keywords=None,
+               limit=None):
+  if node_type is None:
+    node_type = ["event", "chat", "thought"]
+  elif isinstance(node_type, str):
+    node_type = [node_type]
+  nodes = []
+  for i in a_mem.seq_event + a_mem.seq_chat + a_mem.seq_thought:
+    if (i.type in node_type
+        and (start is None or i.created >= start)
+        and (end is None or i.created <= end)
+        and (keywords is None or set(k.lower() for k in i.keywords)
+                                 & set(k.lower() for k in keywords))):
+      nodes += [i]
+  nodes = sorted(nodes, key=lambda x: (x.created, x.node_count),
+                 reverse=True)
+  return nodes[:limit]
+
+
+class MemoryQueriesTest(unittest.TestCase):
+  def setUp(self):
+    self.folder = tempfile.mkdtemp()
+    self.a_mem = make_memory(self.folder)
+    self.start = datetime.datetime(2023, 2, 13, 9)
+    rng = random.Random(0)
+    for count in range(300):
+      # Three nodes a minute. Chats are added at the current time (as in 
+      # perceive.py); a few events and thoughts are added late.
+      minutes = count // 3
+      node_type = rng.choice(["event", "event", "thought", "chat"])
+      if node_type != "chat" and rng.random() < 0.1:
+        minutes = max(minutes - rng.randint(1, 20), 0)
+      created = self.start + datetime.timedelta(minutes=minutes)
+      if node_type == "chat":
+        partner = rng.choice(partners)
+        add_node(self.a_mem, "chat", created, f"Isabella chats {partner}",
+                 keywords=["Isabella", partner])
+      else:
+        topic = rng.choice(topics)
+        add_node(self.a_mem, node_type, created,
+                 f"Isabella {node_type} {count} about {topic}",
+                 keywords=[topic, "Isabella"])
+    self.times = [None] + [self.start + datetime.timedelta(minutes=i)
+                           for i in [-5, 0, 17, 42, 42.5, 80, 200]]
+
+  def tearDown(self):
+    shutil.rmtree(self.folder)
+
+  def test_last_chat(self):
+    for name in partners + ["Jane Moreno"]:
+      self.assertIs(self.a_mem.get_last_chat(name),
+                    scan_last_chat(self.a_mem, name))
+
+  def test_chats_with(self):
+    for name in partners + ["Jane Moreno"]:
+      for start in self.times:
+        for end in self.times:
+          self.assertEqual(self.a_mem.get_chats_with(name, start, end),
+                           scan_chats_with(self.a_mem, name, start, end),
+                           (name, start, end))
+
+  def test_query_nodes(self):
+    for node_type in [None, "event", "chat", ["event", "thought"]]:
+      for keywords in [None, ["coffee"], ["Klaus Mueller", "PARTY"]]:
+        for limit in [None, 1, 25]:
+          for start, end in zip(self.times, self.times[2:] + [None, None]):
+            self.assertEqual(
+              self.a_mem.query_nodes(node_type, start, end, keywords, limit),
+              scan_nodes(self.a_mem, node_type, start, end, keywords, limit),
+              (node_type, keywords, limit, start, end))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,78 @@
+"""
+File: test_newest_first_list.py
+Description: Tests that a NewestFirstList (newest_first_list.py) reads the
+same as the list built with lst[0:0] = [item] that it replaces.
+
+Usage (from reverie/backend_server):
+  python -m unittest tests/test_newest_first_list.py
+"""
+import os
+import sys
+import random
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from persona.memory_structures.newest_first_list import *
+
+
+class NewestFirstListTest(unittest.TestCase):
+  def assert_same(self, newest_first, expected):
+    self.assertEqual(list(newest_first), expected)
+    self.assertEqual(list(reversed(newest_first)), expected[::-1])
+    self.assertEqual(len(newest_first), len(expected))
+    self.assertEqual(bool(newest_first), bool(expected))
+    self.assertEqual(newest_first, expected)
+    for index in range(-len(expected), len(expected)):
+      self.assertEqual(newest_first[index], expected[index])
+    for index in [len(expected), -len(expected) - 1]:
+      with self.assertRaises(IndexError):
+        newest_first[index]
+    for start in [None, 0, 1, 3, -2, -7, 100]:
+      for stop in [None, 0, 2, 5, -1, -4, 100]:
+        for step in [None, 1, 2, -1, -3]:
+          self.assertEqual(newest_first[start:stop:step],
+                           expected[start:stop:step], (start, stop, step))
+
+  def test_reads_like_a_prepended_list(self):
+    rng = random.Random(0)
+    newest_first = NewestFirstList()
+    expected = []
+    self.assert_same(newest_first, expected)
+    for item in range(30):
+      newest_first.prepend(item)
+      expected[0:0] = [item]
+      self.assert_same(newest_first, expected)
+
+      if rng.random() < 0.2:
+        removed = rng.choice(expected)
+        newest_first.remove(removed)
+        expected.remove(removed)
+        self.assert_same(newest_first, expected)
+
+    removed = set(rng.sample(expected, 5))
+    newest_first.remove_all(removed)
+    expected = [i for i in expected if i not in removed]
+    self.assert_same(newest_first, expected)
+
+  def test_constructed_from_a_newest_first_list(self):
+    newest_first = NewestFirstList([3, 2, 1])
+    self.assert_same(newest_first, [3, 2, 1])
+    newest_first.prepend(4)
+    self.assert_same(newest_first, [4, 3, 2, 1])
+    self.assertIn(2, newest_first)
+    self.assertNotIn(5, newest_first)
+
+  def test_concatenation(self):
+    events = NewestFirstList([3, 2, 1])
+    thoughts = NewestFirstList([6, 5])
+    # e.g., seq_event + seq_thought in retrieve.py
+    self.assertEqual(events + thoughts, [3, 2, 1, 6, 5])
+    self.assertEqual([0] + events, [0, 3, 2, 1])
+    self.assertEqual(events + [0], [3, 2, 1, 0])
+    self.assertEqual(NewestFirstList([1, 2]), NewestFirstList([1, 2]))
+    self.assertNotEqual(NewestFirstList([1, 2]), NewestFirstList([2, 1]))
+
+
+if __name__ == '__main__':
+  unittest.main()
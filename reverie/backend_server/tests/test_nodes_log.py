@@ -0,0 +1,138 @@
+"""
+File: test_nodes_log.py
+Description: Tests that AssociativeMemory.save() appends new nodes to the
+write-ahead log (nodes_log.jsonl), that loading replays the checkpoint and
+the log into the same memory, and when the log is compacted into nodes.json.
+
+Usage (from reverie/backend_server):
+  python -m unittest tests/test_nodes_log.py
+"""
+import os
+import sys
+import json
+import shutil
+import datetime
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from memory_fixture import *
+import persona.memory_structures.associative_memory as associative_memory
+from persona.memory_structures.associative_memory import AssociativeMemory
+
+
+class NodesLogTest(unittest.TestCase):
+  def setUp(self):
+    self.folder = tempfile.mkdtemp()
+    self.a_mem = make_memory(self.folder)
+    self.created = datetime.datetime(2023, 2, 13, 9)
+
+  def tearDown(self):
+    shutil.rmtree(self.folder)
+
+  def add_nodes(self, count):
+    for _ in range(count):
+      self.created += datetime.timedelta(seconds=10)
+      n = self.a_mem.n_nodes
+      node_type = ["event", "thought", "event", "chat"][n % 4]
+      add_node(self.a_mem, node_type, self.created,
+               f"Isabella {node_type} {n} about coffee",
+               keywords=["coffee", f"topic {n % 3}"])
+
+  def read_log(self):
+    with open(f"{self.folder}/nodes_log.jsonl") as f:
+      return [json.loads(line)["node_id"] for line in f]
+
+  def read_checkpoint(self):
+    with open(f"{self.folder}/nodes.json") as f:
+      return json.load(f)
+
+  def test_save_appends_and_load_replays(self):
+    self.add_nodes(5)
+    self.a_mem.save(self.folder)
+    self.add_nodes(3)
+    self.a_mem.save(self.folder)
+    # Saving again without new nodes appends nothing.
+    self.a_mem.save(self.folder)
+
+    self.assertEqual(self.read_checkpoint(), {})
+    self.assertEqual(self.read_log(), [f"node_{i}" for i in range(1, 9)])
+    self.assertEqual(memory_state(AssociativeMemory(self.folder)),
+                     memory_state(self.a_mem))
+
+  def test_interrupted_append_is_ignored_and_compacted(self):
+    self.add_nodes(4)
+    self.a_mem.save(self.folder)
+    with open(f"{self.folder}/nodes_log.jsonl", "a") as f:
+      f.write('{"node_count": 5, "type": "ev')
+
+    loaded = AssociativeMemory(self.folder)
+    self.assertEqual(memory_state(loaded), memory_state(self.a_mem))
+    self.assertFalse(loaded.nodes_saved["intact"])
+
+    # The next save rewrites the checkpoint and empties the log.
+    loaded.save(self.folder)
+    self.assertEqual(sorted(self.read_checkpoint()),
+                     sorted(f"node_{i}" for i in range(1, 5)))
+    self.assertEqual(self.read_log(), [])
+    self.assertEqual(memory_state(AssociativeMemory(self.folder)),
+                     memory_state(self.a_mem))
+
+  def test_long_log_is_compacted(self):
+    with mock.patch.object(associative_memory, "nodes_log_compact_min", 4):
+      self.add_nodes(4)
+      self.a_mem.save(self.folder)
+      self.assertEqual(len(self.read_log()), 4)
+
+      # Five logged nodes are more than both the minimum and the (empty)
+      # checkpoint.
+      self.add_nodes(1)
+      self.a_mem.save(self.folder)
+      self.assertEqual(len(self.read_checkpoint()), 5)
+      self.assertEqual(self.read_log(), [])
+
+      # The log may now grow up to the size of the checkpoint.
+      self.add_nodes(5)
+      self.a_mem.save(self.folder)
+      self.assertEqual(len(self.read_checkpoint()), 5)
+      self.assertEqual(len(self.read_log()), 5)
+      self.add_nodes(1)
+      self.a_mem.save(self.folder)
+      self.assertEqual(len(self.read_checkpoint()), 11)
+      self.assertEqual(self.read_log(), [])
+
+    self.assertEqual(memory_state(AssociativeMemory(self.folder)),
+                     memory_state(self.a_mem))
+
+  def test_checkpoint_written_before_log_was_emptied(self):
+    self.add_nodes(3)
+    self.a_mem.save(self.folder)
+    log = open(f"{self.folder}/nodes_log.jsonl").read()
+    # A compaction that stopped after writing nodes.json leaves the nodes
+    # in both files.
+    self.a_mem.nodes_saved["intact"] = False
+    self.a_mem.save(self.folder)
+    self.assertEqual(len(self.read_checkpoint()), 3)
+    with open(f"{self.folder}/nodes_log.jsonl", "w") as f:
+      f.write(log)
+    self.assertEqual(memory_state(AssociativeMemory(self.folder)),
+                     memory_state(self.a_mem))
+
+  def test_save_to_new_folder_writes_checkpoint(self):
+    self.add_nodes(3)
+    self.a_mem.save(self.folder)
+    new_folder = f"{self.folder}/fork"
+    os.makedirs(new_folder)
+    self.add_nodes(2)
+    self.a_mem.save(new_folder)
+    with open(f"{new_folder}/nodes.json") as f:
+      self.assertEqual(len(json.load(f)), 5)
+    self.assertEqual(open(f"{new_folder}/nodes_log.jsonl").read(), "")
+    self.assertEqual(memory_state(AssociativeMemory(new_folder)),
+                     memory_state(self.a_mem))
+
+
+if __name__ == '__main__':
+  unittest.main()
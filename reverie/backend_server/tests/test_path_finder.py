@@ -0,0 +1,120 @@
+"""
+File: test_path_finder.py
+Description: Tests the path finders over the compiled collision grid
+(path_finder.py): on the_ville, path_finder_bfs and path_finder_multi
+against path_finder_v2, which the simulation used before.
+
+Usage (from reverie/backend_server):
+  python -m unittest tests/test_path_finder.py
+"""
+import os
+import sys
+import random
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from maze import Maze
+import path_finder as path_finder_module
+from path_finder import *
+from utils import collision_block_id
+
+
+small_maze = [['#', '#', '#', '#', '#', '#', '#', '#', '#', '#', '#', '#', '#'],
+              [' ', ' ', '#', ' ', ' ', ' ', ' ', ' ', '#', ' ', ' ', ' ', '#'],
+              ['#', ' ', '#', ' ', ' ', '#', '#', ' ', ' ', ' ', '#', ' ', '#'],
+              ['#', ' ', '#', ' ', ' ', '#', '#', ' ', '#', ' ', '#', ' ', '#'],
+              ['#', ' ', ' ', ' ', ' ', ' ', ' ', ' ', '#', ' ', ' ', ' ', '#'],
+              ['#', '#', '#', ' ', '#', ' ', '#', '#', '#', ' ', '#', ' ', '#'],
+              ['#', ' ', ' ', ' ', ' ', ' ', ' ', ' ', ' ', ' ', '#', ' ', ' '],
+              ['#', '#', '#', '#', '#', '#', '#', '#', '#', '#', '#', '#', '#']]
+
+
+class RawMazeTest(unittest.TestCase):
+  def setUp(self):
+    path_finder_module.compiled_grids.clear()
+
+  def test_raw_maze_is_compiled_once(self):
+    path = path_finder(small_maze, (0, 1), (11, 4), "#")
+    self.assertEqual(path[0], (0, 1))
+    self.assertEqual(path[-1], (11, 4))
+    grid = compiled_grid(small_maze, "#")
+    self.assertEqual(len(path_finder(small_maze, (11, 4), (0, 1), "#")),
+                     len(path))
+    self.assertIs(compiled_grid(small_maze, "#"), grid)
+    self.assertEqual(len(path_finder_module.compiled_grids), 1)
+
+  def test_compiled_grids_are_bounded(self):
+    mazes = [[row[:] for row in small_maze] for _ in range(10)]
+    for maze in mazes:
+      path_finder(maze, (0, 1), (11, 4), "#")
+    self.assertEqual(len(path_finder_module.compiled_grids),
+                     path_finder_module.compiled_grids_size)
+    self.assertIs(compiled_grid(mazes[-1], "#"),
+                  compiled_grid(mazes[-1], "#"))
+
+
+class TheVilleTest(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.maze = Maze("the_ville")
+    cls.grid = cls.maze.collision_grid
+    cls.walkable = [(row, col) for row in range(cls.grid.height)
+                    for col in range(cls.grid.width)
+                    if not cls.grid.blocked[row][col]]
+
+  def v2_path(self, start, end):
+    """
+    path_finder_v2's path, or None where it gives up (after 150 steps) or
+    <end> cannot be reached.
+    """
+    path = path_finder_v2(self.maze.collision_maze, start, end,
+                          collision_block_id)
+    if path == [end] and start != end:
+      return None
+    return path
+
+  def test_bfs_matches_v2(self):
+    rng = random.Random(0)
+    n_compared = 0
+    for _ in range(20):
+      start, end = rng.choice(self.walkable), rng.choice(self.walkable)
+      # Nearby ends, which path_finder_v2 always reaches.
+      near = (min(max(start[0] + rng.randint(-15, 15), 0), self.grid.height-1),
+              min(max(start[1] + rng.randint(-15, 15), 0), self.grid.width-1))
+      for curr_end in [end, near, start]:
+        v2_path = self.v2_path(start, curr_end)
+        bfs_path = path_finder_bfs(self.grid, start, curr_end)
+        if v2_path is None:
+          self.assertTrue(bfs_path == [curr_end] or len(bfs_path) > 150)
+          continue
+        self.assertEqual(bfs_path, v2_path, (start, curr_end))
+        n_compared += 1
+        # path_finder() takes and returns (x, y) tiles.
+        self.assertEqual(
+          path_finder(self.grid, start[::-1], curr_end[::-1],
+                      collision_block_id),
+          [i[::-1] for i in v2_path])
+    self.assertGreater(n_compared, 30)
+
+  def test_multi_reaches_nearest_end(self):
+    rng = random.Random(1)
+    for _ in range(15):
+      start = rng.choice(self.walkable)
+      ends = [(min(max(start[0] + rng.randint(-20, 20), 0),
+                   self.grid.height-1),
+               min(max(start[1] + rng.randint(-20, 20), 0),
+                   self.grid.width-1)) for _ in range(4)]
+      # One search per end, as execute() did with path_finder_v2.
+      v2_paths = [i for i in [self.v2_path(start, end) for end in ends] if i]
+      end, path = path_finder_multi(self.grid, start, ends)
+      if not v2_paths:
+        self.assertEqual((end, path), (None, None))
+        continue
+      self.assertIn(end, ends)
+      self.assertEqual(len(path), min(len(i) for i in v2_paths))
+      self.assertEqual(path, self.v2_path(start, end))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,132 @@
+"""
+File: test_persona_snapshot.py
+Description: Tests that an associative memory loaded from its binary
+snapshot (persona_snapshot.py) is the same as one loaded from JSON, and that
+a snapshot is not used once the files it stands in for have changed.
+
+Usage (from reverie/backend_server):
+  python -m unittest tests/test_persona_snapshot.py
+"""
+import os
+import sys
+import shutil
+import datetime
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from memory_fixture import *
+import persona.persona_snapshot as persona_snapshot
+from persona.persona_snapshot import *
+from persona.memory_structures.associative_memory import AssociativeMemory
+
+
+persona_name = "Isabella Rodriguez"
+
+
+class PersonaSnapshotTest(unittest.TestCase):
+  def setUp(self):
+    self.folder = tempfile.mkdtemp()
+    self.f_a_mem = f"{self.folder}/associative_memory"
+    self.a_mem = make_memory(self.f_a_mem)
+    fill_memory(self.a_mem)
+    add_node(self.a_mem, "chat", datetime.datetime(2023, 2, 13, 9, 30),
+             "Isabella chats Klaus Mueller", keywords=["Klaus Mueller"])
+    self.a_mem.save(self.f_a_mem)
+    save_a_mem_snapshot(persona_name, self.a_mem, self.f_a_mem)
+
+    self.patches = [mock.patch.object(retrieve_module, name, fake_embedding)
+                    for name in ["get_embedding", "get_embedding_deferred"]]
+    self.patches += [mock.patch.object(retrieve_module, "debug", False)]
+    for patch in self.patches:
+      patch.start()
+
+  def tearDown(self):
+    for patch in self.patches:
+      patch.stop()
+    shutil.rmtree(self.folder)
+
+  def test_round_trip(self):
+    loaded = load_a_mem_snapshot(persona_name, self.f_a_mem)
+    from_json = AssociativeMemory(self.f_a_mem)
+    self.assertIsNotNone(loaded)
+    self.assertEqual(memory_state(loaded), memory_state(from_json))
+    self.assertEqual(sorted(loaded.embeddings), sorted(from_json.embeddings))
+    self.assertEqual(loaded.nodes_saved["folder"],
+                     os.path.abspath(self.f_a_mem))
+    self.assertEqual([i.node_id for i in loaded.recency_index.nodes()],
+                     [i.node_id for i in from_json.recency_index.nodes()])
+
+    # Both retrieve the same nodes, e.g., through the embedding matrix that
+    # is refilled after loading.
+    curr_time = datetime.datetime(2023, 2, 13, 10)
+    for focal_points in [["Klaus Mueller"], ["coffee", "party"]]:
+      self.assertEqual(
+        node_ids(retrieve_module.new_retrieve(
+                   FakePersona(loaded, curr_time), focal_points, 10)),
+        node_ids(retrieve_module.new_retrieve(
+                   FakePersona(from_json, curr_time), focal_points, 10)))
+
+  def test_restored_in_another_folder(self):
+    # e.g., a simulation forked from the one that wrote the snapshot.
+    f_fork = f"{self.folder}/fork"
+    shutil.copytree(self.f_a_mem, f_fork)
+    loaded = load_a_mem_snapshot(persona_name, f_fork)
+    self.assertIsNotNone(loaded)
+    self.assertEqual(loaded.nodes_saved["folder"], os.path.abspath(f_fork))
+    self.assertEqual(memory_state(loaded), memory_state(self.a_mem))
+
+  def test_changed_files_invalidate_snapshot(self):
+    # Saved without a snapshot (the log gets the new node).
+    add_node(self.a_mem, "event", datetime.datetime(2023, 2, 13, 9, 31),
+             "Isabella is baking")
+    self.a_mem.save(self.f_a_mem)
+    self.assertIsNone(load_a_mem_snapshot(persona_name, self.f_a_mem))
+
+    save_a_mem_snapshot(persona_name, self.a_mem, self.f_a_mem)
+    loaded = load_a_mem_snapshot(persona_name, self.f_a_mem)
+    self.assertEqual(memory_state(loaded), memory_state(self.a_mem))
+
+    # A new file in the folder (e.g., the cold memory archive).
+    with open(f"{self.f_a_mem}/notes.txt", "w") as f:
+      f.write("notes")
+    self.assertIsNone(load_a_mem_snapshot(persona_name, self.f_a_mem))
+
+  def test_other_persona_or_version_is_not_used(self):
+    self.assertIsNone(load_a_mem_snapshot("Klaus Mueller", self.f_a_mem))
+    with mock.patch.object(persona_snapshot, "persona_snapshot_version",
+                           persona_snapshot_version + 1):
+      self.assertIsNone(load_a_mem_snapshot(persona_name, self.f_a_mem))
+    with mock.patch.object(persona_snapshot, "persona_snapshot_enabled",
+                           False):
+      self.assertIsNone(load_a_mem_snapshot(persona_name, self.f_a_mem))
+    self.assertIsNotNone(load_a_mem_snapshot(persona_name, self.f_a_mem))
+
+  def test_excluded_folder_is_not_fingerprinted(self):
+    # The persona snapshot stands in for bootstrap_memory without the
+    # associative_memory folder, which has its own snapshot.
+    write_snapshot(self.folder, persona_name, {"scratch": "scratch"},
+                   exclude=("associative_memory",))
+    add_node(self.a_mem, "event", datetime.datetime(2023, 2, 13, 9, 31),
+             "Isabella is baking")
+    self.a_mem.save(self.f_a_mem)
+    self.assertEqual(read_snapshot(self.folder, persona_name,
+                                   exclude=("associative_memory",)),
+                     {"scratch": "scratch"})
+
+    with open(f"{self.folder}/scratch.json", "w") as f:
+      f.write("{}")
+    self.assertIsNone(read_snapshot(self.folder, persona_name,
+                                    exclude=("associative_memory",)))
+
+  def test_unreadable_snapshot_is_not_used(self):
+    with open(f"{self.f_a_mem}/{persona_snapshot_file}", "r+b") as f:
+      f.truncate(100)
+    with mock.patch("builtins.print"):
+      self.assertIsNone(read_snapshot(self.f_a_mem, persona_name))
+
+
+if __name__ == '__main__':
+  unittest.main()
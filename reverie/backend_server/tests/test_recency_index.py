@@ -0,0 +1,83 @@
+"""
+File: test_recency_index.py
+Description: Tests that retrieval over the RecencyIndex (recency_index.py)
+returns the same nodes, in the same order, as the original sort by
+last_accessed, including when many nodes share a second.
+
+Usage (from reverie/backend_server):
+  python -m unittest tests/test_recency_index.py
+"""
+import os
+import sys
+import shutil
+import datetime
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from memory_fixture import *
+
+
+class RecencyIndexTest(unittest.TestCase):
+  def setUp(self):
+    self.folder = tempfile.mkdtemp()
+    self.patches = [mock.patch.object(retrieve_module, name, fake_embedding)
+                    for name in ["get_embedding", "get_embedding_deferred"]]
+    self.patches += [mock.patch.object(retrieve_module, "debug", False)]
+    for patch in self.patches:
+      patch.start()
+
+  def tearDown(self):
+    for patch in self.patches:
+      patch.stop()
+    shutil.rmtree(self.folder)
+
+  def make_persona(self, name, curr_time):
+    a_mem = make_memory(f"{self.folder}/{name}")
+    fill_memory(a_mem)
+    return FakePersona(a_mem, curr_time)
+
+  def test_index_order_matches_sort(self):
+    persona = self.make_persona("a", datetime.datetime(2023, 2, 13, 10))
+    expected = sorted([i for i in persona.a_mem.seq_event
+                       + persona.a_mem.seq_thought
+                       if "idle" not in i.embedding_key],
+                      key=lambda x: x.last_accessed)
+    self.assertEqual(persona.a_mem.recency_index.nodes(), expected)
+
+  def test_retrieve_matches_baseline(self):
+    for cache_enabled in [False, True]:
+      with self.subTest(cache_enabled=cache_enabled), \
+           mock.patch.object(retrieve_module, "retrieval_cache_enabled",
+                             cache_enabled):
+        start = datetime.datetime(2023, 2, 13, 10)
+        persona = self.make_persona(f"new_{cache_enabled}", start)
+        baseline = self.make_persona(f"old_{cache_enabled}", start)
+        queries = [["Klaus Mueller"], ["coffee", "party"], ["Klaus Mueller"],
+                   ["research", "Klaus Mueller", "research"], ["party"]]
+        for step, focal_points in enumerate(queries * 3):
+          curr_time = start + datetime.timedelta(seconds=10 * (step // 2))
+          persona.scratch.curr_time = curr_time
+          baseline.scratch.curr_time = curr_time
+          self.assertEqual(
+            node_ids(retrieve_module.new_retrieve(persona, focal_points, 10)),
+            node_ids(baseline_retrieve(baseline, focal_points, 10)))
+          if step == 6:
+            # New nodes in the same second as the retrieved ones.
+            for i in [persona, baseline]:
+              add_node(i.a_mem, "thought", curr_time, "Isabella thinks again")
+              add_node(i.a_mem, "event", curr_time, "Isabella sees Klaus")
+
+        expected = sorted([i for i in baseline.a_mem.seq_event
+                           + baseline.a_mem.seq_thought
+                           if "idle" not in i.embedding_key],
+                          key=lambda x: x.last_accessed)
+        self.assertEqual([i.node_id for i in
+                          persona.a_mem.recency_index.nodes()],
+                         [i.node_id for i in expected])
+
+
+if __name__ == '__main__':
+  unittest.main()
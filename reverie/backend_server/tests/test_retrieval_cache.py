@@ -0,0 +1,73 @@
+"""
+File: test_retrieval_cache.py
+Description: Tests that new_retrieve returns the same nodes with and without
+the per-persona retrieval cache (retrieval_cache.py), across repeated focal
+points, new events and nodes touched outside of retrieval.
+
+Usage (from reverie/backend_server):
+  python -m unittest tests/test_retrieval_cache.py
+"""
+import os
+import sys
+import shutil
+import datetime
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from memory_fixture import *
+from persona.memory_structures.node_columns import datetime_to_seconds
+
+
+class RetrievalCacheTest(unittest.TestCase):
+  def setUp(self):
+    self.folder = tempfile.mkdtemp()
+    self.patches = [mock.patch.object(retrieve_module, name, fake_embedding)
+                    for name in ["get_embedding", "get_embedding_deferred"]]
+    self.patches += [mock.patch.object(retrieve_module, "debug", False)]
+    for patch in self.patches:
+      patch.start()
+
+  def tearDown(self):
+    for patch in self.patches:
+      patch.stop()
+    shutil.rmtree(self.folder)
+
+  def run_steps(self, cache_enabled):
+    start = datetime.datetime(2023, 2, 13, 10)
+    a_mem = make_memory(f"{self.folder}/{cache_enabled}")
+    fill_memory(a_mem)
+    persona = FakePersona(a_mem, start)
+    results = []
+    with mock.patch.object(retrieve_module, "retrieval_cache_enabled",
+                           cache_enabled):
+      for step in range(8):
+        persona.scratch.curr_time = start + datetime.timedelta(seconds=step)
+        for focal_points in [["Klaus Mueller"], ["Klaus Mueller", "coffee"],
+                             ["coffee", "Klaus Mueller"]]:
+          results += [node_ids(retrieve_module.new_retrieve(
+                                 persona, focal_points, 10))]
+        if step == 3:
+          add_node(a_mem, "event", persona.scratch.curr_time,
+                   "Isabella sees Klaus Mueller at the cafe", poignancy=5,
+                   keywords=["Klaus Mueller"])
+        if step == 5:
+          # Touches the oldest nodes, as another retrieval would.
+          retrieve_module.touch_retrieved(
+            a_mem, a_mem.recency_index.nodes()[:10],
+            datetime_to_seconds(persona.scratch.curr_time))
+    return results, a_mem.retrieval_cache.stats()
+
+  def test_cached_results_match_uncached(self):
+    uncached, _ = self.run_steps(False)
+    cached, stats = self.run_steps(True)
+    self.assertEqual(cached, uncached)
+    # Every focal point misses once per memory version (two versions).
+    self.assertEqual(stats["misses"], 4)
+    self.assertEqual(stats["hits"], 8 * 5 - 4)
+
+
+if __name__ == '__main__':
+  unittest.main()